@@ -18,15 +18,17 @@ from ashiema import Events, Logger, util
 from ashiema.Connection import Connection
 from ashiema.EventHandler import EventHandler
 from ashiema.PluginLoader import PluginLoader
+from ashiema.Replay import Replay
+from ashiema.Structures import UserRegistry
 from ashiema.util import Configuration, fork
 from ashiema.util.Configuration import Configuration, ConfigurationSection
 
-def ashiema_main(configuration):
+def ashiema_setup(configuration, stream = True):
     connection = Connection()
     
     config = configuration.get_section('main')
     
-    Logger.setup_logger(stream = not config.get_bool('fork'),
+    Logger.setup_logger(stream = stream and not config.get_bool('fork'),
                         path = "logs/ashiema-%s.log" % (config.get_string('netname', default = 'nonetname')))
     
     log_level = Configuration.get_instance().get_section('logging').get_string('level', 'debug')
@@ -43,7 +45,47 @@ def ashiema_main(configuration):
         ident    = config.get_string('ident', 'ashiema'),
         real     = config.get_string('real', 'ashiema IRC bot -- http://github.com/pirogoeth/ashiema'))
 
-    if config.get_bool('fork', False):
+    connection.set_flood_control(
+        burst      = config.get_int('flood-burst', 10),
+        rate       = config.get_float('flood-rate', 2.0),
+        query_rate = config.get_float('query-rate', 1.0))
+
+    connection.set_backlog(
+        max_backlog = config.get_int('max-backlog', 50),
+        overflow    = config.get_string('backlog-overflow', 'summarize'))
+
+    connection.set_reconnect(
+        enabled   = config.get_bool('reconnect-on-err', True),
+        delay     = config.get_float('reconnect-delay', 5.0),
+        max_delay = config.get_float('reconnect-max-delay', 300.0))
+
+    connection.set_lag_check(
+        interval = config.get_float('lag-interval', 30.0),
+        timeout  = config.get_float('lag-timeout', 90.0))
+
+    connection.set_workers(
+        workers  = config.get_int('workers', 4),
+        timeout  = config.get_float('worker-timeout', 30.0))
+
+    UserRegistry.get_instance().set_limit(config.get_int('max-pm-users', 500))
+
+    connection.set_watchdog(config.get_int('stall-threshold', 1000))
+
+    EventHandler.get_instance().set_slow_threshold(config.get_float('slow-callback', 0.5))
+
+    return connection, config
+
+def ashiema_main(configuration):
+    connection, config = ashiema_setup(configuration)
+
+    capture = config.get_string('capture', None)
+    if capture:
+        connection.set_capture(capture)
+
+    # set if this process was started by the restart command.
+    resume = Connection.get_resume_state()
+
+    if config.get_bool('fork', False) and resume is None:
         fork()
 
     try:
@@ -57,15 +99,40 @@ def ashiema_main(configuration):
             inettype = inettype,
             port     = config.get_int('port', 6667),
             _ssl     = config.get_bool('ssl', False),
-            password = config.get_string('password', None)
+            password = config.get_string('password', None),
+            resume   = resume
         )
         EventHandler.get_instance()
         Events.get_events()
         PluginLoader.get_instance()
+        if resume is not None:
+            # there is no MOTD to wait for; the onconnect hooks have run already.
+            Events.CAPEvent.capabilities.extend(resume['capabilities'])
+            if 'pluginload' in config.get_string('onconnect', '').split(','):
+                PluginLoader.get_instance().load()
         connection.run()
     except (SystemExit, KeyboardInterrupt):
         PluginLoader.get_instance().unload()
 
+def ashiema_replay(configuration, path):
+    """ feeds a capture through the bot with its plugins loaded, as fast as possible, and
+        prints how long it took. nothing is sent anywhere; log output only goes to the log file. """
+
+    connection, config = ashiema_setup(configuration, stream = False)
+
+    EventHandler.get_instance()
+    Events.get_events()
+    replay = Replay(path).install()
+    PluginLoader.get_instance().load()
+    replay.disarm()
+    try:
+        report = replay.run()
+    finally:
+        PluginLoader.get_instance().unload()
+        connection.get_executor().shutdown()
+
+    print '\n'.join(report)
+
 if __name__ == '__main__':
 
     try: filename = sys.argv[1]
@@ -78,6 +145,10 @@ if __name__ == '__main__':
         print >> sys.__stderr__, "Invalid configuration: %s!" % (filename)
         traceback.print_exc(4)
 
+    if len(sys.argv) > 3 and sys.argv[2] == '--replay':
+        ashiema_replay(configuration, sys.argv[3])
+        sys.exit(0)
+
     try: ashiema_main(configuration)
     except: raise
 
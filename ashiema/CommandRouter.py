@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import logging
+from EventHandler import EventHandler
+from HelpFactory import HelpFactory, Contexts, CONTEXT, ALIASES
+
+""" module:: CommandRouter
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Contains the CommandRouter class, which maps command words to plugin handlers. """
+
+class CommandRouter(object):
+    """ py:class:: CommandRouter()
+
+        Keeps a table of command words (`@wa`, `login`, ...) for channel messages and one for
+        private messages. MessageEvent and PMEvent hand every PRIVMSG to dispatch(), which looks
+        the first word of the message up once instead of every plugin comparing it against each
+        of its commands.
+
+        The context and aliases of a command are taken from the `__help__` block of the plugin
+        that registers it, so a command is routed exactly the way its help entry describes. """
+
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        """ py:staticmethod:: get_instance()
+
+            :returns: The CommandRouter instance, if it exists, or a new CommandRouter instance.
+            :rtype: CommandRouter """
+
+        if CommandRouter.__instance is None:
+            return CommandRouter()
+        else:
+            return CommandRouter.__instance
+
+    def __init__(self):
+
+        CommandRouter.__instance = self
+
+        self.log = logging.getLogger('ashiema')
+
+        self.__routes = {
+            Contexts.PUBLIC     : {},
+            Contexts.PRIVATE    : {}
+        }
+        # command -> list of (context, word) pairs it was routed under.
+        self.__registered = {}
+
+    def __repr__(self):
+
+        return "<CommandRouter(%d public, %d private)>" % (
+            len(self.__routes[Contexts.PUBLIC]), len(self.__routes[Contexts.PRIVATE]))
+
+    def __contexts(self, context):
+
+        if context == Contexts.BOTH:
+            return [Contexts.PUBLIC, Contexts.PRIVATE]
+        return [context]
+
+    def register(self, command, callback, context = None):
+        """ py:function:: register(self, command, callback[, context = None])
+
+            Routes +command+, and every alias listed for it in the help registry, to +callback+.
+            The callback is called with the event data, just like an event callback, and is run
+            on the worker pool if it was marked with @offload.
+
+            :param command: The command word, as it appears in the plugin's `__help__`.
+            :type command: str
+            :param callback: Function to call when the command is used.
+            :type callback: function
+            :param context: One of Contexts.PUBLIC, PRIVATE or BOTH; defaults to the context in
+                            the help entry, or PUBLIC if the command has no help entry.
+            :type context: str """
+
+        if command in self.__registered:
+            self.deregister(command)
+
+        entry = HelpFactory.get_instance().get_entry(command) or {}
+        if context is None:
+            context = entry.get(CONTEXT, Contexts.PUBLIC)
+
+        words = [command] + list(entry.get(ALIASES, []))
+        routed = []
+        callback = EventHandler.get_instance().wrap_callback(callback, command)
+
+        for route in self.__contexts(context):
+            table = self.__routes[route]
+            for word in words:
+                if word in table:
+                    self.log.warning("Command [%s] (%s) is already routed; replacing it for [%s]." % (word, route, command))
+                table[word] = callback
+                routed.append((route, word))
+
+        self.__registered[command] = routed
+
+    def deregister(self, command):
+        """ py:function:: deregister(self, command)
+
+            Removes +command+ and its aliases from the routing tables.
+
+            :param command: The command word that was passed to register().
+            :type command: str """
+
+        for route, word in self.__registered.pop(command, []):
+            self.__routes[route].pop(word, None)
+
+    def get_callback(self, command, context):
+        """ py:function:: get_callback(self, command, context)
+
+            :returns: The callback routed to +command+ in +context+, or None.
+            :rtype: function """
+
+        return self.__routes[context].get(command)
+
+    def is_command(self, data, context = None):
+        """ py:function:: is_command(self, data[, context = None])
+
+            :returns: Whether or not the message in +data+ starts with a routed command.
+            :rtype: bool """
+
+        command = data.message.command
+        if command is None:
+            return False
+
+        contexts = self.__contexts(context) if context is not None else self.__routes.keys()
+
+        return any(command in self.__routes[route] for route in contexts)
+
+    def dispatch(self, data, context):
+        """ py:function:: dispatch(self, data, context)
+
+            Calls the callback routed to the first word of the message in +data+, if any.
+
+            :param data: Event data for a PRIVMSG.
+            :type data: Tokener
+            :param context: Contexts.PUBLIC for channel messages, Contexts.PRIVATE for queries.
+            :type context: str
+            :returns: Whether or not a command was dispatched.
+            :rtype: bool """
+
+        command = data.message.command
+        if command is None:
+            return False
+
+        callback = self.__routes[context].get(command)
+        if callback is None:
+            return False
+
+        callback(data)
+
+        return True
@@ -6,16 +6,69 @@
 # An extended version of the license is included with this software in `ashiema.py`.
 
 import socket, select, ssl, logging, time, signal, sys, collections, multiprocessing, re, logging, traceback, inspect
-import Logger, EventHandler, Scheduler, Structures, PluginLoader
+import os, errno, fcntl, threading, random, json
+from datetime import timedelta
+import Logger, EventHandler, EventLoop, Executor, LagMeter, LineBuffer, Metrics, Scheduler, SendQueue, ServerSupport, Structures, PluginLoader, Watchdog
 from PluginLoader import PluginLoader
+from EventLoop import EventLoop
+from Executor import Executor
+from LagMeter import LagMeter
+from LineBuffer import LineBuffer
+from Metrics import Metrics
 from Scheduler import Scheduler
-from util import get_caller, Configuration
+from SendQueue import SendQueue, FairLane, Priority
+from ServerSupport import ServerSupport
+from Watchdog import Watchdog
+from util import get_caller, lazy_property, monotonic, Configuration
 from util.Configuration import Configuration
 
 """ module:: Connection
     :platform: Unix, Windows, Mac OS X
     :synopsis: Contains Connection and Tokener (line tokenizing) classes. """
 
+def tokenize(line):
+    """ py:function:: tokenize(line)
+
+        Splits a raw IRC line into its origin, type, target and message parts without building
+        any structures. IRCv3 message tags are skipped. The target is the first parameter when it
+        is followed by further parameters; otherwise it is part of the message.
+
+        :param line: Raw line, without its line ending.
+        :type line: str
+        :returns: (origin, type, target, message) strings, or None if the line is malformed.
+        :rtype: tuple """
+
+    if line[:1] == '@':
+        space = line.find(' ')
+        if space == -1:
+            return None
+        line = line[space + 1:]
+
+    origin = None
+    if line[:1] == ':':
+        space = line.find(' ')
+        if space < 2:
+            return None
+        origin, line = line[1:space], line[space + 1:]
+
+    space = line.find(' ')
+    if space < 1:
+        return None
+    type, rest = line[:space], line[space + 1:]
+    if not type.isalnum():
+        return None
+
+    target = None
+    if rest[:1] != ':':
+        space = rest.find(' ')
+        if space > 0 and rest.find(':', 0, space) == -1:
+            target, rest = rest[:space], rest[space + 1:]
+
+    if rest[:1] == ':':
+        rest = rest[1:]
+
+    return origin, type, target, rest
+
 class Connection(object):
     """ py:class:: Connection()
 
@@ -23,6 +76,13 @@ class Connection(object):
 
     __instance = None
 
+    # how often the blank keepalive is sent while waiting for the server to greet us.
+    REGISTER_INTERVAL = 1.0
+    # how long connecting to the server may take.
+    CONNECT_TIMEOUT = 30.0
+    # environment variable that carries the connection state to the new process on restart.
+    RESUME_VARIABLE = 'ASHIEMA_RESUME'
+
     @staticmethod
     def get_instance():
         """ py:staticmethod:: get_instance()
@@ -38,17 +98,48 @@ class Connection(object):
     def __init__(self):
         """ py:function:: __init__(self)
         
-            Sets up the socket, send queue, communications pipe, and scheduler. """
+            Sets up the socket, send queue, communications pipe, event loop, scheduler and
+            worker pool. """
 
         Connection.__instance = self
     
         self._socket = None
         self._setupdone, self._connected, self._registered, self._passrequired, self.debug = (False, False, False, False, False)
+        self._running = False
+        self._socket, self.connection, self._server = None, None, None
+        self._reconnect, self._reconnect_delay, self._reconnect_max_delay = True, 5.0, 300.0
+        self._reconnect_attempts, self._reconnect_job = 0, None
+        # channels to join again once the bot has registered after a reconnect.
+        self._rejoin = []
+        self._restarting = False
+        self._capture = None
         self.log = logging.getLogger('ashiema')
-        self._queue = collections.deque()
-        self._pqueue, self.__pq_reasm = collections.deque(), None
+        self._queue = SendQueue()
+        self._inbuf = LineBuffer()
         self._comm_pipe_recv, self._comm_pipe_send = multiprocessing.Pipe(False)
         self._scheduler = Scheduler()
+        self._support = ServerSupport()
+        self._lag = LagMeter()
+        self._watchdog = Watchdog()
+        self._loop = EventLoop()
+        self._loop_thread = threading.current_thread()
+        self._calls = collections.deque()
+        self._wakeup_recv, self._wakeup_send = os.pipe()
+        for fd in (self._wakeup_recv, self._wakeup_send):
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        self._executor = Executor(self.call_from_thread)
+
+        metrics = Metrics.get_instance()
+        self._lines_received = metrics.counter('ashiema_lines_received_total', 'Lines received from the server.')
+        self._bytes_received = metrics.counter('ashiema_bytes_received_total', 'Bytes received from the server.')
+        self._lines_sent = metrics.counter('ashiema_lines_sent_total', 'Lines written to the server.')
+        self._bytes_sent = metrics.counter('ashiema_bytes_sent_total', 'Bytes written to the server.')
+        self._reconnects = metrics.counter('ashiema_reconnects_total', 'Times the connection to the server was lost and scheduled again.')
+        metrics.gauge('ashiema_connected', 'Whether the bot is connected to the server.').set_function(lambda: int(self._connected))
+        metrics.gauge('ashiema_send_queue_depth', 'Lines waiting in the send queue.').set_function(lambda: len(self._queue))
+        metrics.gauge('ashiema_lag_seconds', 'Round trip of the last PING to the server.').set_function(lambda: self._lag.get_lag())
+        metrics.gauge('ashiema_workers_busy', 'Offloaded callbacks that are running.').set_function(lambda: self._executor.get_stats()['running'])
+        metrics.gauge('ashiema_loop_stalls', 'Times the main loop was busy for longer than stall-threshold.').set_function(lambda: self._watchdog.stalls)
    
     def setup_info(self, nick = '', ident = '', real = ''):
         """ py:function:: setup_info(self[, nick = ''[, ident = ''[, real = '']]])
@@ -84,6 +175,162 @@ class Connection(object):
         self.debug = debug
         
         return self
+
+    def set_flood_control(self, burst = 10, rate = 2.0, query_rate = 1.0):
+        """ py:function:: set_flood_control(self[, burst = 10[, rate = 2.0[, query_rate = 1.0]]])
+
+            Configures the token bucket that paces lines leaving the send queue.
+
+            :param burst: Number of lines that may be sent back to back.
+            :type burst: int
+            :param rate: Number of lines per second the budget refills by.
+            :type rate: float
+            :param query_rate: Number of background lookups (WHO, WHOIS) per second.
+            :type query_rate: float
+            :returns: current Connection instance for chaining.
+            :rtype: Connection """
+
+        self._queue.set_limits(burst, rate)
+        self._queue.set_query_rate(query_rate)
+
+        return self
+
+    def set_backlog(self, max_backlog = 50, overflow = 'summarize'):
+        """ py:function:: set_backlog(self[, max_backlog = 50[, overflow = 'summarize']])
+
+            Configures how many lines a single channel or user may have waiting in the send
+            queue before the oldest of them are dropped.
+
+            :param max_backlog: Number of lines a target may have waiting.
+            :type max_backlog: int
+            :param overflow: 'summarize' to tell the target how many lines were dropped, or
+                             'drop-oldest' to drop them silently.
+            :type overflow: str
+            :returns: current Connection instance for chaining.
+            :rtype: Connection """
+
+        if overflow not in FairLane.OVERFLOW:
+            self.log.warning("Unknown backlog-overflow '%s' (should be one of %s); using 'summarize'." % (
+                overflow, ', '.join(FairLane.OVERFLOW)))
+            overflow = 'summarize'
+        self._queue.set_backlog(max_backlog, overflow)
+
+        return self
+
+    def set_reconnect(self, enabled = True, delay = 5.0, max_delay = 300.0):
+        """ py:function:: set_reconnect(self[, enabled = True[, delay = 5.0[, max_delay = 300.0]]])
+
+            Configures what happens when the connection to the server is lost.
+
+            :param enabled: Whether to connect again, rather than shut down.
+            :type enabled: bool
+            :param delay: Seconds to wait before the first attempt; doubled after every failed one.
+            :type delay: float
+            :param max_delay: Longest wait between two attempts, in seconds.
+            :type max_delay: float
+            :returns: current Connection instance for chaining.
+            :rtype: Connection """
+
+        self._reconnect, self._reconnect_delay, self._reconnect_max_delay = enabled, delay, max(delay, max_delay)
+
+        return self
+
+    def set_lag_check(self, interval = 30.0, timeout = 90.0):
+        """ py:function:: set_lag_check(self[, interval = 30.0[, timeout = 90.0]])
+
+            Configures the PINGs the bot sends on its own to measure lag and notice a dead
+            connection.
+
+            :param interval: Seconds between two PINGs; 0 turns them off.
+            :type interval: float
+            :param timeout: Seconds a PING may go unanswered before the connection is dropped.
+            :type timeout: float
+            :returns: current Connection instance for chaining.
+            :rtype: Connection """
+
+        self._lag.configure(interval, timeout)
+
+        job = self._scheduler.get_job("lag check")
+        if job is not None:
+            self._scheduler.remove_job(job)
+        if interval > 0:
+            self._scheduler.create_job("lag check", self.__check_lag, timedelta(seconds = interval), recurring = True)
+
+        return self
+
+    def set_watchdog(self, threshold = 1000):
+        """ py:function:: set_watchdog(self[, threshold = 1000])
+
+            Configures the watchdog that logs the main thread's stack when the loop has been busy
+            with the same batch of lines (or the same plugin callback) for too long.
+
+            :param threshold: Milliseconds the loop may be busy for; 0 turns the watchdog off.
+            :type threshold: int
+            :returns: current Connection instance for chaining.
+            :rtype: Connection """
+
+        self._watchdog.configure(threshold)
+
+        return self
+
+    def get_watchdog(self):
+        """ py:function:: get_watchdog(self)
+
+            :returns: The watchdog of the main loop.
+            :rtype: Watchdog """
+
+        return self._watchdog
+
+    def set_capture(self, path = None):
+        """ py:function:: set_capture(self[, path = None])
+
+            Appends every line received from the server to +path+, one per line, preceded by
+            the time it arrived at and a space. The file can be fed back through the bot with
+            `ashiema.py <config> --replay <file>`. The text of private messages to the bot is
+            blanked out, since it holds passwords (`login`, `register`) and admin commands.
+
+            :param path: File to write to, or None to stop capturing.
+            :type path: str
+            :returns: current Connection instance for chaining.
+            :rtype: Connection """
+
+        if self._capture is not None:
+            self._capture.close()
+        self._capture = open(path, 'a') if path else None
+
+        return self
+
+    def set_workers(self, workers = 4, timeout = 30.0):
+        """ py:function:: set_workers(self[, workers = 4[, timeout = 30.0]])
+
+            Configures the worker pool that runs offloaded plugin callbacks.
+
+            :param workers: Number of worker threads.
+            :type workers: int
+            :param timeout: Number of seconds an offloaded callback may run before it is abandoned.
+            :type timeout: float
+            :returns: current Connection instance for chaining.
+            :rtype: Connection """
+
+        self._executor.configure(workers, timeout)
+
+        return self
+
+    def call_from_thread(self, function, *args):
+        """ py:function:: call_from_thread(self, function, *args)
+
+            Runs function(*args) on the main loop. Safe to call from any thread; the loop is
+            woken up through a pipe, and calls run in the order they were made.
+
+            :param function: Function to call.
+            :type function: function """
+
+        self._calls.append((function, args))
+        try: os.write(self._wakeup_send, '\0')
+        except OSError as e:
+            # a full pipe will wake the loop up all the same.
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
     
     def shutdown(self):
         """ py:function:: shutdown(self)
@@ -92,14 +339,18 @@ class Connection(object):
         
         # unload plugins
         PluginLoader.get_instance().unload()
-        # change the value that controls the connection loop
-        self._connected = False
+        # change the values that control the connection loop
+        self._connected, self._running = False, False
+        if self._reconnect_job is not None:
+            self._scheduler.remove_job(self._reconnect_job)
+            self._reconnect_job = None
         
-    def connect(self, address = '', inettype = 4, port = '', _ssl = None, password = None):
-        """ py:function:: connect(self[, address = ''[, port = ''[, _ssl = None[, password = None]]]])
+    def connect(self, address = '', inettype = 4, port = '', _ssl = None, password = None, resume = None):
+        """ py:function:: connect(self[, address = ''[, port = ''[, _ssl = None[, password = None[, resume = None]]]]])
 
             Checks if the connection socket should be ssl wrapped and wraps it if so, and connects
-            the socket to the target server.
+            the socket to the target server. The server details are kept for reconnecting.
+            If +resume+ is given, the socket handed over by restart() is used instead.
             
             :param address: Address of the server to connect to.
             :type address: str
@@ -111,14 +362,33 @@ class Connection(object):
             :type _ssl: bool
             :param password: Password to use to connect to the server, if any.
             :type password: str
+            :param resume: State returned by get_resume_state().
+            :type resume: dict
             :returns: current Connection instance for chaining.
             :rtype: Connection """
-            
-        if inettype == 4:
-            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        elif inettype == 6:
-            self._socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
+
+        if inettype == 6:
             address = address[1:-1]
+        self._server = (address, inettype, port, _ssl)
+        if password:
+            self._passrequired, self._password = (True, password)
+
+        if resume is not None:
+            self.__resume(resume)
+        else:
+            self.__open()
+        
+        return self
+
+    def __open(self):
+        """ py:function:: __open(self)
+
+            Opens a new socket to the server given to connect(). """
+
+        address, inettype, port, _ssl = self._server
+
+        if inettype == 6:
+            self._socket = socket.socket(socket.AF_INET6, socket.SOCK_STREAM)
         else:
             self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
@@ -131,15 +401,276 @@ class Connection(object):
         else:
             self.connection = self._socket
             self.log.warning("Connection type not specified, assuming plain.")
-        if password is not None or password is not '':
-            self._passrequired, self._password = (True, password)
 
+        self._socket.settimeout(Connection.CONNECT_TIMEOUT)
         try: self.connection.connect((address, int(port)))
-        except: raise
+        except:
+            self.__close()
+            raise
+        self._socket.settimeout(None)
         self._connected = True
-        
-        return self
+
+    def __close(self):
+        """ py:function:: __close(self)
+
+            Closes the socket to the server, if there is one. """
+
+        if self.connection is not None and self._loop.is_registered(self.connection):
+            self._loop.unregister(self.connection)
+        for sock in (self.connection, self._socket):
+            if sock is None:
+                continue
+            try: sock.close()
+            except (socket.error, IOError): pass
+        self._socket, self.connection = None, None
+
+    def reconnect(self, reason = None):
+        """ py:function:: reconnect(self[, reason = None])
+
+            Drops the connection to the server and schedules a new one, after a delay that
+            doubles with every failed attempt (up to the configured maximum) and is randomized
+            so that many bots do not come back at once. Plugins, scheduled jobs, the worker pool
+            and everything plugins keep in memory stay as they are; the channels the bot was in
+            are joined again once it has registered. Shuts down instead if reconnecting is
+            disabled.
+
+            :param reason: Why the connection is being dropped, for the log.
+            :type reason: str """
+
+        if not self._running:
+            return
+        if not self._reconnect:
+            self.log.critical("Lost the connection to the server (%s); shutting down." % (reason))
+            self.shutdown()
+            return
+
+        if self._connected:
+            self.log.warning("Lost the connection to the server (%s)." % (reason))
+            self.__disconnect()
+
+        if self._reconnect_job is not None:
+            return
+
+        self._reconnects.inc()
+        delay = min(self._reconnect_max_delay, self._reconnect_delay * (2 ** self._reconnect_attempts))
+        delay = random.uniform(delay / 2.0, delay)
+        self._reconnect_attempts += 1
+
+        self.log.info("======== Reconnecting in %.1f seconds (attempt %d). ========" % (delay, self._reconnect_attempts))
+        self._reconnect_job = self._scheduler.create_job("reconnect #%d" % (self._reconnect_attempts),
+            self.__attempt_reconnect, timedelta(seconds = delay))
+
+    def __disconnect(self):
+        """ py:function:: __disconnect(self)
+
+            Closes the socket and forgets everything that only holds for this session with the
+            server: the registration, anything still queued or half received, what the server
+            advertised, and who is in which channel. """
+
+        channels = [channel.name for channel in Structures.Channel.get_channels()]
+        if channels:
+            self._rejoin = channels
+
+        self.__close()
+        self._connected, self._registered = False, False
+        self._queue.clear()
+        self._inbuf.clear()
+        self._support.clear()
+        self._lag.clear()
+        for channel in channels:
+            Structures.Channel.untrack(channel)
+        Structures.UserRegistry.get_instance().clear()
+
+    def __attempt_reconnect(self):
+
+        self._reconnect_job = None
+        address, inettype, port, _ssl = self._server
+
+        try: self.__open()
+        except (socket.error, ssl.SSLError, IOError) as e:
+            self.log.warning("Could not connect to %s:%s: %s" % (address, port, e))
+            self.reconnect("connecting failed")
+            return
+
+        self._loop.register(self.connection, self.__on_socket_ready)
+        self.log.info("Connected to %s:%s again." % (address, port))
+
+    def __check_lag(self):
+        """ py:function:: __check_lag(self)
+
+            Drops the connection if the last PING went unanswered for too long, and sends the
+            next one. """
+
+        if not self._connected or not self._registered:
+            return
+
+        if self._lag.is_dead():
+            self.reconnect("no PONG for %.1f seconds" % (self._lag.get_waiting()))
+            return
+
+        self.send("PING :%s" % (self._lag.probe()))
+
+    def get_lag(self):
+        """ py:function:: get_lag(self)
+
+            Returns how long the server currently takes to answer, as measured by the bot's own
+            PINGs. Unlike the time lines spend in the send queue, this does not include time
+            spent in plugins.
+
+            :returns: Lag in seconds, or None if it has not been measured yet.
+            :rtype: float """
+
+        return self._lag.get_lag()
+
+    def get_lag_meter(self):
+        """ py:function:: get_lag_meter(self)
+
+            :returns: The meter that times PING round trips.
+            :rtype: LagMeter """
+
+        return self._lag
+
+    def reset_backoff(self):
+        """ py:function:: reset_backoff(self)
+
+            Called once the server has accepted the bot, so the next reconnect starts over with
+            the shortest delay. """
+
+        self._reconnect_attempts = 0
+
+    def get_rejoin_channels(self):
+        """ py:function:: get_rejoin_channels(self)
+
+            Returns the channels the bot was in before it reconnected, once; they should be
+            joined again after registering.
+
+            :returns: Channel names.
+            :rtype: list of str """
+
+        channels, self._rejoin = self._rejoin, []
+
+        return channels
     
+    def restart(self):
+        """ py:function:: restart(self)
+
+            Replaces the running bot with a fresh copy of itself, ie. to start a new version,
+            without the server noticing. Once the line that is being processed is done with,
+            plugins are unloaded and the process executes itself again; the new process inherits
+            the server socket and gets the nick, the channels, the acknowledged capabilities,
+            what the server advertised, the unsent lines and any half received line through the
+            environment, and carries on where this one stopped.
+
+            The socket of an SSL connection can not be handed over, since the TLS session lives
+            in this process.
+
+            :raises RestartException: If the connection can not be handed over. """
+
+        if not self._connected or not self._registered:
+            raise RestartException("Not registered with a server.")
+        if isinstance(self.connection, ssl.SSLSocket):
+            raise RestartException("SSL connections can not be handed over.")
+
+        self._restarting = True
+
+    def __restart(self):
+        """ py:function:: __restart(self)
+
+            Executes the bot again with the server socket left open. Does not return. """
+
+        fd = self._socket.fileno()
+        state = {
+            'fd'            : fd,
+            'nick'          : self.nick,
+            'registered'    : self._registered,
+            'channels'      : [channel.name for channel in Structures.Channel.get_channels()],
+            'capabilities'  : list(EventHandler.EventHandler.get_instance().get_events()['CAPEvent'].capabilities),
+            'support'       : self._support.get_tokens(),
+            'queue'         : self._queue.take_all(),
+            'buffer'        : self._inbuf.get_pending()
+        }
+        # str values are raw bytes; latin-1 maps every byte to a character and back.
+        os.environ[Connection.RESUME_VARIABLE] = json.dumps(state, encoding = 'latin-1')
+
+        self.log.info("======== Restarting, handing over the connection. ========")
+        self.set_capture(None)
+        PluginLoader.get_instance().unload()
+        self._executor.shutdown()
+        logging.shutdown()
+
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) & ~fcntl.FD_CLOEXEC)
+        # nothing but the server socket is handed over; plugin sockets and pipes are closed.
+        os.closerange(3, fd)
+        os.closerange(fd + 1, os.sysconf('SC_OPEN_MAX'))
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    @staticmethod
+    def get_resume_state():
+        """ py:staticmethod:: get_resume_state()
+
+            Takes the state that restart() left for this process out of the environment.
+
+            :returns: The state to pass to connect(), or None if the bot was started normally.
+            :rtype: dict """
+
+        state = os.environ.pop(Connection.RESUME_VARIABLE, None)
+        if state is None:
+            return None
+
+        def to_str(value):
+            if isinstance(value, unicode):
+                return value.encode('latin-1')
+            if isinstance(value, list):
+                return [to_str(item) for item in value]
+            if isinstance(value, dict):
+                return dict((to_str(key), to_str(item)) for key, item in value.iteritems())
+            return value
+
+        return to_str(json.loads(state))
+
+    def __resume(self, state):
+        """ py:function:: __resume(self, state)
+
+            Takes over the server socket and the session state from the process that restarted. """
+
+        family = socket.AF_INET6 if self._server[1] == 6 else socket.AF_INET
+        # fromfd() duplicates the descriptor.
+        self.attach(socket.fromfd(state['fd'], family, socket.SOCK_STREAM), state['registered'])
+        os.close(state['fd'])
+
+        self.nick = state['nick']
+        self._inbuf.feed(state['buffer'])
+        self._support.update(state['support'])
+        for line, priority, paced in state['queue']:
+            if paced:
+                self._queue.push_query(line)
+            else:
+                self._queue.push(line, priority)
+        # the member tables are filled in again from NAMES and WHO.
+        for name in state['channels']:
+            Structures.Channel.track(name)
+        self.send_query(*self._support.pack_targets('NAMES', state['channels']))
+
+        self.log.info("Resumed the connection as %s, in %d channel(s)." % (self.nick, len(state['channels'])))
+
+    def attach(self, sock, registered = True):
+        """ py:function:: attach(self, sock[, registered = True])
+
+            Uses +sock+, which is already connected, instead of connecting to a server; ie. a
+            stand-in that only counts what is sent when replaying a capture.
+
+            :param sock: Connected socket, or anything with sendall() and close().
+            :type sock: socket
+            :param registered: Whether registration has been sent on +sock+ already.
+            :type registered: bool
+            :returns: current Connection instance for chaining.
+            :rtype: Connection """
+
+        self._socket, self.connection = sock, sock
+        self._connected, self._registered = True, registered
+
+        return self
+
     def send_registration(self):
         """ py:function:: send_registration(self)
 
@@ -158,7 +689,6 @@ class Connection(object):
         if not self._registered:  # we probably don't need this any longer...
             if self._passrequired: 
                 self.send("PASS :%s" % (self._password))
-                self._password = None
             self.send("NICK %s" % (self.nick))
             self.send("CAP LS")
             self.send("USER %s %s * :%s" % (self.nick, self.ident, self.real))
@@ -166,20 +696,57 @@ class Connection(object):
             user.update_gecos(self.real)
             self._registered = True
     
-    def send(self, *lines):
-        """ py:function:: send(self, *lines)
+    def send(self, *lines, **kwargs):
+        """ py:function:: send(self, *lines[, priority = None])
             
-            Encodes given data in UTF-8 format, then adds it to the send queue.
+            Encodes given data in UTF-8 format, then adds it to the send queue. Lines sent
+            from a worker thread are handed to the main loop first.
             
             :param lines: Lines that should be appended to the send queue.
-            :type lines: list of strings """
+            :type lines: list of strings
+            :param priority: Lane of the send queue to use (a SendQueue.Priority); by default
+                             it is picked from the command of each line.
+            :type priority: int """
         
         if not self._connected: return
 
+        if threading.current_thread() is not self._loop_thread:
+            job = self._executor.current_job()
+            if job is not None and job.expired:
+                self.log.debug("Dropping %d line(s) from abandoned %r." % (len(lines), job))
+                return
+            self.call_from_thread(self.__queue_lines, lines, kwargs.get('priority'), False)
+            return
+
+        self.__queue_lines(lines, kwargs.get('priority'), False)
+
+    def send_query(self, *lines):
+        """ py:function:: send_query(self, *lines)
+
+            Queues lookups (WHO, WHOIS) that the bot makes on its own in the bulk lane of the
+            send queue, where they are paced separately and only sent when nothing more urgent
+            is waiting. A lookup that is already queued is not queued again.
+
+            :param lines: Lookups that should be appended to the send queue.
+            :type lines: list of strings """
+
+        if not self._connected: return
+
+        if threading.current_thread() is not self._loop_thread:
+            self.call_from_thread(self.__queue_lines, lines, None, True)
+            return
+
+        self.__queue_lines(lines, None, True)
+
+    def __queue_lines(self, lines, priority, query):
+
         for line in lines:
             try: line = line.encode("utf-8", "ignore")
             except: pass
-            self._queue.append(line + '\r\n')
+            if query:
+                self._queue.push_query(line + '\r\n')
+            else:
+                self._queue.push(line + '\r\n', priority)
     
     def _raw_send(self, data, override = False):
         """ py:function:: _raw_send(self, data)
@@ -197,7 +764,9 @@ class Connection(object):
         if not data.endswith('\r\n'):
             data = data + '\r\n'
 
-        self.connection.send(data)
+        self.connection.sendall(data)
+        self._lines_sent.inc()
+        self._bytes_sent.inc(len(data))
     
     def get_scheduler(self):
         """ py:function:: get_scheduler(self)
@@ -208,6 +777,48 @@ class Connection(object):
             :rtype: Scheduler """
         
         return self._scheduler
+
+    def get_support(self):
+        """ py:function:: get_support(self)
+
+            Returns what the server advertised about itself in RPL_ISUPPORT (005): its
+            casemapping, channel types, line length, target limits and so on.
+
+            :returns: Current server support table.
+            :rtype: ServerSupport """
+
+        return self._support
+
+    def get_send_queue(self):
+        """ py:function:: get_send_queue(self)
+
+            Returns the outbound send queue, which also carries queue depth and time-in-queue figures.
+
+            :returns: Current send queue.
+            :rtype: SendQueue """
+
+        return self._queue
+
+    def get_event_loop(self):
+        """ py:function:: get_event_loop(self)
+
+            Returns the event loop that drives the connection. Plugins may register their own
+            descriptors with it to be woken up when those become readable.
+
+            :returns: Current event loop instance.
+            :rtype: EventLoop """
+
+        return self._loop
+
+    def get_executor(self):
+        """ py:function:: get_executor(self)
+
+            Returns the worker pool that runs offloaded plugin callbacks.
+
+            :returns: Current executor instance.
+            :rtype: Executor """
+
+        return self._executor
     
     def get_send_pipe(self):
         """ py:function:: get_send_pipe(self)
@@ -227,83 +838,204 @@ class Connection(object):
             
             Runs the parsing/event loop.
             
-            Handles the first message off the top of the send queue and handles what ever data is waiting
-            in the subprocess pipe. """
+            Blocks in the event loop until the server socket, the subprocess pipe, the worker
+            wakeup pipe or a plugin descriptor is ready, or until the next scheduled job, flood control budget or
+            registration keepalive is due. """
         
         if not self._connected: return
-        
-        while self._connected is True:
+
+        self._loop.register(self.connection, self.__on_socket_ready)
+        self._loop.register(self._comm_pipe_recv, self.__on_comm_pipe_ready)
+        self._loop.register(self._wakeup_recv, self.__on_wakeup)
+        self._loop_thread = threading.current_thread()
+        self._running = True
+        self._watchdog.start()
+
+        while self._running is True:
+            if self._restarting:
+                self.__restart()
             try:
-                time.sleep(0.001)
-                r, w, e = select.select([self.connection], [], [self.connection], .025)
-                if self.connection in r:
-                    self.parse(self.connection.recv(8192))
-                if self.connection in e:
-                    self._connected = False
-                    self.log.critical("Error during poll; aborting!")
-                    break
-                if not self._registered:
-                    self._raw_send('\r\n', override = True)
                 # process data that is currently in the sending queue.
                 try:
-                    [self._raw_send(data) for data in [self._queue.popleft() for count in xrange(0, 1)]]
+                    if self._connected and not self._registered:
+                        self._raw_send('\r\n', override = True)
+                    if self._connected:
+                        self.__process_queue()
                 except (AssertionError, IndexError) as e: pass
+                except (socket.error, ssl.SSLError) as e:
+                    self.reconnect("error while sending: %s" % (e))
                 except (KeyboardInterrupt, SystemExit) as e:
                     self.shutdown()
                     raise
-                # process data that is waiting in the subprocess pipe.
-                try:
-                    if self._comm_pipe_recv.poll(.025):
-                        self.send(self._comm_pipe_recv.recv())
-                except (EOFError, IOError): pass
-                except (KeyboardInterrupt, SystemExit) as e:
-                    self.shutdown()
-                    raise
+                if not self._running:
+                    break
+                timeout = self.__get_timeout()
+                self._watchdog.idle()
+                self._loop.poll(timeout)
+                self._watchdog.beat()
                 self._scheduler.tick()
+                self._executor.check_timeouts()
             except (AssertionError) as e: pass
             except (KeyboardInterrupt, SystemExit) as e:
                 self.shutdown()
                 raise
         self.log.info("Shutting down.")
-        self.connection.close()
-        self._socket.close()
+        self.__close()
+        self._loop.unregister(self._comm_pipe_recv)
+        self._loop.unregister(self._wakeup_recv)
+        self._executor.shutdown()
+        self._watchdog.stop()
+        self.set_capture(None)
         exit()
+
+    def __get_timeout(self):
+        """ py:function:: __get_timeout(self)
+
+            Works out how long the event loop may block for: until the next scheduled job,
+            the next line the flood controller allows, the next offloaded callback timeout or the
+            next registration keepalive, whichever comes first.
+
+            :returns: Number of seconds to wait, or None to wait for I/O only.
+            :rtype: float """
+
+        timeouts = [self._queue.next_delay(), self._executor.next_timeout()]
+
+        deadline = self._scheduler.next_deadline()
+        if deadline is not None:
+            timeouts.append(deadline - monotonic())
+
+        if self._connected and not self._registered:
+            timeouts.append(Connection.REGISTER_INTERVAL)
+
+        timeouts = [timeout for timeout in timeouts if timeout is not None]
+
+        return max(0, min(timeouts)) if timeouts else None
+
+    def __process_queue(self):
+        """ py:function:: __process_queue(self)
+
+            Writes as many queued lines as the flood controller allows in a single send. """
+
+        lines = self._queue.drain()
+        if not lines:
+            return
+
+        data = ''.join(lines)
+        self.connection.sendall(data)
+        self._lines_sent.inc(len(lines))
+        self._bytes_sent.inc(len(data))
+
+    def __on_socket_ready(self, sock, events):
+        """ py:function:: __on_socket_ready(self, sock, events)
+
+            Reads whatever the server has sent into the line buffer and processes every complete
+            line. Data that an SSL socket has already decrypted is drained as well, since it will
+            not wake the loop. """
+
+        self._watchdog.beat()
+        try:
+            count = self._inbuf.recv_into(sock)
+            if count == 0:
+                self.reconnect("connection closed by the server")
+                return
+            self._bytes_received.inc(count)
+            self.process_lines()
+
+            while self._connected and sock is self.connection and hasattr(sock, 'pending') and sock.pending() > 0:
+                count = self._inbuf.recv_into(sock)
+                if count == 0:
+                    break
+                self._bytes_received.inc(count)
+                self.process_lines()
+        except (socket.error, ssl.SSLError) as e:
+            self.reconnect("error while receiving: %s" % (e))
+
+    def __on_comm_pipe_ready(self, pipe, events):
+        """ py:function:: __on_comm_pipe_ready(self, pipe, events)
+
+            Moves everything waiting in the subprocess pipe into the bulk lane of the send queue. """
+
+        try:
+            while pipe.poll():
+                self.send(pipe.recv(), priority = Priority.BULK)
+        except (EOFError, IOError):
+            self._loop.unregister(pipe)
     
+    def __on_wakeup(self, fd, events):
+        """ py:function:: __on_wakeup(self, fd, events)
+
+            Runs the calls that other threads have handed to the main loop. """
+
+        self._watchdog.beat()
+        try:
+            while os.read(fd, 4096):
+                pass
+        except OSError as e:
+            if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+        while self._calls:
+            function, args = self._calls.popleft()
+            try:
+                function(*args)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                [self.log.error(trace) for trace in traceback.format_exc(4).split('\n')]
+
     def parse(self, data):
         """ py:function:: parse(self, data)
 
-            Processes a chunk of data by splitting the chunk at each '\r\n', then tokenizes each line, and
-            processes each token.
+            Frames a chunk of data that did not come straight from the socket and processes every
+            line it completes.
             
             :param data: Chunk of data to be parsed.
             :type data: str """
         
-        self._pqueue.extend(data.split('\r\n'))
-        
-        _reasm = None
-        
-        if self.__pq_reasm:
-            _reasm = self.__pq_reasm
-            self.__pq_reasm = None
-        
-        if not data.endswith('\r\n'):
-            self.__pq_reasm = self._pqueue[len(self._pqueue) - 1]
-        
-        while (len(self._pqueue) > 0):
-            line = self._pqueue.popleft()
-            if self.__pq_reasm and len(self._pqueue) == 0:
-                break
-            if _reasm:
-                line = _reasm + line
-                _reasm = None
+        self._inbuf.feed(data)
+        self.process_lines()
+
+    def process_lines(self):
+        """ py:function:: process_lines(self)
+
+            Tokenizes every complete line waiting in the line buffer and processes its events. """
+
+        capture, watchdog = self._capture, self._watchdog
+        count = 0
+        for line in self._inbuf.lines():
+            watchdog.line = line
+            count += 1
+            if capture is not None:
+                capture.write("%.6f %s\n" % (time.time(), self.__redact(line)))
             line = Tokener(line)
             Tokener.process_events(line)
+
+        self._lines_received.inc(count)
+        if capture is not None:
+            capture.flush()
         
+    def __redact(self, line):
+        """ py:function:: __redact(self, line)
+
+            :returns: +line+, with the text replaced by asterisks if it is a PRIVMSG or NOTICE
+                      to the bot itself.
+            :rtype: str """
+
+        parts = line.split(' ', 3)
+        if len(parts) < 4 or not parts[0].startswith(':') or parts[1].upper() not in ('PRIVMSG', 'NOTICE'):
+            return line
+        if Structures.casemap(parts[2]) != Structures.casemap(self.nick):
+            return line
+
+        return "%s :%s" % (' '.join(parts[:3]), '*' * (len(parts[3]) - 1))
+
 class Tokener(object):
     """ py:class:: Tokener(data)
     
-        Uses a regex to split up a line and turn each matched group (Origin, Type, Target, Message)
-        into a Structure that makes usage, responding, and formatting much easier. """
+        Splits up a line (Origin, Type, Target, Message) and turns each part into a Structure that
+        makes usage, responding, and formatting much easier. Only the type is built up front; the
+        origin, target and message structures are built the first time they are read, so lines
+        that no event inspects never pay for the user and channel lookups. """
 
     @staticmethod
     def process_events(data):
@@ -319,7 +1051,7 @@ class Tokener(object):
     def __init__(self, data):
         """ py:function:: __init__(self, data)
             
-            Tokenizes +data+ according to a regex and matches each group with the proper Structure based on content.
+            Tokenizes +data+ into its raw parts and builds the Type structure.
             
             :param data: Data to tokenize.
             :type data: str """
@@ -327,49 +1059,61 @@ class Tokener(object):
         self._raw = data
 
         self.connection = Connection.get_instance()
-        self.eventhandler = EventHandler.EventHandler.get_instance()
-        # this regular expression splits an IRC line up into four parts:
-        # ORIGIN, TYPE, TARGET, MESSAGE
-        proto_regex = r"^(?:\:([^\s]+)\s)?([A-Za-z0-9]+)\s(?:([^\s\:]+)\s)?(?:\:?(.*))?$"
-        user_regex = r"([\w\d\-_]+\![~\w\d\-_]+\@[\w\d\-_.]+)"
-        # a regular expression to match and dissect IRC protocol messages
-        # this is around 60% faster than not using a RE
-        proto_p = re.compile(proto_regex, re.VERBOSE)
-        user_p = re.compile(user_regex, re.VERBOSE)
-        try:
-            self.origin, self.type, self.target, self.message = (None, None, None, None)
-            self._origin, self._type, self._target, self._message = proto_p.match(data).groups()
-            # take each token and initialise the appropriate structure.
-            try:
-                if len(user_p.findall(self._origin)) == 0:
-                    self.origin = Structures.Origin(self._origin) if self._origin is not None else None
-                else:
-                    self.origin = Structures.User.find_userstring(self._origin)
-                    if not self.origin:
-                        self.origin = Structures.User(userstring = self._origin)
-            except: self.origin = None
-            self.type = Structures.Type(self._type) if self._type is not None else None
-            if self._target is None:
-                pass
-            elif self._target.startswith('#', 0, 1) is True:
-                self.target = Structures.Channel(self._target)
-            else: 
-                if self._target == '*':
-                    self.target = self._target
-                else:
-                    try: self.target = Structures.User.find_user(nick = self._target)
-                    except:
-                        self.target = Structures.User(nick = self._target)
-            self.message = Structures.Message(self._message)
-        except (AttributeError):
-            pass
-        try:
-            if logging.getLogger('ashiema').getEffectiveLevel() is logging.DEBUG and self.connection.debug is True:
-                if self.type and self.message:
-                    logging.getLogger('ashiema').debug("%s %s %s %s" % (str(self.origin), str(self.type), str(self.target), str(self.message)))
-        except:
-            [logging.getLogger('ashiema').error(trace) for trace in traceback.format_exc(5).split('\n')]
-            pass
+
+        tokens = tokenize(data)
+        if tokens is None:
+            self._origin, self._type, self._target, self._message = (None, None, None, None)
+            self.type = None
+        else:
+            self._origin, self._type, self._target, self._message = tokens
+            self.type = Structures.Type(self._type)
+
+        if self.connection.debug is True and self.type is not None:
+            if logging.getLogger('ashiema').isEnabledFor(logging.DEBUG):
+                logging.getLogger('ashiema').debug("%s %s %s %s" % (self._origin, self._type, self._target, self._message))
+
+    @lazy_property
+    def origin(self):
+        """ py:attribute:: origin
+
+            The User that sent the line if the origin is a hostmask, otherwise an Origin. """
+
+        if self._origin is None:
+            return None
+
+        if '!' in self._origin and '@' in self._origin:
+            return Structures.User.find_or_create(self._origin)
+
+        return Structures.Origin(self._origin)
+
+    @lazy_property
+    def target(self):
+        """ py:attribute:: target
+
+            The Channel or User the line is addressed to, the string '*', or None. """
+
+        if self._target is None:
+            return None
+        elif Structures.is_channel(self._target):
+            return Structures.Channel(self._target)
+        elif self._target == '*':
+            return self._target
+
+        user = Structures.User.find_user(nick = self._target)
+        if user is None:
+            user = Structures.User(nick = self._target)
+        return user
+
+    @lazy_property
+    def message(self):
+        """ py:attribute:: message
+
+            The Message structure wrapping the trailing part of the line. """
+
+        if self._message is None:
+            return None
+
+        return Structures.Message(self._message)
     
     def get_raw(self):
         """ py:function:: get_raw(self)
@@ -401,3 +1145,10 @@ class Tokener(object):
         else:
             self.target.message(message)
 
+class RestartException(Exception):
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
@@ -5,11 +5,17 @@
 #
 # An extended version of the license is included with this software in `ashiema.py`.
 
-import logging, traceback, sys
+import logging, traceback, sys, functools, threading
+from Executor import Executor
+from Metrics import Metrics
+from util import monotonic
 
 class EventHandler(object):
 
     __instance = None
+
+    # events listing this in their commands are offered every three digit numeric reply.
+    NUMERICS = '<numeric>'
     
     @staticmethod
     def get_instance():
@@ -24,6 +30,22 @@ class EventHandler(object):
         EventHandler.__instance = self
 
         self.events = {}
+        # command -> events that may match it, rebuilt whenever the set of events changes.
+        self.__dispatch = {}
+        # receives the time spent in events and callbacks, see set_timer().
+        self.__timer = None
+        # (source, callback name) -> [calls, seconds, slowest call, exceptions]
+        self.__stats = {}
+        self.__stats_lock = threading.Lock()
+        # calls that take longer than this many seconds are logged.
+        self.slow_threshold = 0.5
+
+        metrics = Metrics.get_instance()
+        self.__fired = metrics.counter('ashiema_events_fired_total', 'Events that matched a line and were run.', ('event',))
+        dispatch = metrics.counter('ashiema_dispatch_cache_total', 'Lookups of the events that may match a line type.', ('result',))
+        self.__dispatch_hits, self.__dispatch_misses = dispatch.labels('hit'), dispatch.labels('miss')
+        self.__callback_seconds = metrics.histogram('ashiema_callback_seconds', 'Time plugin callbacks took.', ('plugin',))
+        self.__callback_errors = metrics.counter('ashiema_callback_errors_total', 'Exceptions raised by plugin callbacks.', ('plugin',))
 
     def __repr__(self):
 
@@ -48,33 +70,182 @@ class EventHandler(object):
         """ register an event in the handler """
         
         self.events.update({event.__get_name__(): event})
+        self.__dispatch.clear()
     
     def deregister(self, event):
         """ deregister an event from the handler """
         
         self.events.pop(event.__get_name__())
+        self.__dispatch.clear()
     
     def deregister_all(self):
         """ deregisters all events """
         
         [event.__deregister__() for event in self.events]
     
+    def set_timer(self, timer):
+        """ times every event that is fired from now on, in addition to the callbacks. +timer+
+            must have an add(kind, name, seconds) method, which is called with kind 'event' and
+            the event name, or kind 'plugin' and the name of the plugin class a callback belongs
+            to. None stops the timing. """
+
+        self.__timer = timer
+
+    def set_slow_threshold(self, seconds):
+        """ logs a warning for every callback call that takes longer than +seconds+. """
+
+        self.slow_threshold = seconds
+
+    def wrap_callback(self, function, source = None):
+        """ returns a wrapper around +function+ that keeps count of its calls, the time they took
+            and the exceptions they raised, under +source+ (the event or command it is called for)
+            and the name of the callback. if +function+ was marked with @offload, the wrapper runs
+            it on the worker pool, where it is timed; calls that reply to the same channel or user
+            run in order. """
+
+        owner = getattr(function, 'im_self', None)
+        plugin = owner.__class__.__name__ if owner is not None else function.__module__
+        name = "%s.%s" % (plugin, function.__name__)
+
+        with self.__stats_lock:
+            stats = self.__stats.setdefault((source, name), [0, 0.0, 0.0, 0])
+        # the class name is what Plugin.name is set to.
+        seconds, errors = self.__callback_seconds.labels(plugin), self.__callback_errors.labels(plugin)
+
+        @functools.wraps(function)
+        def timed(*args):
+            start = monotonic()
+            failed = False
+            try:
+                return function(*args)
+            except AssertionError:
+                # permission checks fail with an assertion; the callback did nothing wrong.
+                raise
+            except:
+                failed = True
+                raise
+            finally:
+                elapsed = monotonic() - start
+                with self.__stats_lock:
+                    stats[0] += 1
+                    stats[1] += elapsed
+                    stats[2] = max(stats[2], elapsed)
+                    stats[3] += failed
+                seconds.observe(elapsed)
+                if failed:
+                    errors.inc()
+                if elapsed > self.slow_threshold:
+                    logging.getLogger('ashiema').warning("[EventHandler] %s took %.3fs for %s (slow-callback is %.3fs)." % (
+                        name, elapsed, source, self.slow_threshold))
+                timer = self.__timer
+                if timer is not None:
+                    timer.add('plugin', plugin, elapsed)
+
+        return self.__offload(function, timed)
+
+    def get_callback_stats(self):
+        """ returns a dict with the source, callback, calls, total time, slowest call and
+            exception count of every callback that has been wrapped, busiest first. """
+
+        with self.__stats_lock:
+            stats = [{
+                'source'        : source,
+                'callback'      : name,
+                'calls'         : calls,
+                'total'         : total,
+                'max'           : slowest,
+                'errors'        : errors
+            } for (source, name), (calls, total, slowest, errors) in self.__stats.iteritems()]
+
+        return sorted(stats, key = lambda entry: entry['total'], reverse = True)
+
+    def reset_callback_stats(self):
+        """ starts counting every callback from zero again. """
+
+        with self.__stats_lock:
+            for stats in self.__stats.values():
+                stats[:] = [0, 0.0, 0.0, 0]
+
+    def __offload(self, marked, function):
+        """ returns +function+, or a wrapper that submits it to the worker pool if +marked+ was
+            marked with @offload. """
+
+        if not getattr(marked, 'offload', False):
+            return function
+
+        timeout = getattr(marked, 'offload_timeout', None)
+
+        @functools.wraps(function)
+        def offloaded(*args):
+            key = None
+            if args and hasattr(args[0], '_target'):
+                data = args[0]
+                # build the structures here; the user and channel lists belong to the main loop.
+                data.origin, data.target, data.message
+                key = EventHandler.get_reply_key(data)
+            Executor.get_instance().submit(function, args, key = key, timeout = timeout)
+
+        return offloaded
+
+    @staticmethod
+    def get_reply_key(data):
+        """ returns the lowercased name of the channel or user that a reply to +data+ goes to. """
+
+        target = data._target
+        if target is None or target == data.connection.nick:
+            target = (data._origin or '').split('!', 1)[0]
+
+        return target.lower()
+
+    def get_dispatch(self, command):
+        """ returns the events that may match a line of type +command+: the events that list
+            the command (or NUMERICS, for numeric replies) in their commands, followed by every
+            event without a commands list. events with an empty list are never offered lines. """
+
+        try:
+            events = self.__dispatch[command]
+            self.__dispatch_hits.inc()
+            return events
+        except KeyError:
+            self.__dispatch_misses.inc()
+
+        numeric = command is not None and len(command) == 3 and command.isdigit()
+        indexed, wildcard = [], []
+        for event in self.events.values():
+            commands = getattr(event, 'commands', None)
+            if commands is None:
+                wildcard.append(event)
+            elif command in commands or (numeric and EventHandler.NUMERICS in commands):
+                indexed.append(event)
+
+        if len(self.__dispatch) > 512:
+            self.__dispatch.clear()
+        self.__dispatch[command] = tuple(indexed + wildcard)
+
+        return self.__dispatch[command]
+
     def map_events(self, data):
         """ create a list of events that match the given data """
         
-        e_map = []
-        for event in self.get_events().values():
-            if event.match(data):
-                e_map.append(event)
-            else: continue
+        command = getattr(data, '_type', None)
+        if command is not None:
+            command = command.upper()
+
+        e_map = [event for event in self.get_dispatch(command) if event.match(data)]
         return self.fire(e_map, data)
     
     def fire(self, event_map, data):
         """ fire all mapped events with provided data """
 
         for event in event_map:
+            self.__fired.labels(event.__get_name__()).inc()
             try:
-                event.run(data)
+                if self.__timer is None:
+                    event.run(data)
+                    continue
+                start = monotonic()
+                try: event.run(data)
+                finally: self.__timer.add('event', event.__get_name__(), monotonic() - start)
             except AssertionError:
                 [logging.getLogger('ashiema').error('%s' % (trace)) for trace in traceback.format_exc(4).split('\n')]
             except:
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import select, errno, logging, traceback
+
+""" module:: EventLoop
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Contains the EventLoop class, which waits on file descriptors for the main loop. """
+
+READ = 0x001
+WRITE = 0x004
+ERROR = 0x008 | 0x010
+
+def _fileno(fileobj):
+    """ py:function:: _fileno(fileobj)
+
+        Returns the file descriptor number for +fileobj+.
+
+        :param fileobj: An integer fd or an object with a fileno() method.
+        :returns: File descriptor number.
+        :rtype: int """
+
+    if isinstance(fileobj, (int, long)):
+        return fileobj
+    return fileobj.fileno()
+
+class EventLoop(object):
+    """ py:class:: EventLoop()
+
+        Blocks until one of the registered file descriptors is ready or a timeout passes, then
+        dispatches the readiness to the callback registered for that descriptor.
+
+        epoll is used where the platform provides it; poll and then select are used otherwise. """
+
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        """ py:staticmethod:: get_instance()
+
+            :returns: The EventLoop instance, if it exists, or a new EventLoop instance.
+            :rtype: EventLoop """
+
+        if EventLoop.__instance is None:
+            return EventLoop()
+        else:
+            return EventLoop.__instance
+
+    def __init__(self):
+        """ py:function:: __init__(self)
+
+            Picks the best available polling backend. """
+
+        EventLoop.__instance = self
+
+        self.log = logging.getLogger('ashiema')
+        self.__handlers = {}
+
+        if hasattr(select, 'epoll'):
+            self.__poller, self.__backend = select.epoll(), 'epoll'
+        elif hasattr(select, 'poll'):
+            self.__poller, self.__backend = select.poll(), 'poll'
+        else:
+            self.__poller, self.__backend = None, 'select'
+
+    def __repr__(self):
+
+        return "<EventLoop(%s, %d fds)>" % (self.__backend, len(self.__handlers))
+
+    def get_backend(self):
+        """ py:function:: get_backend(self)
+
+            :returns: Name of the polling backend in use.
+            :rtype: str """
+
+        return self.__backend
+
+    def register(self, fileobj, callback, events = READ):
+        """ py:function:: register(self, fileobj, callback[, events = READ])
+
+            Watches +fileobj+ for +events+. When it becomes ready, +callback+ is called with
+            the file object and the mask of ready events. Registering a descriptor that is already
+            watched replaces its callback and event mask.
+
+            :param fileobj: Socket, pipe, file or integer fd to watch.
+            :param callback: Function to call when the descriptor is ready.
+            :type callback: function
+            :param events: Mask of READ and/or WRITE.
+            :type events: int """
+
+        fd = _fileno(fileobj)
+
+        if self.__poller is not None:
+            if fd in self.__handlers:
+                self.__poller.modify(fd, events)
+            else:
+                self.__poller.register(fd, events)
+
+        self.__handlers[fd] = (fileobj, callback, events)
+
+    def modify(self, fileobj, events):
+        """ py:function:: modify(self, fileobj, events)
+
+            Changes the event mask for an already watched descriptor.
+
+            :param fileobj: Watched file object.
+            :param events: New mask of READ and/or WRITE.
+            :type events: int """
+
+        fd = _fileno(fileobj)
+
+        fileobj, callback, _events = self.__handlers[fd]
+        if _events == events:
+            return
+        self.register(fileobj, callback, events)
+
+    def unregister(self, fileobj):
+        """ py:function:: unregister(self, fileobj)
+
+            Stops watching +fileobj+. Unknown descriptors are ignored.
+
+            :param fileobj: Watched file object. """
+
+        try: fd = _fileno(fileobj)
+        except (ValueError, IOError, OSError, AttributeError):
+            return
+
+        if fd not in self.__handlers:
+            return
+
+        del self.__handlers[fd]
+
+        if self.__poller is not None:
+            try: self.__poller.unregister(fd)
+            except (KeyError, ValueError, IOError, OSError): pass
+
+    def is_registered(self, fileobj):
+        """ py:function:: is_registered(self, fileobj)
+
+            :returns: Whether or not +fileobj+ is being watched.
+            :rtype: bool """
+
+        try: return _fileno(fileobj) in self.__handlers
+        except (ValueError, IOError, OSError, AttributeError):
+            return False
+
+    def __wait(self, timeout):
+        """ py:function:: __wait(self, timeout)
+
+            Waits on the backend and returns a list of (fd, mask) pairs. """
+
+        if self.__backend == 'epoll':
+            return self.__poller.poll(-1 if timeout is None else timeout)
+        elif self.__backend == 'poll':
+            return self.__poller.poll(None if timeout is None else int(timeout * 1000))
+
+        readers = [fd for fd, (f, c, events) in self.__handlers.iteritems() if events & READ]
+        writers = [fd for fd, (f, c, events) in self.__handlers.iteritems() if events & WRITE]
+        r, w, e = select.select(readers, writers, readers, timeout)
+        ready = {}
+        for fd in r:
+            ready[fd] = ready.get(fd, 0) | READ
+        for fd in w:
+            ready[fd] = ready.get(fd, 0) | WRITE
+        for fd in e:
+            ready[fd] = ready.get(fd, 0) | ERROR
+        return ready.items()
+
+    def poll(self, timeout = None):
+        """ py:function:: poll(self[, timeout = None])
+
+            Blocks until a watched descriptor is ready or +timeout+ seconds pass, then runs the
+            callbacks for every ready descriptor. A timeout of None blocks indefinitely.
+
+            :param timeout: Maximum number of seconds to wait.
+            :type timeout: float
+            :returns: Number of callbacks that were run.
+            :rtype: int """
+
+        if timeout is not None and timeout < 0:
+            timeout = 0
+
+        try:
+            ready = self.__wait(timeout)
+        except (select.error, IOError, OSError) as e:
+            if e.args and e.args[0] == errno.EINTR:
+                return 0
+            raise
+
+        dispatched = 0
+        for fd, mask in ready:
+            # a previous callback may have unregistered this descriptor.
+            if fd not in self.__handlers:
+                continue
+            fileobj, callback, events = self.__handlers[fd]
+            try:
+                callback(fileobj, mask)
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except:
+                [self.log.error(trace) for trace in traceback.format_exc(4).split('\n')]
+            dispatched += 1
+
+        return dispatched
+
+    def close(self):
+        """ py:function:: close(self)
+
+            Forgets all watched descriptors and releases the backend. """
+
+        self.__handlers.clear()
+        if self.__backend == 'epoll':
+            self.__poller.close()
@@ -11,13 +11,22 @@ from ashiema.util.Configuration import Configuration
 import Connection, EventHandler, Structures
 from Connection import Connection
 from EventHandler import EventHandler
+from CommandRouter import CommandRouter
+from HelpFactory import Contexts
 from PluginLoader import PluginLoader
 from Structures import Channel, User
 
 class Event(object):
     """ This is the base event class that should be subclassed by all other events
         that are being implemented. We provide a small framework to easily handle
-        registration and deregistration of handlers. """
+        registration and deregistration of handlers.
+
+        Subclasses set +commands+ to the IRC commands (or EventHandler.NUMERICS) they
+        want to be matched against, so the EventHandler only calls match() for those
+        lines. An empty list means the event is never matched against lines, and None
+        means match() is called for every line. """
+
+    commands = None
     
     def __init__(self, event_name = "Event"):
 
@@ -63,7 +72,7 @@ class Event(object):
 
     def register(self, function):
 
-        self.callbacks[self.get_method_ident(function)] = function
+        self.callbacks[self.get_method_ident(function)] = self.eventhandler.wrap_callback(function, self.name)
 
     def deregister(self, function):
 
@@ -139,6 +148,7 @@ class PluginsLoadedEvent(Event):
 
         Event.__init__(self, "PluginsLoadedEvent")
         self.__register__()
+        self.commands = []
         
         self.__cancellable = False
 
@@ -161,6 +171,7 @@ class IRCConnectionReadyEvent(Event):
     
         Event.__init__(self, "IRCConnectionReadyEvent")
         self.__register__()
+        self.commands = ['NOTICE']
         
         self.__cancellable = False
         
@@ -202,12 +213,42 @@ class ModeChangeEvent(Event):
             for function in self.callbacks.values():
                 function(data)
 
+class ChannelModeEvent(Event):
+
+    def __init__(self):
+
+        Event.__init__(self, "ChannelModeEvent")
+        self.__register__()
+        self.commands = ['MODE']
+    
+        self.__cancellable = False
+    
+    def match(self, data):
+
+        if str(data.type) == 'MODE' and Structures.is_channel(data._target):
+            return True
+        else:
+            return False
+    
+    def run(self, data):
+
+        self.log_debug("<- mode %s set on %s by %s" % (data.message.to_s(), data._target, data.origin.to_s()))
+
+        channel = Channel.get_channel(data._target)
+        if channel is not None:
+            channel.parse_mode(data)
+
+        if self.callbacks is not None:
+            for function in self.callbacks.values():
+                function(data)
+
 class ErrorEvent(Event):
 
     def __init__(self):
 
         Event.__init__(self, "ErrorEvent")
         self.__register__()
+        self.commands = ['ERROR', 'KILL']
     
         self.__cancellable = False
     
@@ -221,13 +262,8 @@ class ErrorEvent(Event):
     def run(self, data):
 
         self.log_critical('<- %s: %s' % (str(data.type), data.message))
-        # adjust the loop shutdown flag
-        data.connection.shutdown()
-        # check if we should attempt to reconnect
-        if Configuration.get_instance().get_section('main').get_bool('reconnect-on-err', True):
-            self.log_info("======== Preparing to reconnect, stand by. ========")
-            sys.argv.insert(0, "python")
-            os.execvpe("python", sys.argv, os.environ)
+        # reconnects in-process, or shuts down if reconnect-on-err is off.
+        data.connection.reconnect('%s: %s' % (str(data.type), data.message))
 
 class PMEvent(Event):
 
@@ -241,7 +277,7 @@ class PMEvent(Event):
 
     def match(self, data):
 
-        if self.commands.__contains__(str(data.type)) and str(data.target) == data.connection.nick:
+        if self.commands.__contains__(str(data.type)) and data._target == data.connection.nick:
             return True
         else:
             return False
@@ -252,6 +288,8 @@ class PMEvent(Event):
             for function in self.callbacks.values():
                 function(data)
 
+        CommandRouter.get_instance().dispatch(data, Contexts.PRIVATE)
+
 class CAPEvent(Event):
 
     capabilities = []
@@ -285,6 +323,8 @@ class CAPEvent(Event):
             self.connection.send("CAP END")
 
         if subcommand == 'LS':
+            # a new session; forget what the last one acknowledged.
+            del CAPEvent.capabilities[:]
             extensionlist = []
             for extension in self.extensions:
                 if extension in arguments:
@@ -307,6 +347,7 @@ class NumericEvent(Event):
 
         Event.__init__(self, "NumericEvent")
         self.__register__()
+        self.commands = [EventHandler.NUMERICS]
         
         self.__cancellable = False
         
@@ -326,15 +367,21 @@ class NumericEvent(Event):
         if data.type.to_i() == 001:
             # RPL_WELCOME
             self.log_info('<- welcome received: %s' % (data.message))
+            self.connection.reset_backoff()
         elif data.type.to_i() == 002:
             # RPL_YOURHOST
             self.log_info('<- %s' % (data.message))
+        elif data.type.to_i() == 005:
+            # RPL_ISUPPORT
+            self.connection.get_support().parse(data)
         elif data.type.to_i() == 311:
             # RPL_WHOISUSER
             user = User.find_user(data.message[0])
             if user is None:
                 user = User(nick = data.message[0], ident = data.message[1], host = data.message[2])
-                user.update_gecos(data.message[4])
+            else:
+                user.update_host(data.message[1], data.message[2])
+            user.update_gecos(data.message[4])
         elif data.type.to_i() == 318:
             # RPL_ENDOFWHOIS
             self.log_debug("<- received whois info for %s" % (data.message[0]))
@@ -342,32 +389,43 @@ class NumericEvent(Event):
             # RPL_WHOISACCOUNT
             user = User.find_user(data.message[0])
             if user is None:
-                self.connection.send(User.format_whois(data.message[0]))
+                self.connection.send_query(User.format_whois(data.message[0]))
             else:
                 user.update_account(account = data.message[1])
+        elif data.type.to_i() == 352:
+            # RPL_WHOREPLY
+            channel = Channel.get_channel(data.message[0])
+            if channel is not None:
+                channel.parse_who_reply(data)
         elif data.type.to_i() == 353:
             # RPL_NAMREPLY
-            message_pattern = re.compile(r"(?:[=*@])\s([#&]+?[\S]+)\s:(.*)", re.VERBOSE)
-            user_pattern = re.compile(r"([*@]?[\w\d\-_]+)", re.VERBOSE)
+            message_pattern = re.compile(r"(?:[=*@])\s(\S+)\s:(.*)", re.VERBOSE)
             channel, names = message_pattern.findall(data.message.to_s())[0]
-            names = names.split(' ')
-            for name in names:
-                if name.startswith('@') or name.startswith('+'):
-                    name = name[1:]
-                self.connection.send(User.format_whois(name))
+            channel = Channel.get_channel(channel)
+            if channel is not None:
+                channel.parse_names(names)
         elif data.type.to_i() == 354:
             # RPL_WHOSPCRPL
+            channel = Channel.get_channel(data.message[1])
+            if channel is not None:
+                channel.parse_who(data)
+        elif data.type.to_i() == 366:
+            # RPL_ENDOFNAMES
             channel = Channel.get_channel(data.message[0])
-            if channel is None:
-                pass
-            channel.parse_who(data)
+            if channel is not None and not channel.synced:
+                channel.request_who()
         elif data.type.to_i() == 376 or data.type.to_i() == 422:
             # RPL_ENDOFMOTD or ERR_NOMOTD
+            rejoin = self.connection.get_rejoin_channels()
             if "join" in self.__conn_hooks__:
                 channel = self.config.get_string('channel', None)
                 key = self.config.get_string('chan_key', None)
                 self.connection.send(Channel.join(channel, key))
-            if "pluginload" in self.__conn_hooks__:
+                rejoin = [name for name in rejoin if Structures.casemap(name) != Structures.casemap(channel)]
+            if rejoin:
+                self.connection.send(*self.connection.get_support().pack_targets('JOIN', rejoin))
+            # plugins stay loaded across reconnects.
+            if "pluginload" in self.__conn_hooks__ and not PluginLoader.get_instance().is_loaded():
                 PluginLoader.get_instance().load()
         elif data.type.to_i() == 433:
             # ERR_NICKNAMEINUSE # XXX - Quit just exiting. Implement a nick change/tracking mechanism.
@@ -390,7 +448,7 @@ class MessageEvent(Event):
 
     def match(self, data):
 
-        if self.commands.__contains__(str(data.type)) and str(data.target) != data.connection.nick:
+        if self.commands.__contains__(str(data.type)) and data._target != data.connection.nick:
             return True
     
     def run(self, data):
@@ -399,12 +457,15 @@ class MessageEvent(Event):
             for name, function in self.callbacks.iteritems():
                 function(data)
 
+        CommandRouter.get_instance().dispatch(data, Contexts.PUBLIC)
+
 class AccountEvent(Event):
 
     def __init__(self):
     
         Event.__init__(self, "AccountEvent")
         self.__register__()
+        self.commands = ['ACCOUNT']
     
         self.__cancellable = False
     
@@ -430,6 +491,7 @@ class NickChangeEvent(Event):
     
         Event.__init__(self, "NickChangeEvent")
         self.__register__()
+        self.commands = ['NICK']
     
         self.__cancellable = False
     
@@ -444,6 +506,9 @@ class NickChangeEvent(Event):
     
         self.log_info("<- user %s changed nick to %s" % (data.origin.to_s(), data.message.to_s()))
 
+        if data.origin.nick == data.connection.nick:
+            data.connection.nick = data.message.to_s()
+
         data.origin.nick_change(data.message.to_s())
         
 class UserJoinEvent(Event):
@@ -452,6 +517,7 @@ class UserJoinEvent(Event):
 
         Event.__init__(self, "UserJoinEvent")
         self.__register__()
+        self.commands = ['JOIN']
     
         self.__cancellable = False
     
@@ -464,11 +530,18 @@ class UserJoinEvent(Event):
 
     def run(self, data):
     
-        if 'account-notify' in CAPEvent.capabilities:
-            self.log_debug("<- user %s (account %s) joined channel %s" % (data.origin.to_s(), data.message[0], data.target.to_s()))
+        # a plain JOIN only carries the channel; an extended-join carries the channel as the
+        # target, followed by the account name and the real name.
+        if data._target is not None:
+            channel = data._target
+            self.log_debug("<- user %s (account %s) joined channel %s" % (data.origin.to_s(), data.message[0], channel))
             data.origin.update_account(account = data.message[0])
         else:
-            self.log_debug("<- user %s joined channel %s" % (data.origin.to_s(), data.message.to_s()))
+            channel = data.message.to_s()
+            self.log_debug("<- user %s joined channel %s" % (data.origin.to_s(), channel))
+
+        if isinstance(data.origin, User):
+            data.origin.join(channel)
 
 class UserPartEvent(Event):
 
@@ -476,6 +549,7 @@ class UserPartEvent(Event):
 
         Event.__init__(self, "UserPartEvent")
         self.__register__()
+        self.commands = ['PART']
     
         self.__cancellable = False
     
@@ -488,10 +562,41 @@ class UserPartEvent(Event):
     
     def run(self, data):
     
-        if not data.target:    
-            self.log_debug("<- user %s parted channel %s" % (data.origin.to_s(), data.message.to_s()))
+        if data._target is None:
+            channel = data.message.to_s()
+            self.log_debug("<- user %s parted channel %s" % (data.origin.to_s(), channel))
+        else:
+            channel = data._target
+            self.log_debug("<- user %s parted channel %s: %s" % (data.origin.to_s(), channel, data.message.to_s()))
+
+        if isinstance(data.origin, User):
+            data.origin.part(channel)
+
+class UserKickEvent(Event):
+
+    def __init__(self):
+
+        Event.__init__(self, "UserKickEvent")
+        self.__register__()
+        self.commands = ['KICK']
+    
+        self.__cancellable = False
+    
+    def match(self, data):
+
+        if str(data.type) == 'KICK':
+            return True
         else:
-            self.log_debug("<- user %s parted channel %s: %s" % (data.origin.to_s(), data.target.to_s(), data.message.to_s()))
+            return False
+    
+    def run(self, data):
+    
+        victim = User.find_user(nick = data.message[0])
+
+        self.log_debug("<- user %s kicked %s from channel %s: %s" % (data.origin.to_s(), data.message[0], data._target, data.message.to_s().partition(' ')[2].lstrip(':')))
+
+        if victim is not None:
+            victim.part(data._target)
 
 class UserQuitEvent(Event):
 
@@ -499,6 +604,7 @@ class UserQuitEvent(Event):
 
         Event.__init__(self, "UserQuitEvent")
         self.__register__()
+        self.commands = ['QUIT']
         
         self.__cancellable = False
        
@@ -513,12 +619,44 @@ class UserQuitEvent(Event):
     
         self.log_debug("<- user %s has quit: %s" % (data.origin.to_s(), data.message.to_s()))
 
+        if isinstance(data.origin, User):
+            data.origin.quit()
+
+class PongEvent(Event):
+
+    def __init__(self):
+
+        Event.__init__(self, "PongEvent")
+        self.__register__()
+        self.commands = ['PONG']
+
+        self.__cancellable = False
+
+    def match(self, data):
+
+        if str(data.type) == 'PONG':
+            return True
+        else:
+            return False
+
+    def run(self, data):
+
+        token = data.message.to_s().lstrip(':') if data.message else ''
+        rtt = data.connection.get_lag_meter().pong(token)
+        if rtt is not None and data.connection.debug:
+            self.log_debug('<- pong received after %.3fs' % (rtt))
+
+        if self.callbacks is not None:
+            for function in self.callbacks.values():
+                function(data)
+
 class PingEvent(Event):
    
     def __init__(self):
 
         Event.__init__(self, "PingEvent")
         self.__register__()
+        self.commands = ['PING']
         
         self.__cancellable = False
    
@@ -545,6 +683,7 @@ class CTCPEvent(Event):
 
         Event.__init__(self, "CTCPEvent")
         self.__register__()
+        self.commands = ['PRIVMSG']
         
         self.__cancellable = False
         
@@ -582,8 +721,10 @@ def get_events():
     return { 'NumericEvent'                 : NumericEvent(), # mainly server triggered events
              'CAPEvent'                     : CAPEvent(),
              'PingEvent'                    : PingEvent(),
+             'PongEvent'                    : PongEvent(),
              'ErrorEvent'                   : ErrorEvent(),
              'ModeChangeEvent'              : ModeChangeEvent(),
+             'ChannelModeEvent'             : ChannelModeEvent(),
              'CTCPEvent'                    : CTCPEvent(),
              'IRCConnectionReadyEvent'      : IRCConnectionReadyEvent(),
              'MessageEvent'                 : MessageEvent(), # user triggered events
@@ -592,6 +733,7 @@ def get_events():
              'AccountEvent'                 : AccountEvent(),
              'JoinEvent'                    : UserJoinEvent(),
              'PartEvent'                    : UserPartEvent(),
+             'KickEvent'                    : UserKickEvent(),
              'QuitEvent'                    : UserQuitEvent(),
              'PluginsLoadedEvent'           : PluginsLoadedEvent() # system triggered events
            }
\ No newline at end of file
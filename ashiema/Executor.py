@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import threading, Queue, collections, logging, traceback
+from util import monotonic
+
+""" module:: Executor
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Contains the worker pool that runs blocking plugin callbacks off the main loop. """
+
+def offload(function = None, timeout = None):
+    """ py:function:: offload([function = None[, timeout = None]])
+
+        Marks a callback as blocking, so that EventHandler runs it on the worker pool instead of
+        in the main loop. Can be used as `@offload` or as `@offload(timeout = 10)`.
+
+        :param timeout: Seconds after which the call is abandoned; defaults to the pool timeout.
+        :type timeout: float """
+
+    def mark(function):
+        function.offload = True
+        function.offload_timeout = timeout
+        return function
+
+    if function is None:
+        return mark
+
+    return mark(function)
+
+class Job(object):
+    """ py:class:: Job(function, args, key, timeout)
+
+        A single call waiting for or running on the worker pool. """
+
+    def __init__(self, function, args, key, timeout):
+
+        self.function = function
+        self.args = args
+        self.key = key
+        self.timeout = timeout
+        self.queued = monotonic()
+        self.started = None
+        self.error = None
+        self.expired = False
+
+    def __repr__(self):
+
+        return "<Job(%s, key %s)>" % (getattr(self.function, '__name__', self.function), self.key)
+
+    def get_deadline(self):
+        """ py:function:: get_deadline(self)
+
+            :returns: The monotonic time the job times out at, or None if it has not started.
+            :rtype: float """
+
+        if self.started is None or not self.timeout:
+            return None
+
+        return self.started + self.timeout
+
+class Executor(object):
+    """ py:class:: Executor(notify[, workers = 4[, timeout = 30.0]])
+
+        A bounded pool of worker threads for callbacks that block on network I/O. Jobs that share
+        a key (the channel or user a callback replies to) run one at a time in the order they were
+        submitted, so replies to the same target keep their order. Finished jobs are handed back
+        to the main loop through +notify+, which must be safe to call from any thread.
+
+        Threads can not be interrupted, so a job that runs past its timeout is abandoned instead:
+        the next job for its key is started, anything it still sends is dropped, and a spare worker
+        is started in its place. """
+
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+        """ py:staticmethod:: get_instance()
+
+            :returns: The Executor instance, if it exists, or None.
+            :rtype: Executor """
+
+        return Executor.__instance
+
+    def __init__(self, notify, workers = 4, timeout = 30.0):
+        """ py:function:: __init__(self, notify[, workers = 4[, timeout = 30.0]])
+
+            :param notify: Thread-safe function that calls function(*args) on the main loop.
+            :type notify: function
+            :param workers: Number of worker threads.
+            :type workers: int
+            :param timeout: Default number of seconds a job may run for.
+            :type timeout: float """
+
+        Executor.__instance = self
+
+        self.log = logging.getLogger('ashiema')
+
+        self.__notify = notify
+        self.__local = threading.local()
+        self.__work = Queue.Queue()
+        self.__threads = []
+        # key -> jobs waiting for the running job with the same key to finish.
+        self.__pending = {}
+        self.__running = set()
+        self.__stuck = 0
+
+        self.workers = max(1, workers)
+        self.timeout = timeout
+
+        self.submitted, self.completed, self.failed, self.expired = 0, 0, 0, 0
+
+    def __repr__(self):
+
+        return "<Executor(%d/%d workers, %d running)>" % (len(self.__threads), self.workers, len(self.__running))
+
+    def configure(self, workers = 4, timeout = 30.0):
+        """ py:function:: configure(self[, workers = 4[, timeout = 30.0]])
+
+            Changes the pool size and the default job timeout. Workers are started on demand. """
+
+        self.workers = max(1, workers)
+        self.timeout = timeout
+
+    def current_job(self):
+        """ py:function:: current_job(self)
+
+            :returns: The job the calling thread is running, or None outside of a worker.
+            :rtype: Job """
+
+        return getattr(self.__local, 'job', None)
+
+    def submit(self, function, args = (), key = None, timeout = None):
+        """ py:function:: submit(self, function[, args = ()[, key = None[, timeout = None]]])
+
+            Runs function(*args) on the pool. Must be called from the main loop.
+
+            :param key: Jobs with the same key run one after another; None runs unordered.
+            :param timeout: Seconds the job may run for; defaults to the pool timeout.
+            :returns: The submitted job.
+            :rtype: Job """
+
+        job = Job(function, args, key, timeout if timeout is not None else self.timeout)
+        self.submitted += 1
+
+        if key is not None:
+            if key in self.__pending:
+                self.__pending[key].append(job)
+                return job
+            self.__pending[key] = collections.deque()
+
+        self.__start(job)
+
+        return job
+
+    def __start(self, job):
+
+        alive = [thread for thread in self.__threads if thread.is_alive()]
+        if len(alive) < min(self.workers + self.__stuck, self.workers * 2):
+            thread = threading.Thread(target = self.__worker, name = "ashiema worker")
+            thread.daemon = True
+            thread.start()
+            alive.append(thread)
+        self.__threads = alive
+
+        self.__running.add(job)
+        self.__work.put(job)
+
+    def __worker(self):
+
+        while True:
+            job = self.__work.get()
+            if job is None:
+                return
+            job.started = monotonic()
+            self.__local.job = job
+            try:
+                job.function(*job.args)
+            except:
+                job.error = traceback.format_exc(4)
+            finally:
+                self.__local.job = None
+            self.__notify(self.__finish, job)
+
+    def __finish(self, job):
+        """ py:function:: __finish(self, job)
+
+            Called on the main loop once a job has returned. """
+
+        self.__running.discard(job)
+
+        if job.error is not None:
+            self.failed += 1
+            [self.log.error(trace) for trace in job.error.split('\n')]
+        else:
+            self.completed += 1
+
+        if job.expired:
+            self.__stuck -= 1
+            self.log.info("[Executor] %r finished %.2fs after it was abandoned." % (job, monotonic() - job.started - job.timeout))
+            return
+
+        self.__release(job)
+
+    def __release(self, job):
+
+        if job.key is None:
+            return
+
+        waiting = self.__pending.get(job.key)
+        if waiting:
+            self.__start(waiting.popleft())
+        else:
+            self.__pending.pop(job.key, None)
+
+    def check_timeouts(self):
+        """ py:function:: check_timeouts(self)
+
+            Abandons every running job that is past its deadline. Called from the main loop. """
+
+        now = monotonic()
+        for job in list(self.__running):
+            deadline = job.get_deadline()
+            if job.expired or deadline is None or now < deadline:
+                continue
+            job.expired = True
+            self.expired += 1
+            self.__stuck += 1
+            self.__running.discard(job)
+            self.log.warning("[Executor] %r timed out after %.2fs; abandoning it." % (job, job.timeout))
+            self.__release(job)
+
+    def next_timeout(self):
+        """ py:function:: next_timeout(self)
+
+            :returns: Seconds until the next running job times out, or None.
+            :rtype: float """
+
+        deadlines = [job.get_deadline() for job in self.__running]
+        deadlines = [deadline for deadline in deadlines if deadline is not None]
+        if not deadlines:
+            return None
+
+        return max(0, min(deadlines) - monotonic())
+
+    def get_stats(self):
+        """ py:function:: get_stats(self)
+
+            :returns: Pool size and counts of running, waiting, finished and abandoned jobs.
+            :rtype: dict """
+
+        return {
+            'workers'       : len(self.__threads),
+            'running'       : len(self.__running),
+            'waiting'       : sum(len(waiting) for waiting in self.__pending.values()) + self.__work.qsize(),
+            'submitted'     : self.submitted,
+            'completed'     : self.completed,
+            'failed'        : self.failed,
+            'expired'       : self.expired
+        }
+
+    def shutdown(self, wait = 1.0):
+        """ py:function:: shutdown(self[, wait = 1.0])
+
+            Asks every worker to exit once it is idle, and gives them +wait+ seconds to do so.
+            Waiting jobs are dropped. """
+
+        self.__pending.clear()
+        for thread in self.__threads:
+            self.__work.put(None)
+        deadline = monotonic() + wait
+        for thread in self.__threads:
+            thread.join(max(0, deadline - monotonic()))
+        self.__threads = []
@@ -70,6 +70,15 @@ class HelpFactory(object):
     def deregister(self, plugin):
 
         del self._help[plugin]
+
+    def get_entry(self, command):
+        """ returns the help entry describing +command+ in any plugin, or None. """
+
+        for plugin, help in self._help.iteritems():
+            if command in help:
+                return help[command]
+
+        return None
     
     def getHelpForPlugin(self, plugin):
 
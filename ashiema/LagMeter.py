@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import collections, itertools
+from util import monotonic
+
+""" module:: LagMeter
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Contains the LagMeter class, which times PING round trips to the server. """
+
+class LagMeter(object):
+    """ py:class:: LagMeter([interval = 30.0[, timeout = 90.0[, samples = 100]]])
+
+        Times the round trip of PINGs the bot sends on its own. Each PING carries a token made
+        from a counter and the time it was sent, and is matched to the PONG that echoes the
+        token back. The last +samples+ round trips are kept for the statistics and histogram.
+
+        A PING that has not been answered after +timeout+ seconds means the connection is dead,
+        even if the socket looks fine (ie. the other end of a half-open TCP connection is gone). """
+
+    # upper bounds of the histogram buckets, in milliseconds.
+    BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    # PING tokens start with this, so they are not confused with anything else.
+    PREFIX = 'ashiema-lag-'
+
+    def __init__(self, interval = 30.0, timeout = 90.0, samples = 100):
+
+        self.interval = interval
+        self.timeout = timeout
+
+        self.__counter = itertools.count(1)
+        # token -> time sent, oldest first.
+        self.__waiting = collections.OrderedDict()
+        self.__samples = collections.deque(maxlen = samples)
+        self.__last = None
+
+        self.sent, self.received, self.lost = 0, 0, 0
+
+    def __repr__(self):
+
+        lag = self.get_lag()
+
+        return "<LagMeter(%s)>" % ("%.3fs" % (lag) if lag is not None else "no samples")
+
+    def configure(self, interval = 30.0, timeout = 90.0):
+        """ py:function:: configure(self[, interval = 30.0[, timeout = 90.0]])
+
+            Changes how often the server is PINGed and how long a PONG may take. An interval of
+            0 turns the meter off. """
+
+        self.interval = interval
+        self.timeout = max(timeout, interval)
+
+    def probe(self, now = None):
+        """ py:function:: probe(self[, now = None])
+
+            Starts timing a new round trip.
+
+            :returns: The token to send, ie. `PING :token`.
+            :rtype: str """
+
+        now = now if now is not None else monotonic()
+        token = "%s%d-%.3f" % (LagMeter.PREFIX, next(self.__counter), now)
+
+        self.__waiting[token] = now
+        self.sent += 1
+
+        return token
+
+    def pong(self, token, now = None):
+        """ py:function:: pong(self, token[, now = None])
+
+            Records the PONG for +token+. PINGs sent before it that are still waiting will not
+            be answered any more, since the server answers in order.
+
+            :returns: The round trip time in seconds, or None if +token+ is not one of ours.
+            :rtype: float """
+
+        sent = self.__waiting.get(token)
+        if sent is None:
+            return None
+
+        now = now if now is not None else monotonic()
+        while self.__waiting:
+            if self.__waiting.popitem(last = False)[0] == token:
+                break
+            self.lost += 1
+
+        rtt = now - sent
+        self.__samples.append(rtt)
+        self.__last = rtt
+        self.received += 1
+
+        return rtt
+
+    def get_waiting(self, now = None):
+        """ py:function:: get_waiting(self[, now = None])
+
+            :returns: Seconds the oldest unanswered PING has been waiting for, or 0.
+            :rtype: float """
+
+        if not self.__waiting:
+            return 0.0
+
+        now = now if now is not None else monotonic()
+
+        return now - next(self.__waiting.itervalues())
+
+    def is_dead(self, now = None):
+        """ py:function:: is_dead(self[, now = None])
+
+            :returns: Whether a PING has gone unanswered for longer than the timeout.
+            :rtype: bool """
+
+        return self.interval > 0 and self.get_waiting(now) > self.timeout
+
+    def get_lag(self, now = None):
+        """ py:function:: get_lag(self[, now = None])
+
+            :returns: The current lag in seconds: the last round trip, or how long the
+                      outstanding PING has been waiting if that is longer. None before the
+                      first PONG.
+            :rtype: float """
+
+        waiting = self.get_waiting(now)
+        if self.__last is None:
+            return waiting or None
+
+        return max(self.__last, waiting)
+
+    def get_histogram(self):
+        """ py:function:: get_histogram(self)
+
+            :returns: (upper bound in milliseconds, count) pairs for the kept round trips; the
+                      last bound is None, for everything slower than the others.
+            :rtype: list of tuple """
+
+        counts = [0] * (len(LagMeter.BUCKETS) + 1)
+        for rtt in self.__samples:
+            index = 0
+            while index < len(LagMeter.BUCKETS) and rtt * 1000 > LagMeter.BUCKETS[index]:
+                index += 1
+            counts[index] += 1
+
+        return zip(list(LagMeter.BUCKETS) + [None], counts)
+
+    def get_stats(self):
+        """ py:function:: get_stats(self)
+
+            :returns: Current lag, minimum, average, median, 90th percentile and maximum round
+                      trip of the kept samples, and counts of PINGs sent, answered and lost.
+            :rtype: dict """
+
+        samples = sorted(self.__samples)
+        percentile = lambda fraction: samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else None
+
+        return {
+            'lag'       : self.get_lag(),
+            'min'       : samples[0] if samples else None,
+            'avg'       : sum(samples) / len(samples) if samples else None,
+            'p50'       : percentile(0.5),
+            'p90'       : percentile(0.9),
+            'max'       : samples[-1] if samples else None,
+            'samples'   : len(samples),
+            'waiting'   : len(self.__waiting),
+            'sent'      : self.sent,
+            'received'  : self.received,
+            'lost'      : self.lost
+        }
+
+    def clear(self):
+        """ py:function:: clear(self)
+
+            Forgets the PINGs that are waiting, when the connection is dropped. The samples are
+            kept. """
+
+        self.__waiting.clear()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import collections, logging
+
+""" module:: LineBuffer
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Contains the LineBuffer class, which frames inbound data into complete lines. """
+
+class LineBuffer(object):
+    """ py:class:: LineBuffer([size = 16384[, max_size = 65536]])
+
+        Frames a byte stream into lines. Data is received straight into a preallocated bytearray
+        with recv_into(), line endings are searched for in place, and only complete lines are
+        handed out. The unfinished tail is moved to the front of the buffer when the free space
+        runs out, so the buffer is reused for the lifetime of the connection. """
+
+    def __init__(self, size = 16384, max_size = 65536):
+        """ py:function:: __init__(self[, size = 16384[, max_size = 65536]])
+
+            :param size: Initial size of the buffer, in bytes.
+            :type size: int
+            :param max_size: Size the buffer may grow to if a single line does not fit.
+            :type max_size: int """
+
+        self.log = logging.getLogger('ashiema')
+
+        self.__max_size = max(size, max_size)
+        # complete lines taken out of a full buffer by feed(), for lines() to hand out first.
+        self.__ready = collections.deque()
+        self.__allocate(size)
+
+    def __repr__(self):
+
+        return "<LineBuffer(%d/%d bytes)>" % (self.__end - self.__start, len(self.__buffer))
+
+    def __len__(self):
+
+        return self.__end - self.__start
+
+    def __allocate(self, size):
+
+        self.__buffer = bytearray(size)
+        self.__view = memoryview(self.__buffer)
+        self.__start, self.__end = 0, 0
+        self.__discarding = False
+
+    def __make_room(self):
+        """ py:function:: __make_room(self)
+
+            Makes sure there is free space after the buffered data. Complete lines are taken out
+            first, then the partial line is moved to the front, then the buffer is grown. A line
+            that does not fit even in a buffer of the maximum size is thrown away, up to and
+            including its line ending. """
+
+        if self.__end < len(self.__buffer):
+            return
+
+        # feed() copies in more than one line at a time, without lines() running in between.
+        self.__ready.extend(self.__split())
+        if self.__start == self.__end:
+            self.__start, self.__end = 0, 0
+            return
+
+        pending = self.__end - self.__start
+        if self.__start > 0:
+            self.__buffer[0:pending] = self.__view[self.__start:self.__end]
+            self.__start, self.__end = 0, pending
+            return
+
+        if len(self.__buffer) < self.__max_size:
+            grown = bytearray(min(len(self.__buffer) * 2, self.__max_size))
+            grown[0:pending] = self.__view[0:pending]
+            self.__buffer, self.__view = grown, memoryview(grown)
+            return
+
+        if not self.__discarding:
+            self.log.warning("Discarding an overlong line (more than %d bytes)." % (pending))
+        self.__start, self.__end = 0, 0
+        self.__discarding = True
+
+    def recv_into(self, sock):
+        """ py:function:: recv_into(self, sock)
+
+            Reads as much as fits from +sock+ directly into the free space of the buffer.
+
+            :param sock: Socket to read from.
+            :type sock: socket
+            :returns: Number of bytes read; 0 means the peer closed the connection.
+            :rtype: int """
+
+        self.__make_room()
+
+        count = sock.recv_into(self.__view[self.__end:], len(self.__buffer) - self.__end)
+        self.__end += count
+
+        return count
+
+    def feed(self, data):
+        """ py:function:: feed(self, data)
+
+            Copies +data+ into the buffer, for sources that can not be read with recv_into().
+
+            :param data: Raw data to frame.
+            :type data: str """
+
+        offset = 0
+        while offset < len(data):
+            self.__make_room()
+            count = min(len(data) - offset, len(self.__buffer) - self.__end)
+            self.__buffer[self.__end:self.__end + count] = data[offset:offset + count]
+            self.__end += count
+            offset += count
+
+    def lines(self):
+        """ py:function:: lines(self)
+
+            Yields every complete line in the buffer, without its line ending, and consumes it.
+            Lines ending in a bare \\n are accepted as well as \\r\\n; empty lines are skipped.
+
+            :returns: Generator of complete lines.
+            :rtype: generator of str """
+
+        while self.__ready:
+            yield self.__ready.popleft()
+
+        for line in self.__split():
+            yield line
+
+        if self.__start == self.__end:
+            self.__start, self.__end = 0, 0
+
+    def __split(self):
+
+        while self.__start < self.__end:
+            index = self.__buffer.find('\n', self.__start, self.__end)
+            if index == -1:
+                break
+            if self.__discarding:
+                self.__start, self.__discarding = index + 1, False
+                continue
+            end = index
+            if end > self.__start and self.__buffer[end - 1] == 13:
+                end -= 1
+            start, self.__start = self.__start, index + 1
+            if end > start:
+                yield self.__view[start:end].tobytes()
+
+    def get_pending(self):
+        """ py:function:: get_pending(self)
+
+            :returns: The unfinished line that is still waiting for its line ending.
+            :rtype: str """
+
+        return self.__view[self.__start:self.__end].tobytes()
+
+    def clear(self):
+        """ py:function:: clear(self)
+
+            Throws away everything in the buffer. """
+
+        self.__start, self.__end = 0, 0
+        self.__discarding = False
+        self.__ready.clear()
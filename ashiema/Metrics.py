@@ -0,0 +1,402 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import threading, bisect
+
+""" module:: Metrics
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Counters, gauges and histograms that the core and plugins record into. """
+
+class Metrics(object):
+    """ py:class:: Metrics()
+
+        The registry every metric is kept in. Metrics are created by name and handed out again
+        when the same name is asked for, so a plugin that is reloaded keeps counting where it
+        left off:
+
+            lines = Metrics.get_instance().counter('ashiema_lines_received_total', 'Lines received.')
+            lines.inc()
+
+        A metric with label names keeps one value per combination of label values;
+        labels(*values) returns that value, which can be kept around so that the lookup is
+        only done once. Every value has a lock of its own and can be updated from any thread. """
+
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+
+        if Metrics.__instance is None:
+            return Metrics()
+        else:
+            return Metrics.__instance
+
+    def __init__(self):
+
+        Metrics.__instance = self
+
+        self.__metrics = {}
+        self.__lock = threading.Lock()
+
+    def __repr__(self):
+
+        return "<Metrics(%d metrics)>" % (len(self.__metrics))
+
+    def __register(self, kind, name, doc, labels, **kwargs):
+
+        with self.__lock:
+            metric = self.__metrics.get(name)
+            if metric is None:
+                metric = self.__metrics[name] = kind(name, doc, labels, **kwargs)
+            elif type(metric) is not kind or metric.label_names != tuple(labels):
+                raise MetricsException("Metric %s already exists as a %s with labels %r." % (
+                    name, metric.kind, metric.label_names))
+
+        return metric
+
+    def counter(self, name, doc = '', labels = ()):
+        """ py:function:: counter(self, name[, doc = ''[, labels = ()]])
+
+            :returns: The counter called +name+, which is created if it does not exist yet.
+            :rtype: Counter """
+
+        return self.__register(Counter, name, doc, labels)
+
+    def gauge(self, name, doc = '', labels = ()):
+        """ py:function:: gauge(self, name[, doc = ''[, labels = ()]])
+
+            :returns: The gauge called +name+, which is created if it does not exist yet.
+            :rtype: Gauge """
+
+        return self.__register(Gauge, name, doc, labels)
+
+    def histogram(self, name, doc = '', labels = (), buckets = None):
+        """ py:function:: histogram(self, name[, doc = ''[, labels = ()[, buckets = None]]])
+
+            :returns: The histogram called +name+, which is created if it does not exist yet,
+                      with the upper +buckets+ bounds (Histogram.BUCKETS by default).
+            :rtype: Histogram """
+
+        return self.__register(Histogram, name, doc, labels, buckets = buckets)
+
+    def get(self, name):
+        """ py:function:: get(self, name)
+
+            :returns: The metric called +name+, or None.
+            :rtype: Metric """
+
+        return self.__metrics.get(name)
+
+    def get_metrics(self):
+        """ py:function:: get_metrics(self)
+
+            :returns: Every metric, by name.
+            :rtype: list """
+
+        with self.__lock:
+            return [self.__metrics[name] for name in sorted(self.__metrics)]
+
+    def collect(self, prefix = ''):
+        """ py:function:: collect(self[, prefix = ''])
+
+            :returns: (name, labels, value) for every value of every metric whose name starts
+                      with +prefix+; histograms give one sample per bucket, with the label `le`,
+                      and a _sum and a _count sample, as in Prometheus.
+            :rtype: list of tuple """
+
+        samples = []
+        for metric in self.get_metrics():
+            if metric.name.startswith(prefix):
+                samples.extend(metric.collect())
+
+        return samples
+
+    def format(self, prefix = ''):
+        """ py:function:: format(self[, prefix = ''])
+
+            :returns: The metrics in the Prometheus text format.
+            :rtype: str """
+
+        lines = []
+        for metric in self.get_metrics():
+            if not metric.name.startswith(prefix):
+                continue
+            if metric.doc:
+                lines.append("# HELP %s %s" % (metric.name, metric.doc))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            lines.extend("%s%s %s" % (name, format_labels(labels), format_value(value)) for name, labels, value in metric.collect())
+
+        return '\n'.join(lines) + '\n'
+
+def format_labels(labels):
+
+    if not labels:
+        return ''
+
+    return '{%s}' % (','.join('%s="%s"' % (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels))
+
+def format_value(value):
+
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+
+    return repr(value)
+
+class Metric(object):
+    """ py:class:: Metric(name, doc, labels)
+
+        Base of the metric types: keeps a value for every combination of label values. """
+
+    kind = None
+
+    def __init__(self, name, doc = '', labels = ()):
+
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+
+        self.__values = {}
+        self.__lock = threading.Lock()
+        # the only value of a metric without labels.
+        self._value = self.labels() if not self.label_names else None
+
+    def __repr__(self):
+
+        return "<%s(%s, %d values)>" % (self.__class__.__name__, self.name, len(self.__values))
+
+    def _new_value(self):
+
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """ py:function:: labels(self, *values)
+
+            :returns: The value kept for these label values, in the order of the label names.
+                      It is created if it does not exist yet. """
+
+        if len(values) != len(self.label_names):
+            raise MetricsException("Metric %s takes %d label value(s), got %d." % (self.name, len(self.label_names), len(values)))
+
+        key = tuple(map(str, values))
+        value = self.__values.get(key)
+        if value is None:
+            with self.__lock:
+                value = self.__values.setdefault(key, self._new_value())
+
+        return value
+
+    def remove(self, *values):
+        """ py:function:: remove(self, *values)
+
+            Forgets the value kept for these label values. """
+
+        with self.__lock:
+            self.__values.pop(tuple(map(str, values)), None)
+
+    def get_values(self):
+        """ py:function:: get_values(self)
+
+            :returns: (labels, value) pairs, where labels is a tuple of (name, value) pairs.
+            :rtype: list of tuple """
+
+        with self.__lock:
+            values = sorted(self.__values.items())
+
+        return [(tuple(zip(self.label_names, key)), value) for key, value in values]
+
+    def collect(self):
+
+        return [(self.name, labels, value.get()) for labels, value in self.get_values()]
+
+class CounterValue(object):
+
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount = 1):
+
+        with self.lock:
+            self.value += amount
+
+    def get(self):
+
+        return self.value
+
+class Counter(Metric):
+    """ py:class:: Counter(name[, doc = ''[, labels = ()]])
+
+        A count that only goes up, ie. lines received. """
+
+    kind = 'counter'
+
+    def _new_value(self):
+
+        return CounterValue()
+
+    def inc(self, amount = 1):
+
+        self._value.inc(amount)
+
+    def get(self):
+
+        return self._value.get()
+
+class GaugeValue(object):
+
+    __slots__ = ('value', 'function', 'lock')
+
+    def __init__(self):
+
+        self.value = 0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def set(self, value):
+
+        self.value = value
+
+    def inc(self, amount = 1):
+
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount = 1):
+
+        with self.lock:
+            self.value -= amount
+
+    def set_function(self, function):
+        """ reads the value from +function+() whenever it is collected, instead of keeping it. """
+
+        self.function = function
+
+    def get(self):
+
+        function = self.function
+        if function is None:
+            return self.value
+        try: value = function()
+        except: value = None
+
+        return value if value is not None else float('nan')
+
+class Gauge(Metric):
+    """ py:class:: Gauge(name[, doc = ''[, labels = ()]])
+
+        A value that goes up and down, ie. the depth of the send queue. A gauge can read its
+        value from a function when it is collected, so that nothing has to be recorded while
+        the bot runs. """
+
+    kind = 'gauge'
+
+    def _new_value(self):
+
+        return GaugeValue()
+
+    def set(self, value):
+
+        self._value.set(value)
+
+    def inc(self, amount = 1):
+
+        self._value.inc(amount)
+
+    def dec(self, amount = 1):
+
+        self._value.dec(amount)
+
+    def set_function(self, function):
+
+        self._value.set_function(function)
+
+    def get(self):
+
+        return self._value.get()
+
+class HistogramValue(object):
+
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds):
+
+        self.bounds = bounds
+        # one count per bucket, and one for everything above the last bound.
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def get(self):
+        """ returns the count of every bucket (not cumulative), the sum and the count. """
+
+        with self.lock:
+            counts, total = list(self.counts), self.sum
+
+        return counts, total, sum(counts)
+
+class Histogram(Metric):
+    """ py:class:: Histogram(name[, doc = ''[, labels = ()[, buckets = None]]])
+
+        Counts observations (ie. seconds a callback took) in buckets with fixed upper bounds. """
+
+    kind = 'histogram'
+
+    # upper bounds in seconds, for timings.
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, doc = '', labels = (), buckets = None):
+
+        self.buckets = tuple(sorted(buckets if buckets is not None else Histogram.BUCKETS))
+
+        Metric.__init__(self, name, doc, labels)
+
+    def _new_value(self):
+
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+
+        self._value.observe(value)
+
+    def get(self):
+
+        return self._value.get()
+
+    def collect(self):
+
+        samples = []
+        for labels, value in self.get_values():
+            counts, total, count = value.get()
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                samples.append((self.name + '_bucket', labels + (('le', format_value(float(bound))),), cumulative))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, count))
+
+        return samples
+
+class MetricsException(Exception):
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
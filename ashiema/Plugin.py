@@ -8,6 +8,8 @@
 import logging, util, os, errno, multiprocessing
 from Connection import Connection
 from EventHandler import EventHandler
+from CommandRouter import CommandRouter
+from Metrics import Metrics
 from PluginLoader import PluginLoader
 from util import Configuration
 from util.Configuration import Configuration, ConfigurationSection
@@ -26,6 +28,10 @@ class Plugin(object):
         self.needs_dir = needs_dir
 
         self.scheduler = self.connection.get_scheduler()
+
+        # metrics recorded by plugins carry a `plugin` label with self.name.
+        self.metrics = Metrics.get_instance()
+        self.__commands = self.metrics.gauge('ashiema_plugin_commands', 'Commands the plugin has registered.', ('plugin',)).labels(self.name)
         
         self.logger = logging.getLogger('ashiema')
 
@@ -77,6 +83,34 @@ class Plugin(object):
         """ returns the eventhandler object """
         
         return self.eventhandler
+
+    def register_command(self, command, callback, context = None):
+        """ routes +command+ and the aliases listed for it in __help__ to +callback+. the context
+            is taken from the help entry unless +context+ is given. """
+
+        CommandRouter.get_instance().register(command, callback, context)
+        self.__commands.inc()
+
+    def deregister_command(self, command):
+        """ removes +command+ and its aliases from the command router. """
+
+        CommandRouter.get_instance().deregister(command)
+        self.__commands.dec()
+
+    def is_command(self, data):
+        """ returns whether or not the message in +data+ starts with a routed command. """
+
+        return CommandRouter.get_instance().is_command(data)
+
+    def watch_fd(self, fileobj, callback):
+        """ wakes the main loop and calls +callback+(fileobj, events) whenever +fileobj+ becomes readable. """
+
+        self.connection.get_event_loop().register(fileobj, callback)
+
+    def unwatch_fd(self, fileobj):
+        """ stops watching +fileobj+. """
+
+        self.connection.get_event_loop().unregister(fileobj)
     
     def get_plugin(self, plugin):
         """ searches for +plugin+ in the plugin loader and returns it if available. """
@@ -9,6 +9,8 @@ import imp, util, os, logging, traceback, collections
 from imp import load_source
 from EventHandler import EventHandler
 from HelpFactory import HelpFactory, Contexts
+from Metrics import Metrics
+from util import monotonic
 from util.Configuration import Configuration
 
 class PluginLoader(object):
@@ -40,6 +42,12 @@ class PluginLoader(object):
 
         self._loaded = False
 
+        # set up metrics; plugins are labelled with their Plugin.name, ie. their class name.
+        metrics = Metrics.get_instance()
+        self.__load_seconds = metrics.gauge('ashiema_plugin_load_seconds', 'Time the plugin took to initialise when it was last loaded.', ('plugin',))
+        self.__load_failures = metrics.counter('ashiema_plugin_load_failures_total', 'Times the plugin failed to initialise.', ('plugin',))
+        metrics.gauge('ashiema_plugins_loaded', 'Plugins that are loaded.').set_function(lambda: len(getattr(self, 'loaded', ())))
+
         # plugin list and listing type
         self._list_type = Configuration.get_instance().get_section('plugins').get_string('list-type', 'blacklist').lower()
         self._list = Configuration.get_instance().get_section('plugins').get_string('list', '').split(',') or []
@@ -47,6 +55,10 @@ class PluginLoader(object):
     def __call__(self):
 
         return self.loaded
+
+    def is_loaded(self):
+
+        return self._loaded
     
     def __getitem__(self, plugin):
 
@@ -125,13 +137,16 @@ class PluginLoader(object):
                     event()
             # initialise plugins
             for plugin, data in self.container.iteritems():
+                start = monotonic()
                 try:
                     self.loaded.update(
                         {
                             plugin : data['main']()
                         }
                     )
+                    self.__load_seconds.labels(self.loaded[plugin].name).set(monotonic() - start)
                 except:
+                    self.__load_failures.labels(data['main'].__name__).inc()
                     self.log.info('an error has occurred in %s (%s):' % (plugin, data['version']))
                     [self.log.error(trace) for trace in traceback.format_exc(4).split('\n')]
                     unload.append(plugin)
@@ -166,4 +181,5 @@ class PluginLoader(object):
             self.container.clear()
             # delete containers
             del self.loaded, self.container
-        except: pass
\ No newline at end of file
+        except: pass
+        self._loaded = False
\ No newline at end of file
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import logging
+import Connection, EventHandler, CommandRouter, HelpFactory
+from util import monotonic
+
+""" module:: Replay
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Feeds captured server traffic through the bot as fast as it can and times it. """
+
+class NullSocket(object):
+    """ py:class:: NullSocket()
+
+        Stands in for the server socket during a replay; counts what is sent and throws it away. """
+
+    def __init__(self):
+
+        self.lines, self.bytes = 0, 0
+
+    def sendall(self, data):
+
+        self.lines += data.count('\n')
+        self.bytes += len(data)
+
+    def settimeout(self, timeout):
+
+        pass
+
+    def close(self):
+
+        pass
+
+class Timings(object):
+    """ py:class:: Timings()
+
+        Adds up the time spent in events and plugin callbacks; see EventHandler.set_timer(). """
+
+    def __init__(self):
+
+        # (kind, name) -> [calls, seconds]
+        self.__totals = {}
+
+    def add(self, kind, name, seconds):
+
+        total = self.__totals.get((kind, name))
+        if total is None:
+            total = self.__totals[(kind, name)] = [0, 0.0]
+        total[0] += 1
+        total[1] += seconds
+
+    def get_totals(self, kind):
+        """ py:function:: get_totals(self, kind)
+
+            :returns: (name, calls, seconds) for every event or plugin, slowest first.
+            :rtype: list of tuple """
+
+        totals = [(name, calls, seconds) for (other, name), (calls, seconds) in self.__totals.iteritems() if other == kind]
+
+        return sorted(totals, key = lambda total: total[2], reverse = True)
+
+class Replay(object):
+    """ py:class:: Replay(path)
+
+        Reads a capture written by Connection.set_capture() and feeds every line through
+        Tokener, EventHandler.map_events and the plugin callbacks, as fast as possible. The bot
+        is attached to a NullSocket and everything it queues is written out after each line,
+        without flood control, so the outbound line count is what the bot would have sent.
+
+        The timer has to be installed before plugins are loaded, so that their callbacks are
+        timed; see install(). Callbacks that are offloaded to the worker pool are timed only for
+        handing the call over, and lines they send are not counted.
+
+        The commands of the plugins in DISARMED (shutdown, restart, profile, ...) act on the
+        running bot, so they are taken out of the command router before the capture is played;
+        see disarm(). """
+
+    DISARMED = ('SystemPlugin',)
+
+    def __init__(self, path):
+
+        self.log = logging.getLogger('ashiema')
+
+        self.path = path
+        self.timings = Timings()
+        self.socket = NullSocket()
+
+        self.lines, self.seconds, self.span = 0, 0.0, 0.0
+
+    @staticmethod
+    def read_capture(path):
+        """ py:staticmethod:: read_capture(path)
+
+            :returns: (time received, line) for every line in a capture.
+            :rtype: list of tuple """
+
+        lines = []
+        with open(path, 'r') as capture:
+            for line in capture:
+                stamp, sep, line = line.rstrip('\r\n').partition(' ')
+                try: lines.append((float(stamp), line))
+                except ValueError:
+                    continue
+
+        return lines
+
+    def install(self):
+        """ py:function:: install(self)
+
+            Attaches the connection to the null socket and starts timing events and callbacks. """
+
+        Connection.Connection.get_instance().attach(self.socket)
+        EventHandler.EventHandler.get_instance().set_timer(self.timings)
+
+        return self
+
+    def disarm(self):
+        """ py:function:: disarm(self)
+
+            Removes the commands of the plugins in DISARMED; call it once plugins are loaded. """
+
+        router, helpfactory = CommandRouter.CommandRouter.get_instance(), HelpFactory.HelpFactory.get_instance()
+        for plugin in Replay.DISARMED:
+            for command in helpfactory._help.get(plugin, {}):
+                router.deregister(command)
+
+        return self
+
+    def run(self):
+        """ py:function:: run(self)
+
+            Replays the capture.
+
+            :returns: The report, see get_report().
+            :rtype: list of str """
+
+        captured = Replay.read_capture(self.path)
+        if not captured:
+            return ["%s holds no captured lines." % (self.path)]
+
+        connection = Connection.Connection.get_instance()
+        queue = connection.get_send_queue()
+        process_events = Connection.Tokener.process_events
+
+        start = monotonic()
+        for stamp, line in captured:
+            process_events(Connection.Tokener(line))
+            lines = queue.take_all()
+            if lines:
+                self.socket.sendall(''.join(entry[0] for entry in lines))
+        self.seconds = monotonic() - start
+
+        self.lines = len(captured)
+        self.span = captured[-1][0] - captured[0][0]
+
+        return self.get_report()
+
+    def get_report(self):
+        """ py:function:: get_report(self)
+
+            :returns: Lines of text: throughput, outbound lines, and the time spent per event
+                      and per plugin.
+            :rtype: list of str """
+
+        report = [
+            "Replayed %d lines from %s in %.3fs: %.0f lines/sec (captured over %.1fs)." % (
+                self.lines, self.path, self.seconds, self.lines / self.seconds if self.seconds else 0.0, self.span),
+            "Sent %d lines (%d bytes)." % (self.socket.lines, self.socket.bytes)
+        ]
+
+        for kind, title in (('event', 'Event'), ('plugin', 'Plugin')):
+            report.append("%-32s %10s %12s %10s" % (title, 'calls', 'total (ms)', 'avg (us)'))
+            for name, calls, seconds in self.timings.get_totals(kind):
+                report.append("%-32s %10d %12.1f %10.1f" % (name, calls, seconds * 1000, seconds * 1000000 / calls))
+
+        return report
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import sys, os, threading, collections, marshal, pstats, logging, traceback
+from contextlib import closing
+from util import monotonic
+
+""" module:: Sampler
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Contains the Sampler class, a sampling profiler that can be started at runtime. """
+
+class Sampler(object):
+    """ py:class:: Sampler([rate = 100])
+
+        Samples the stacks of every thread +rate+ times a second from a thread of its own, for
+        as long as start() is told to. Nothing is hooked into the interpreter, so the bot runs
+        at full speed whenever no sampler is running.
+
+        The samples are written as collapsed stacks (one `frame;frame;frame count` line per
+        distinct stack, the input format of flamegraph.pl) and as a pstats file, in which a
+        function's time is the number of samples it was seen in times the sampling interval.
+
+        Stacks of threads that are waiting (the main loop in select(), idle workers in
+        Condition.wait()) are counted as idle and left out of everything else, so the results
+        show what the threads did while they were running. """
+
+    # (module, function) of the frames a waiting thread is parked in; blocking calls into C
+    # have no frame of their own, so this is the innermost Python frame.
+    IDLE = frozenset([('threading', 'wait'), ('EventLoop', '__wait')])
+
+    def __init__(self, rate = 100):
+
+        self.log = logging.getLogger('ashiema')
+
+        self.rate = max(1, rate)
+
+        self.__thread = None
+        self.__stopped = threading.Event()
+
+        # collapsed stack -> samples
+        self.__stacks = collections.Counter()
+        # (filename, line, function) -> [samples on top of the stack, samples anywhere in it]
+        self.__functions = {}
+        # (caller, callee) -> samples
+        self.__calls = collections.Counter()
+
+        self.__threads = set()
+
+        # times the threads were sampled, stacks of running and waiting threads taken, and
+        # seconds it took.
+        self.samples, self.stacks, self.idle, self.seconds = 0, 0, 0, 0.0
+
+    def __repr__(self):
+
+        return "<Sampler(%d/s, %d samples)>" % (self.rate, self.samples)
+
+    def start(self, seconds, callback = None):
+        """ py:function:: start(self, seconds[, callback = None])
+
+            Starts sampling for +seconds+ seconds. +callback+ is called with the sampler, from
+            the sampling thread, once it is done. """
+
+        self.__thread = threading.Thread(target = self.__run, args = (seconds, callback), name = "ashiema sampler")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+        return self
+
+    def stop(self):
+        """ py:function:: stop(self)
+
+            Stops sampling early; the callback is still called. """
+
+        self.__stopped.set()
+
+    def __run(self, seconds, callback):
+
+        interval = 1.0 / self.rate
+        ident = threading.current_thread().ident
+        start = monotonic()
+        deadline = start + seconds
+
+        while not self.__stopped.is_set() and monotonic() < deadline:
+            names = dict((thread.ident, thread.name) for thread in threading.enumerate())
+            for thread, frame in sys._current_frames().items():
+                if thread != ident:
+                    self.__sample(names.get(thread, str(thread)), frame)
+            self.samples += 1
+            self.__stopped.wait(interval)
+
+        self.seconds = monotonic() - start
+
+        if callback is not None:
+            try: callback(self)
+            except:
+                [self.log.error(trace) for trace in traceback.format_exc(4).split('\n')]
+
+    def __sample(self, name, frame):
+
+        self.__threads.add(name)
+        code = frame.f_code
+        if (os.path.splitext(os.path.basename(code.co_filename))[0], code.co_name) in Sampler.IDLE:
+            self.idle += 1
+            return
+
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        stack.reverse()
+
+        self.__stacks[';'.join([name] + [Sampler.label(function) for function in stack])] += 1
+        self.stacks += 1
+
+        for function in set(stack):
+            counts = self.__functions.get(function)
+            if counts is None:
+                counts = self.__functions[function] = [0, 0]
+            counts[1] += 1
+        self.__functions[stack[-1]][0] += 1
+
+        for call in set(zip(stack, stack[1:])):
+            self.__calls[call] += 1
+
+    @staticmethod
+    def label(function):
+        """ py:staticmethod:: label(function)
+
+            :returns: `module:function:line` for a (filename, line, function) key.
+            :rtype: str """
+
+        filename, line, name = function
+
+        return "%s:%s:%d" % (os.path.splitext(os.path.basename(filename))[0], name, line)
+
+    def get_top(self, count = 10):
+        """ py:function:: get_top(self[, count = 10])
+
+            :returns: (function, stacks it was on top of, stacks it was anywhere in) for the
+                      +count+ functions that were on top of a stack most often. The function is a
+                      (filename, line, function) key. Compare the counts to the stacks
+                      attribute.
+            :rtype: list of tuple """
+
+        functions = sorted(self.__functions.iteritems(), key = lambda entry: entry[1], reverse = True)
+
+        return [(function, own, total) for function, (own, total) in functions[:count] if own > 0]
+
+    def get_threads(self):
+        """ py:function:: get_threads(self)
+
+            :returns: Number of threads that were sampled.
+            :rtype: int """
+
+        return len(self.__threads)
+
+    def write_collapsed(self, path):
+        """ py:function:: write_collapsed(self, path)
+
+            Writes the samples as collapsed stacks, ie. for `flamegraph.pl path > graph.svg`. """
+
+        with closing(open(path, 'w')) as collapsed:
+            for stack, samples in sorted(self.__stacks.iteritems()):
+                collapsed.write("%s %d\n" % (stack, samples))
+
+    def write_pstats(self, path):
+        """ py:function:: write_pstats(self, path)
+
+            Writes the samples in the format of cProfile's dump_stats(), to be read with
+            pstats.Stats(path). Call counts are sample counts. """
+
+        interval = 1.0 / self.rate
+        stats = {}
+        for function, (own, total) in self.__functions.iteritems():
+            stats[function] = (total, total, own * interval, total * interval, {})
+        for (caller, callee), samples in self.__calls.iteritems():
+            stats[callee][4][caller] = (samples, samples, 0.0, samples * interval)
+
+        with closing(open(path, 'wb')) as dump:
+            marshal.dump(stats, dump)
+
+    def write_summary(self, path, pstats_path, count = 40):
+        """ py:function:: write_summary(self, path, pstats_path[, count = 40])
+
+            Writes pstats' report of the +count+ functions with the most time of their own, read
+            from a file written by write_pstats(). """
+
+        with closing(open(path, 'w')) as summary:
+            summary.write("%d samples of %d thread(s) over %.1fs, %d/s; %d running and %d idle stack(s).\n\n" % (
+                self.samples, self.get_threads(), self.seconds, self.rate, self.stacks, self.idle))
+            if not self.stacks:
+                return
+            pstats.Stats(pstats_path, stream = summary).sort_stats('time').print_stats(count)
@@ -5,128 +5,257 @@
 #
 # An extended version of the license is included with this software in `ashiema.py`.
 
-import datetime, logging, traceback
+import datetime, logging, traceback, heapq, itertools
 from datetime import datetime, timedelta
+from util import monotonic
+from Metrics import Metrics
 
 class Scheduler(object):
+    """ Runs jobs after a delay, once or repeatedly. Jobs are kept in a heap ordered by their
+        deadline on the monotonic clock, so adding and removing a job is O(log n), a tick only
+        looks at the jobs that are due, and changes to the wall clock do not move any deadline.
+
+        Removed jobs are left in the heap and skipped when they reach the top; the heap is
+        rebuilt once more than half of it is stale. """
 
     __instance = None
-    
+
     @staticmethod
     def get_instance():
-    
+
         if Scheduler.__instance is None:
             return Scheduler()
         else:
             return Scheduler.__instance
 
     def __init__(self):
-    
+
         Scheduler.__instance = self
-        
+
         self.log = logging.getLogger('ashiema')
         self.__jobs = {}
+        # heap of [deadline, sequence, job] entries.
+        self.__heap = []
+        self.__counter = itertools.count()
+        self.__stale = 0
+
+        metrics = Metrics.get_instance()
+        runs = metrics.counter('ashiema_scheduler_runs_total', 'Scheduled job runs.', ('result',))
+        self.__runs_ok, self.__runs_failed = runs.labels('ok'), runs.labels('failed')
+        # how late jobs run after their deadline, ie. because the main loop was busy.
+        self.__lateness = metrics.histogram('ashiema_scheduler_lag_seconds', 'Time between the deadline of a job and its run.')
+        metrics.gauge('ashiema_scheduler_jobs', 'Scheduled jobs.').set_function(lambda: len(self.__jobs))
+
+    def __repr__(self):
+
+        return "<Scheduler(%d jobs)>" % (len(self.__jobs))
+
+    def __len__(self):
+
+        return len(self.__jobs)
+
+    def create_job(self, name, function, delta, recurring = False, coalesce = True):
 
-    def create_job(self, name, function, delta, recurring = False):
-    
         if name in self.__jobs:
             raise SchedulerException("Job already exists; remove it first.")
         if function is None:
             raise SchedulerException("Callback function is non-existent.")
         if not isinstance(delta, timedelta):
             raise SchedulerException("Argument 'delta' was not a timedelta instance.")
-        
-        job = SchedulerJob(name, function, delta, recurring)
+        if recurring and delta <= timedelta(0):
+            raise SchedulerException("Recurring jobs need a positive delta.")
+
+        job = SchedulerJob(name, function, delta, recurring, coalesce)
         self.add_job(job)
-        
+
         return job
-    
+
     def add_job(self, job):
-    
-        if job in self.__jobs:
+
+        if job.get_name() in self.__jobs:
             raise SchedulerException("Job already exists; remove it first.")
 
         job.begin_ticking()
 
         self.__jobs.update({ job.get_name() : job })
+        self.__push(job)
         self.log.debug("[Scheduler] Added job '%s'. Execution at %s." % (job.get_name(), str(job.get_eta())))
-    
-    def remove_job(self, name):
-    
+
+    def get_job(self, name):
+
+        return self.__jobs.get(name)
+
+    def remove_job(self, job):
+        """ removes a job, given either the job itself or its name. """
+
+        name = job.get_name() if isinstance(job, SchedulerJob) else job
+
         if not name in self.__jobs:
             raise SchedulerException("Job does not exist.")
-        
-        job = self.__jobs[name]
-        
-        if datetime.now() < job.get_eta():
+
+        job = self.__jobs.pop(name)
+
+        if monotonic() < job.get_deadline():
             self.log.debug("[Scheduler] Job '%s' is being removed before execution time!" % (name))
-        
-        self.__jobs.pop(name)
-        
+
+        self.__discard(job)
+
         self.log.debug("[Scheduler] Job '%s' has been terminated." % (name))
-    
+
+    def __push(self, job):
+
+        entry = [job.get_deadline(), next(self.__counter), job]
+        job._entry = entry
+        heapq.heappush(self.__heap, entry)
+
+    def __discard(self, job):
+
+        if job._entry is None:
+            return
+
+        job._entry[2] = None
+        job._entry = None
+        self.__stale += 1
+
+        if self.__stale > len(self.__heap) / 2:
+            self.__heap = [entry for entry in self.__heap if entry[2] is not None]
+            heapq.heapify(self.__heap)
+            self.__stale = 0
+
+    def __top(self):
+        """ returns the live entry with the earliest deadline, dropping stale ones on the way. """
+
+        while self.__heap and self.__heap[0][2] is None:
+            heapq.heappop(self.__heap)
+            self.__stale -= 1
+
+        return self.__heap[0] if self.__heap else None
+
+    def next_deadline(self):
+        """ returns the monotonic time the next job is due at, or None if there are no jobs. """
+
+        entry = self.__top()
+
+        return entry[0] if entry is not None else None
+
+    def time_until_next(self):
+        """ returns the number of seconds until the next job is due, or None if there are no jobs. """
+
+        deadline = self.next_deadline()
+        if deadline is None:
+            return None
+
+        return max(0, deadline - monotonic())
+
     def tick(self):
-    
-        now = datetime.now()
-        
-        for job in self.__jobs.values():
-            if job.is_ready(now):
-                try:
-                    job.execute()
-                    self.log.info("[Scheduler] Job '%s' has been executed successfully at %s." % (job.get_name(), str(now)))
-                except:
-                    self.log.warning("[Scheduler] Job '%s' did not successfully execute." % (job.get_name()))
-
-                if not job.is_recurring():
-                    self.remove_job(job.get_name())
-    
+
+        now = monotonic()
+        due = []
+
+        entry = self.__top()
+        while entry is not None and entry[0] <= now:
+            job = heapq.heappop(self.__heap)[2]
+            job._entry = None
+            due.append(job)
+            entry = self.__top()
+
+        for job in due:
+            # an earlier job in this tick may have removed this one.
+            if self.__jobs.get(job.get_name()) is not job:
+                continue
+            self.__lateness.observe(monotonic() - job.get_deadline())
+            try:
+                job.execute()
+                self.__runs_ok.inc()
+                self.log.info("[Scheduler] Job '%s' has been executed successfully at %s." % (job.get_name(), str(datetime.now())))
+            except:
+                self.__runs_failed.inc()
+                self.log.warning("[Scheduler] Job '%s' did not successfully execute." % (job.get_name()))
+                [self.log.debug(trace) for trace in traceback.format_exc(4).split('\n')]
+
+            if self.__jobs.get(job.get_name()) is not job:
+                continue
+            if job.is_recurring():
+                skipped = job.reschedule(now)
+                if skipped > 0:
+                    self.log.debug("[Scheduler] Job '%s' fell behind; coalesced %d missed run(s)." % (job.get_name(), skipped))
+                self.__push(job)
+            else:
+                self.__jobs.pop(job.get_name())
+                self.log.debug("[Scheduler] Job '%s' has been terminated." % (job.get_name()))
+
 class SchedulerJob(object):
 
-    def __init__(self, name, function, delta, recurring = False):
+    def __init__(self, name, function, delta, recurring = False, coalesce = True):
 
         self._scheduler = Scheduler.get_instance()
 
         self._name = name
         self._function = function
         self._delta = delta
+        self._interval = delta.days * 86400 + delta.seconds + delta.microseconds / 1000000.0
         self._recurring = recurring
-        
-        self._eta = delta
-    
+        # whether a recurring job that fell behind runs once and skips the runs it missed,
+        # or runs once per missed interval until it has caught up.
+        self._coalesce = coalesce
+
+        self._deadline = None
+        self._entry = None
+
+    def __repr__(self):
+
+        return "<SchedulerJob(%s)>" % (self._name)
+
     def get_name(self):
-    
+
         return self._name
-    
+
     def get_eta(self):
-    
-        return self._eta
-    
+        """ returns the wall clock time the job is due at, for display. """
+
+        return datetime.now() + timedelta(seconds = self._deadline - monotonic())
+
+    def get_deadline(self):
+        """ returns the monotonic time the job is due at. """
+
+        return self._deadline
+
     def is_recurring(self):
-    
+
         return self._recurring
-    
-    def is_ready(self, time):
-    
-        if time >= self._eta:
+
+    def is_ready(self, time = None):
+
+        if (time if time is not None else monotonic()) >= self._deadline:
             return True
         else:
             return False
-    
+
     def begin_ticking(self):
 
-        self._eta = datetime.now() + self._delta
-    
+        self._deadline = monotonic() + self._interval
+
+    def reschedule(self, now):
+        """ moves the deadline of a recurring job one interval on, or, if it fell behind and
+            coalesces, to the first interval after +now+. returns the number of skipped runs. """
+
+        self._deadline += self._interval
+        if not self._coalesce or self._deadline > now:
+            return 0
+
+        skipped = int((now - self._deadline) // self._interval) + 1
+        self._deadline += skipped * self._interval
+
+        return skipped
+
     def execute(self):
-    
+
         self._function()
-        
-        if self._recurring:
-            self._eta += self._delta
 
 class SchedulerException(Exception):
 
     def __init__(self, value):
         self.value = value
-    
+
     def __str__(self):
-        return repr(self.value)
\ No newline at end of file
+        return repr(self.value)
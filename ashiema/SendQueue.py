@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import collections
+from util import monotonic
+
+""" module:: SendQueue
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Contains the outbound line queue, its priority lanes and the token bucket that paces it. """
+
+class Priority(object):
+    """ py:class:: Priority
+
+        The lanes of the send queue, most urgent first. """
+
+    # keeps the connection alive: sent on the next write, even if that overdraws the bucket.
+    CRITICAL    = 0
+    # replies to users; the default.
+    INTERACTIVE = 1
+    # lookups and bulk output; only sent when nothing more urgent is waiting.
+    BULK        = 2
+
+    CRITICAL_COMMANDS = frozenset(['PONG', 'PING', 'PASS', 'CAP', 'AUTHENTICATE', 'NICK', 'USER', 'QUIT'])
+    BULK_COMMANDS = frozenset(['WHO', 'WHOIS', 'WHOWAS', 'NAMES', 'LIST', 'USERHOST', 'ISON'])
+
+    @staticmethod
+    def classify(line):
+        """ py:staticmethod:: classify(line)
+
+            :returns: The lane a line belongs in, judging by its command.
+            :rtype: int """
+
+        command = line.split(' ', 1)[0].upper()
+        if command in Priority.CRITICAL_COMMANDS:
+            return Priority.CRITICAL
+        elif command in Priority.BULK_COMMANDS:
+            return Priority.BULK
+
+        return Priority.INTERACTIVE
+
+class TokenBucket(object):
+    """ py:class:: TokenBucket(burst, rate)
+
+        A token bucket flood controller. The bucket holds at most +burst+ tokens and refills at
+        +rate+ tokens per second; every line that is sent costs one token. """
+
+    def __init__(self, burst, rate):
+        """ py:function:: __init__(self, burst, rate)
+
+            :param burst: Largest number of lines that may be sent back to back.
+            :type burst: int
+            :param rate: Number of lines per second that the bucket refills by.
+            :type rate: float """
+
+        self.burst = float(max(1, burst))
+        self.rate = float(rate) if rate > 0 else 1.0
+        self.tokens = self.burst
+        self.stamp = monotonic()
+
+    def __repr__(self):
+
+        return "<TokenBucket(%.2f/%d, %.2f/s)>" % (self.tokens, self.burst, self.rate)
+
+    def refill(self, now = None):
+        """ py:function:: refill(self[, now = None])
+
+            Adds the tokens that have accumulated since the last refill. """
+
+        now = monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def available(self, now = None):
+        """ py:function:: available(self[, now = None])
+
+            :returns: Number of whole tokens that can be spent right now.
+            :rtype: int """
+
+        self.refill(now)
+
+        return int(self.tokens)
+
+    def consume(self, count = 1, now = None):
+        """ py:function:: consume(self[, count = 1[, now = None]])
+
+            Spends +count+ tokens if they are available.
+
+            :returns: Whether or not the tokens were spent.
+            :rtype: bool """
+
+        self.refill(now)
+        if self.tokens < count:
+            return False
+        self.tokens -= count
+
+        return True
+
+    def spend(self, count = 1, now = None):
+        """ py:function:: spend(self[, count = 1[, now = None]])
+
+            Spends +count+ tokens whether or not they are available. The bucket may go into debt,
+            which later lines pay back by waiting. """
+
+        self.refill(now)
+        self.tokens -= count
+
+    def delay(self, count = 1, now = None):
+        """ py:function:: delay(self[, count = 1[, now = None]])
+
+            :returns: Number of seconds until +count+ tokens will be available.
+            :rtype: float """
+
+        self.refill(now)
+        if self.tokens >= count:
+            return 0
+
+        return (count - self.tokens) / self.rate
+
+class FairLane(object):
+    """ py:class:: FairLane([max_backlog = 50[, overflow = 'summarize']])
+
+        A lane of the send queue that keeps a queue per target (the channel or nick a PRIVMSG
+        or NOTICE is addressed to) and takes lines from the targets in turn, so one busy target
+        can not hold up the others. Lines without a target share a queue of their own.
+
+        A target may have at most +max_backlog+ lines waiting. Beyond that its oldest lines are
+        dropped; with +overflow+ set to 'summarize', the next line it sends is preceded by a
+        note saying how many lines were dropped. """
+
+    TARGETED_COMMANDS = frozenset(['PRIVMSG', 'NOTICE'])
+    # what may be done with lines beyond the backlog.
+    OVERFLOW = ('summarize', 'drop-oldest')
+
+    def __init__(self, max_backlog = 50, overflow = 'summarize'):
+
+        # target -> deque of (line, time queued, paced).
+        self.__queues = {}
+        # targets that have lines waiting, in the order they will be served.
+        self.__order = collections.deque()
+        # target -> [lines dropped, command, target as written] while a summary is owed.
+        self.__dropped = {}
+        self.__length = 0
+
+        self.max_backlog = max_backlog
+        self.overflow = overflow
+        self.dropped = 0
+
+    def __len__(self):
+
+        return self.__length
+
+    def __nonzero__(self):
+
+        return self.__length > 0
+
+    @staticmethod
+    def get_target(line):
+        """ py:staticmethod:: get_target(line)
+
+            :returns: The target of a PRIVMSG or NOTICE, folded to lower case, or None.
+            :rtype: str """
+
+        words = line.split(' ', 2)
+        if len(words) < 3 or words[0].upper() not in FairLane.TARGETED_COMMANDS:
+            return None
+
+        return words[1].lower()
+
+    def get_targets(self):
+        """ py:function:: get_targets(self)
+
+            :returns: Number of targets that have lines waiting.
+            :rtype: int """
+
+        return len(self.__order)
+
+    def get_oldest(self):
+        """ py:function:: get_oldest(self)
+
+            :returns: The time the longest waiting line was queued at, or None.
+            :rtype: float """
+
+        if not self.__queues:
+            return None
+
+        return min(queue[0][1] for queue in self.__queues.values())
+
+    def append(self, entry):
+        """ py:function:: append(self, entry)
+
+            Queues a (line, time queued, paced) entry behind the other lines for its target. """
+
+        target = FairLane.get_target(entry[0])
+        queue = self.__queues.get(target)
+        if queue is None:
+            queue = self.__queues[target] = collections.deque()
+            self.__order.append(target)
+
+        queue.append(entry)
+        self.__length += 1
+
+        if target is not None and self.max_backlog > 0 and len(queue) > self.max_backlog:
+            line = queue.popleft()[0]
+            self.__length -= 1
+            self.dropped += 1
+            if self.overflow == 'summarize':
+                owed = self.__dropped.setdefault(target, [0] + line.split(' ', 2)[0:2])
+                owed[0] += 1
+
+    def peek(self):
+        """ py:function:: peek(self)
+
+            :returns: The entry popleft() would return next, or None.
+            :rtype: tuple """
+
+        if not self.__order:
+            return None
+
+        target = self.__order[0]
+        if target in self.__dropped:
+            return self.__summary(target, self.__queues[target][0][1])
+
+        return self.__queues[target][0]
+
+    def popleft(self):
+        """ py:function:: popleft(self)
+
+            Removes and returns the next entry of the target whose turn it is, then moves on to
+            the next target. """
+
+        target = self.__order[0]
+        queue = self.__queues[target]
+
+        if target in self.__dropped:
+            entry = self.__summary(target, queue[0][1])
+            del self.__dropped[target]
+        else:
+            entry = queue.popleft()
+            self.__length -= 1
+
+        if queue:
+            self.__order.rotate(-1)
+        else:
+            self.__order.popleft()
+            del self.__queues[target]
+
+        return entry
+
+    def __summary(self, target, queued):
+
+        count, command, name = self.__dropped[target]
+
+        return ("%s %s :(%d line(s) dropped)\r\n" % (command, name, count), queued, False)
+
+    def clear(self):
+
+        self.__queues.clear()
+        self.__order.clear()
+        self.__dropped.clear()
+        self.__length = 0
+
+class SendQueue(object):
+    """ py:class:: SendQueue([burst = 10[, rate = 2.0[, query_rate = 1.0]]])
+
+        Holds encoded lines waiting to be written to the server and hands out as many of them at
+        once as the flood controller allows. Keeps track of how deep the queue is and how long
+        lines wait in it.
+
+        Lines wait in one of three lanes (see Priority). Critical lines are all handed out on
+        the next drain, even if the bucket has to go into debt for them; interactive lines get
+        the budget that is left; bulk lines only go out when no interactive line is waiting.
+        Lookups the bot makes on its own (push_query) travel in the bulk lane, are additionally
+        paced at +query_rate+ lines per second, and are not queued twice.
+
+        The interactive and bulk lanes are FairLanes, which share the budget between targets. """
+
+    def __init__(self, burst = 10, rate = 2.0, query_rate = 1.0):
+
+        self.bucket = TokenBucket(burst, rate)
+        self.query_bucket = TokenBucket(1, query_rate)
+        # (line, time queued, paced) entries, one lane per Priority.
+        self.__lanes = (collections.deque(), FairLane(), FairLane())
+        self.__pending_queries = set()
+
+        self.sent = 0
+        self.batches = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_depth = 0
+        self.queries_sent = 0
+        self.overdrawn = 0
+
+    def __repr__(self):
+
+        return "<SendQueue(%s lines, %r)>" % ('/'.join(str(len(lane)) for lane in self.__lanes), self.bucket)
+
+    def __len__(self):
+
+        return sum(len(lane) for lane in self.__lanes)
+
+    def set_limits(self, burst, rate):
+        """ py:function:: set_limits(self, burst, rate)
+
+            Replaces the flood controller with one using the given burst size and refill rate. """
+
+        self.bucket = TokenBucket(burst, rate)
+
+    def set_query_rate(self, rate):
+        """ py:function:: set_query_rate(self, rate)
+
+            Sets the number of lookups per second the bulk lane may send. """
+
+        self.query_bucket = TokenBucket(1, rate)
+
+    def set_backlog(self, max_backlog, overflow = 'summarize'):
+        """ py:function:: set_backlog(self, max_backlog[, overflow = 'summarize'])
+
+            Sets how many lines a single target may have waiting in a lane, and whether lines
+            dropped beyond that are summarized ('summarize') or silently dropped ('drop-oldest'). """
+
+        for lane in self.__lanes[Priority.INTERACTIVE:]:
+            lane.max_backlog, lane.overflow = max_backlog, overflow
+
+    def push(self, line, priority = None):
+        """ py:function:: push(self, line[, priority = None])
+
+            Appends an encoded line (including its line ending) to the queue.
+
+            :param priority: Lane to queue the line in; by default it is picked from the command.
+            :type priority: int """
+
+        if priority is None:
+            priority = Priority.classify(line)
+
+        self.__lanes[priority].append((line, monotonic(), False))
+        self.max_depth = max(self.max_depth, len(self))
+
+    def push_query(self, line):
+        """ py:function:: push_query(self, line)
+
+            Appends an encoded lookup to the bulk lane, unless the same line is already waiting
+            there.
+
+            :returns: Whether or not the line was queued.
+            :rtype: bool """
+
+        if line in self.__pending_queries:
+            return False
+
+        self.__lanes[Priority.BULK].append((line, monotonic(), True))
+        self.__pending_queries.add(line)
+        self.max_depth = max(self.max_depth, len(self))
+
+        return True
+
+    def clear(self):
+        """ py:function:: clear(self)
+
+            Throws away every queued line. """
+
+        for lane in self.__lanes:
+            lane.clear()
+        self.__pending_queries.clear()
+
+    def take_all(self):
+        """ py:function:: take_all(self)
+
+            Removes every queued line, most urgent lane first, without asking the flood
+            controller; used to carry the queue over a restart.
+
+            :returns: (line, priority, paced) entries, in the order they would have been sent.
+            :rtype: list of tuple """
+
+        entries = []
+        for priority, lane in enumerate(self.__lanes):
+            while lane:
+                line, queued, paced = lane.popleft()
+                entries.append((line, priority, paced))
+        self.__pending_queries.clear()
+
+        return entries
+
+    def __take(self, lane, now, lines):
+
+        line, queued, paced = lane.popleft()
+        if paced:
+            self.__pending_queries.discard(line)
+            self.queries_sent += 1
+        wait = now - queued
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        lines.append(line)
+
+        return paced
+
+    def drain(self):
+        """ py:function:: drain(self)
+
+            Removes as many lines from the front of the lanes as the flood controller currently
+            allows, most urgent lane first.
+
+            :returns: Lines that may be written to the server now.
+            :rtype: list """
+
+        critical, interactive, bulk = self.__lanes
+        if not critical and not interactive and not bulk:
+            return []
+
+        now = monotonic()
+        available = self.bucket.available(now)
+
+        lines = []
+        while critical:
+            self.__take(critical, now, lines)
+        if len(lines) > available:
+            self.overdrawn += len(lines) - available
+
+        while interactive and len(lines) < available:
+            self.__take(interactive, now, lines)
+
+        if not interactive:
+            queries = self.query_bucket.available(now)
+            while bulk and len(lines) < available:
+                if bulk.peek()[2] and queries < 1:
+                    break
+                if self.__take(bulk, now, lines):
+                    self.query_bucket.spend(1, now)
+                    queries -= 1
+
+        if lines:
+            self.bucket.spend(len(lines), now)
+            self.sent += len(lines)
+            self.batches += 1
+
+        return lines
+
+    def next_delay(self):
+        """ py:function:: next_delay(self)
+
+            :returns: Seconds until the next queued line may be sent, or None if the queue is empty.
+            :rtype: float """
+
+        critical, interactive, bulk = self.__lanes
+        if critical:
+            return 0
+        if interactive:
+            return self.bucket.delay(1)
+        if bulk:
+            if bulk.peek()[2]:
+                return max(self.bucket.delay(1), self.query_bucket.delay(1))
+            return self.bucket.delay(1)
+
+        return None
+
+    def get_stats(self):
+        """ py:function:: get_stats(self)
+
+            :returns: Queue depth per lane, counts of sent lines and batches, and time-in-queue
+                      figures.
+            :rtype: dict """
+
+        critical, interactive, bulk = self.__lanes
+        oldest = [critical[0][1]] if critical else []
+        oldest += [queued for queued in (interactive.get_oldest(), bulk.get_oldest()) if queued is not None]
+
+        return {
+            'depth'         : len(self),
+            'critical'      : len(critical),
+            'interactive'   : len(interactive),
+            'bulk'          : len(bulk),
+            'max_depth'     : self.max_depth,
+            'targets'       : interactive.get_targets() + bulk.get_targets(),
+            'dropped'       : interactive.dropped + bulk.dropped,
+            'sent'          : self.sent,
+            'batches'       : self.batches,
+            'queries_sent'  : self.queries_sent,
+            'overdrawn'     : self.overdrawn,
+            'avg_wait'      : (self.total_wait / self.sent) if self.sent else 0.0,
+            'max_wait'      : self.max_wait,
+            'oldest'        : monotonic() - min(oldest) if oldest else 0.0
+        }
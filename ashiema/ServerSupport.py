@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import logging, re
+import Connection, Structures
+
+""" module:: ServerSupport
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Contains the ServerSupport class, which holds what the server advertised in RPL_ISUPPORT. """
+
+class ServerSupport(object):
+    """ py:class:: ServerSupport()
+
+        The table of RPL_ISUPPORT (005) tokens the server has advertised, such as CASEMAPPING,
+        CHANTYPES, PREFIX, LINELEN and TARGMAX. Tokens are kept as the server sent them and read
+        through the accessors below, which fall back to the RFC 1459 defaults for tokens the
+        server did not send.
+
+        Tokens that change how names and modes are handled are passed on to Structures as soon
+        as they arrive. """
+
+    __instance = None
+
+    DEFAULTS = {
+        'CASEMAPPING'   : 'rfc1459',
+        'CHANTYPES'     : '#&',
+        'PREFIX'        : '(ov)@+',
+        'CHANMODES'     : 'beI,k,l,imnpst',
+        'LINELEN'       : '512',
+        'NICKLEN'       : '9'
+    }
+
+    @staticmethod
+    def get_instance():
+        """ py:staticmethod:: get_instance()
+
+            :returns: The ServerSupport instance, if it exists, or a new ServerSupport instance.
+            :rtype: ServerSupport """
+
+        if ServerSupport.__instance is None:
+            return ServerSupport()
+        else:
+            return ServerSupport.__instance
+
+    def __init__(self):
+
+        ServerSupport.__instance = self
+
+        self.log = logging.getLogger('ashiema')
+
+        self.__tokens = {}
+
+    def __repr__(self):
+
+        return "<ServerSupport(%d tokens)>" % (len(self.__tokens))
+
+    def __contains__(self, key):
+
+        return key.upper() in self.__tokens
+
+    def parse(self, data):
+        """ py:function:: parse(self, data)
+
+            Adds the tokens in an RPL_ISUPPORT line to the table. `-TOKEN` removes a token that
+            was advertised before.
+
+            :param data: Event data for a 005 line.
+            :type data: Tokener """
+
+        for token in data.message.to_s().partition(' :')[0].split():
+            key, sep, value = token.partition('=')
+            if key.startswith('-'):
+                self.__tokens.pop(key[1:].upper(), None)
+                self.__apply(key[1:].upper())
+                continue
+            # values may escape characters as \xHH.
+            value = re.sub(r'\\x([0-9A-Fa-f]{2})', lambda match: chr(int(match.group(1), 16)), value)
+            self.__tokens[key.upper()] = value if sep else True
+            self.__apply(key.upper())
+
+    def __apply(self, key):
+
+        if key == 'CASEMAPPING':
+            Structures.set_casemapping(self.get_casemapping())
+        elif key == 'CHANTYPES':
+            Structures.set_chantypes(self.get_chantypes())
+        elif key == 'PREFIX':
+            Structures.set_prefix(*self.get_prefix())
+        elif key == 'CHANMODES':
+            lists, always, when_set, none = self.get_chanmodes()
+            Structures.set_chanmodes(lists + always, when_set)
+
+    def clear(self):
+        """ py:function:: clear(self)
+
+            Forgets every token, before registering with a server again. """
+
+        self.__tokens.clear()
+        for key in ('CASEMAPPING', 'CHANTYPES', 'PREFIX', 'CHANMODES'):
+            self.__apply(key)
+
+    def get_tokens(self):
+        """ py:function:: get_tokens(self)
+
+            :returns: A copy of every token the server has advertised.
+            :rtype: dict """
+
+        return dict(self.__tokens)
+
+    def update(self, tokens):
+        """ py:function:: update(self, tokens)
+
+            Adds tokens that were advertised earlier, ie. before a restart.
+
+            :param tokens: Tokens as returned by get_tokens().
+            :type tokens: dict """
+
+        for key, value in tokens.iteritems():
+            self.__tokens[key.upper()] = value
+            self.__apply(key.upper())
+
+    def get(self, key, default = None):
+        """ py:function:: get(self, key[, default = None])
+
+            :returns: The value of a token, True for a token without a value, or +default+.
+            :rtype: str """
+
+        key = key.upper()
+
+        return self.__tokens.get(key, ServerSupport.DEFAULTS.get(key, default))
+
+    def get_int(self, key, default = None):
+        """ py:function:: get_int(self, key[, default = None])
+
+            :returns: The value of a numeric token, or +default+ if it is missing or empty.
+            :rtype: int """
+
+        try: return int(self.get(key))
+        except (TypeError, ValueError): return default
+
+    def get_casemapping(self):
+
+        return self.get('CASEMAPPING')
+
+    def get_chantypes(self):
+
+        return self.get('CHANTYPES') or ''
+
+    def get_prefix(self):
+        """ py:function:: get_prefix(self)
+
+            :returns: The membership modes and their prefixes, highest first, ie. ('ov', '@+').
+            :rtype: tuple """
+
+        match = re.match(r'^\((\w*)\)(\S*)$', self.get('PREFIX') or '')
+        if match is None or len(match.group(1)) != len(match.group(2)):
+            match = re.match(r'^\((\w*)\)(\S*)$', ServerSupport.DEFAULTS['PREFIX'])
+
+        return match.group(1), match.group(2)
+
+    def get_chanmodes(self):
+        """ py:function:: get_chanmodes(self)
+
+            :returns: The list modes, the modes that always take a parameter, the modes that take
+                      one only when set, and the modes that never take one.
+            :rtype: tuple """
+
+        groups = (self.get('CHANMODES') or '').split(',') + ['', '', '', '']
+
+        return tuple(groups[0:4])
+
+    def get_linelen(self):
+        """ py:function:: get_linelen(self)
+
+            :returns: Longest line the server accepts, in bytes, including the line ending.
+            :rtype: int """
+
+        return self.get_int('LINELEN', 512)
+
+    def get_targmax(self, command):
+        """ py:function:: get_targmax(self, command)
+
+            :returns: How many targets +command+ may be sent to at once: from TARGMAX, or from
+                      MAXTARGETS for PRIVMSG and NOTICE, or 1 if the server did not say. 0 means
+                      there is no limit.
+            :rtype: int """
+
+        command = command.upper()
+
+        targmax = self.get('TARGMAX')
+        if isinstance(targmax, str):
+            for entry in targmax.split(','):
+                name, sep, limit = entry.partition(':')
+                if name.upper() == command:
+                    return int(limit) if limit.isdigit() else 0
+
+        if command in ('PRIVMSG', 'NOTICE'):
+            return self.get_int('MAXTARGETS', 1)
+
+        return 1
+
+    def get_source_length(self):
+        """ py:function:: get_source_length(self)
+
+            :returns: Length of the `:nick!ident@host ` prefix the server puts in front of our
+                      lines when it relays them. The longest possible host is assumed until the
+                      bot has seen its own.
+            :rtype: int """
+
+        connection = Connection.Connection.get_instance()
+        user = Structures.User.find_user(nick = connection.nick)
+        if user is not None and user.host:
+            return len(user.userstring) + 2
+
+        return len(connection.nick) + len(connection.ident) + 64 + 4
+
+    def get_text_limit(self, command, target):
+        """ py:function:: get_text_limit(self, command, target)
+
+            :returns: Number of bytes of text that fit in `command target :text` as the server
+                      relays it to others.
+            :rtype: int """
+
+        return self.get_linelen() - 2 - self.get_source_length() - len("%s %s :" % (command, target))
+
+    def pack_targets(self, command, targets, text = None):
+        """ py:function:: pack_targets(self, command, targets[, text = None])
+
+            Formats the same command for several targets in as few lines as TARGMAX and LINELEN
+            allow, ie. `PRIVMSG #a,#b,#c :text` or, without +text+, `NAMES #a,#b,#c`.
+
+            :param command: Command that takes a comma separated list of targets.
+            :type command: str
+            :param targets: Channels and nicks to send to.
+            :type targets: list of str
+            :param text: Trailing text of PRIVMSG and NOTICE.
+            :type text: str
+            :returns: Lines to send.
+            :rtype: list of str """
+
+        targmax = self.get_targmax(command)
+
+        def fits(packed):
+            if text is None:
+                return len("%s %s" % (command, packed)) + 2 <= self.get_linelen()
+            return len(text) <= self.get_text_limit(command, packed)
+
+        def assemble(group):
+            if text is None:
+                return "%s %s" % (command, ','.join(group))
+            return "%s %s :%s" % (command, ','.join(group), text)
+
+        lines, group = [], []
+        for target in targets:
+            if group and ((targmax and len(group) >= targmax) or not fits(','.join(group + [target]))):
+                lines.append(assemble(group))
+                group = []
+            group.append(target)
+
+        if group:
+            lines.append(assemble(group))
+
+        return lines
@@ -5,9 +5,171 @@
 #
 # An extended version of the license is included with this software in `ashiema.py`.
 
-import re, logging
+import re, logging, string, collections
 
 import Connection
+from util import lazy_property
+
+# translation tables for the casemappings a server may advertise. rfc1459 treats {}|^ as the
+# lower case forms of []\~, strict-rfc1459 leaves out ^ and ~, and ascii only folds A-Z.
+CASEMAPS = {
+    'ascii'             : string.maketrans(string.ascii_uppercase, string.ascii_lowercase),
+    'rfc1459'           : string.maketrans(string.ascii_uppercase + '[]\\~', string.ascii_lowercase + '{}|^'),
+    'strict-rfc1459'    : string.maketrans(string.ascii_uppercase + '[]\\', string.ascii_lowercase + '{}|')
+}
+
+_casemap_table = CASEMAPS['rfc1459']
+
+def casemap(name):
+    """ returns +name+ folded to lower case the way the server compares nicks and channels. """
+
+    if name is None:
+        return None
+
+    return name.translate(_casemap_table)
+
+def set_casemapping(mapping):
+    """ switches the casemapping used by casemap(); unknown mappings fall back to rfc1459. """
+
+    global _casemap_table
+
+    previous = _casemap_table
+    _casemap_table = CASEMAPS.get(mapping, CASEMAPS['rfc1459'])
+    UserRegistry.get_instance().rebuild(previous)
+
+# characters a channel name may start with, as advertised in CHANTYPES.
+_chantypes = '#&'
+
+def is_channel(name):
+    """ returns whether +name+ is a channel name rather than a nick. """
+
+    return bool(name) and name[0] in _chantypes
+
+def set_chantypes(chantypes):
+
+    global _chantypes
+
+    _chantypes = chantypes
+
+# channel membership modes and their prefixes, highest rank first, as advertised in PREFIX.
+# each mode is stored as one bit of a member's mode int, in this order.
+_prefix_modes, _prefix_chars = 'qaohv', '~&@%+'
+
+# channel modes that take a parameter: list modes and modes that always take one, and modes
+# that only take one when they are set, as advertised in CHANMODES.
+_param_modes, _set_param_modes = 'beIk', 'l'
+
+def set_prefix(modes, prefixes):
+    """ sets the membership modes and their prefix characters, ie. ('ov', '@+'). """
+
+    global _prefix_modes, _prefix_chars
+
+    _prefix_modes, _prefix_chars = modes, prefixes
+
+def set_chanmodes(always, when_set):
+    """ sets the channel modes that take a parameter; see _param_modes. """
+
+    global _param_modes, _set_param_modes
+
+    _param_modes, _set_param_modes = always, when_set
+
+# formatting codes: bold, italic, underline, reverse, and reset, which ends all of them.
+_toggles, _reset = '\x02\x1d\x1f\x16', '\x0f'
+_colour = re.compile(r'\x03(?:\d{1,2}(?:,\d{1,2})?)?')
+
+def _carry_formatting(text, state = ''):
+    """ returns the formatting codes that are still in effect at the end of +text+, given the
+        codes in effect at its start, so that they can be repeated on the next line. """
+
+    toggles, colour = set(c for c in state if c in _toggles), ''.join(_colour.findall(state))
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if char in _toggles:
+            toggles.symmetric_difference_update(char)
+        elif char == _reset:
+            toggles, colour = set(), ''
+        elif char == '\x03':
+            match = _colour.match(text, index)
+            colour = match.group(0) if len(match.group(0)) > 1 else ''
+            index = match.end()
+            continue
+        index += 1
+
+    return ''.join(sorted(toggles)) + colour
+
+def _find_cut(text, limit):
+    """ returns where to cut +text+ so the first part is at most +limit+ bytes: at the last space
+        if there is one, never inside a UTF-8 sequence or a colour code. """
+
+    cut = text.rfind(' ', 0, limit + 1)
+    if cut > 0:
+        return cut
+
+    cut = limit
+    while cut > 0 and 0x80 <= ord(text[cut]) < 0xC0:
+        cut -= 1
+
+    start = text.rfind('\x03', max(0, cut - 5), cut)
+    if start != -1 and _colour.match(text, start).end() > cut:
+        cut = start
+
+    return cut if cut > 0 else limit
+
+def split_text(text, limit):
+    """ splits +text+ into lines of at most +limit+ bytes of UTF-8, at newlines and between
+        words where possible. formatting that is in effect where a line is cut is repeated at
+        the start of the next one. empty lines are dropped. """
+
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    text = str(text)
+
+    lines = []
+    for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        state = ''
+        while len(state) + len(line) > limit:
+            line = state + line
+            cut = _find_cut(line, limit)
+            head, line = line[:cut], line[cut:].lstrip(' ')
+            lines.append(head)
+            state = _carry_formatting(head)
+            if len(state) > limit / 2:
+                state = ''
+        line = state + line if line else line
+        if line:
+            lines.append(line)
+
+    return lines
+
+def format_lines(fragments, limit, pack = False, separator = ' | '):
+    """ splits every fragment into lines of at most +limit+ bytes. with +pack+, consecutive
+        short lines are joined with +separator+ as long as the result still fits, so a list of
+        short items costs fewer lines. """
+
+    lines = []
+    for fragment in fragments:
+        lines.extend(split_text(fragment, limit))
+
+    if not pack:
+        return lines
+
+    packed = []
+    for line in lines:
+        if packed:
+            # end the formatting of the previous item, so it does not run into this one.
+            joint = (_reset if _carry_formatting(packed[-1]) else '') + separator
+            if len(packed[-1]) + len(joint) + len(line) <= limit:
+                packed[-1] = packed[-1] + joint + line
+                continue
+        packed.append(line)
+
+    return packed
+
+def get_text_limit(command, target):
+    """ returns how many bytes of text fit in a +command+ line to +target+. """
+
+    return Connection.Connection.get_instance().get_support().get_text_limit(command, target)
 
 class Structure(object):
 
@@ -52,8 +214,17 @@ class Origin(Structure):
         return str(self.name)
 
 class Channel(Structure):
+    """ A channel. While the bot is in a channel, Channel(name) returns the same object for any
+        spelling of its name, and that object holds the member table. Channels the bot is not
+        in are not remembered.
+
+        Members are kept in a dict of casemapped, interned nick -> int, where every bit of the
+        int is one of the membership modes (op, voice, ...) the member holds. """
 
     __channels = {}
+
+    # token sent with WHO requests, so our own replies can be told apart from anyone else's.
+    WHOX_TOKEN = '152'
     
     @staticmethod
     def format_topic(channel, topic):
@@ -73,9 +244,9 @@ class Channel(Structure):
     @staticmethod
     def format_join(channel, key = None):
     
-        if key is not None:
+        if key is None:
             return "JOIN %s" % (channel)
-        return "JOIN %s :%s" % (channel, key)
+        return "JOIN %s %s" % (channel, key)
 
     @staticmethod
     def format_kick(channel, username, reason = "Your behaviour is not conductive to the desired environment."):
@@ -84,9 +255,10 @@ class Channel(Structure):
 
     @staticmethod
     def format_who(channel):
-        """ requests list of channel members with information in format: <channel> <host> <nick> <account> """
+        """ requests the members of a channel as WHOX replies with the fields:
+            <token> <channel> <ident> <host> <nick> <flags> <account> :<real name> """
     
-        return "WHO %s %achn" % (channel)
+        return "WHO %s %%tcuhnfar,%s" % (channel, Channel.WHOX_TOKEN)
 
     @staticmethod
     def join(channel, key = None):
@@ -100,26 +272,93 @@ class Channel(Structure):
 
     @staticmethod
     def get_channel(channel):
-        """ returns a channel with a given name. """
+        """ returns the channel with a given name, if the bot is in it, or None. """
         
-        try: return __channels[channel]
-        except: return None
+        return Channel.__channels.get(casemap(channel))
+
+    @staticmethod
+    def get_channels():
+        """ returns every channel the bot is in. """
+
+        return Channel.__channels.values()
+
+    @staticmethod
+    def track(channel):
+        """ starts keeping the member table of a channel, when the bot joins it. """
+
+        channel = Channel(channel)
+        Channel.__channels[casemap(channel.name)] = channel
+
+        return channel
+
+    @staticmethod
+    def untrack(channel):
+        """ forgets a channel and its member table, when the bot leaves it. """
+
+        channel = Channel.__channels.pop(casemap(channel), None)
+        if channel is not None:
+            channel.members.clear()
+
+    @staticmethod
+    def rekey():
+        """ re-indexes the channels by name, after the casemapping has changed. """
+
+        channels = Channel.__channels.values()
+        Channel.__channels.clear()
+        for channel in channels:
+            Channel.__channels[casemap(channel.name)] = channel
+
+    @staticmethod
+    def member_key(nick):
+        """ returns the key +nick+ is stored under in member tables. """
+
+        return intern(casemap(nick))
+
+    @staticmethod
+    def parse_prefixes(name):
+        """ splits the membership prefixes off a name from NAMES or the flags of a WHO reply.
+            returns the mode int and the rest of the name. """
+
+        modes, index = 0, 0
+        while index < len(name) and name[index] in _prefix_chars:
+            modes |= 1 << _prefix_chars.index(name[index])
+            index += 1
+
+        return modes, name[index:]
+
+    def __new__(cls, channel):
+
+        tracked = Channel.__channels.get(casemap(channel))
+        if tracked is not None:
+            return tracked
+
+        return Structure.__new__(cls)
 
     def __init__(self, channel):
 
+        # a tracked channel returned by __new__ is already set up.
+        if hasattr(self, 'members'):
+            return
+
         self.connection = Connection.Connection.get_instance()
         self.name = channel
         
-        self.users = {}
-
-        if channel in Channel.__channels:
-            self = Channel.__channels[channel]
-        elif channel not in Channel.__channels:
-            Channel.__channels[channel] = self
+        self.members = {}
+        # whether the members have been looked up since the bot joined.
+        self.synced = False
     
     def __repr__(self):
 
         return str(self.name)
+
+    def __len__(self):
+
+        return len(self.members)
+
+    def __contains__(self, user):
+        """ whether a user (or a nick) is in the channel. """
+
+        return Channel.member_key(getattr(user, 'nick', user)) in self.members
     
     def to_s(self):
 
@@ -129,19 +368,21 @@ class Channel(Structure):
 
         return False
     
-    def message(self, *data):
+    def message(self, *data, **kwargs):
+        """ sends every argument as a message to the channel, split to fit the line length.
+            pass pack = True to join short messages into fewer lines. """
 
-        for slice in data:
-            message = Channel.format_privmsg(self.name, slice)
-            self.connection.send(message)
+        lines = format_lines(data, get_text_limit('PRIVMSG', self.name), kwargs.get('pack', False))
+        
+        self.connection.send(*[Channel.format_privmsg(self.name, line) for line in lines])
 
     privmsg = message
     
-    def notice(self, data):
+    def notice(self, *data, **kwargs):
 
-        message = Channel.format_notice(self.name, data)
+        lines = format_lines(data, get_text_limit('NOTICE', self.name), kwargs.get('pack', False))
         
-        self.connection.send(message)
+        self.connection.send(*[Channel.format_notice(self.name, line) for line in lines])
     
     def set_topic(self, data):
 
@@ -156,37 +397,163 @@ class Channel(Structure):
         self.connection.send(message)
 
     def request_who(self):
+        """ looks up every member of the channel with a single WHO, in the background lane. """
     
         message = Channel.format_who(self.name)
         
-        self.connection.send(message)
-    
+        self.connection.send_query(message)
+        self.synced = True
+
+    def add_member(self, nick, modes = None):
+        """ adds +nick+ to the member table. +modes+ replaces the member's modes, if given. """
+
+        key = Channel.member_key(nick)
+        if modes is not None or key not in self.members:
+            self.members[key] = modes or 0
+
+    def remove_member(self, nick):
+
+        self.members.pop(Channel.member_key(nick), None)
+
+    def rename_member(self, nick, new_nick):
+
+        modes = self.members.pop(Channel.member_key(nick), None)
+        if modes is not None:
+            self.members[Channel.member_key(new_nick)] = modes
+
+    def get_members(self):
+        """ returns the User of every member. """
+
+        registry = UserRegistry.get_instance()
+
+        return [registry.get_nick(nick) for nick in self.members]
+
+    def get_modes(self, nick):
+        """ returns the membership modes of +nick+ as a string, ie. 'ov'. """
+
+        modes = self.members.get(Channel.member_key(nick), 0)
+
+        return ''.join(mode for bit, mode in enumerate(_prefix_modes) if modes & (1 << bit))
+
+    def has_mode(self, nick, mode):
+
+        if mode not in _prefix_modes:
+            return False
+
+        return bool(self.members.get(Channel.member_key(nick), 0) & (1 << _prefix_modes.index(mode)))
+
+    def get_prefix(self, nick):
+        """ returns the prefix of the highest membership mode of +nick+, or ''. """
+
+        modes = self.members.get(Channel.member_key(nick), 0)
+        for bit, prefix in enumerate(_prefix_chars):
+            if modes & (1 << bit):
+                return prefix
+
+        return ''
+
+    def set_member_mode(self, nick, mode, enabled = True):
+
+        key = Channel.member_key(nick)
+        if key not in self.members or mode not in _prefix_modes:
+            return
+
+        if enabled:
+            self.members[key] |= 1 << _prefix_modes.index(mode)
+        else:
+            self.members[key] &= ~(1 << _prefix_modes.index(mode))
+
+    def parse_mode(self, data):
+        """ applies the membership changes in a MODE line to the member table. """
+
+        modes = data.message.words
+        if not modes:
+            return
+
+        params = [param.lstrip(':') for param in modes[1:]]
+        adding = True
+        for mode in modes[0].lstrip(':'):
+            if mode == '+' or mode == '-':
+                adding = mode == '+'
+            elif mode in _prefix_modes:
+                if params:
+                    self.set_member_mode(params.pop(0), mode, adding)
+            elif mode in _param_modes or (adding and mode in _set_param_modes):
+                if params:
+                    params.pop(0)
+
+    def parse_names(self, names):
+        """ adds the members listed in a NAMES reply. names may carry several prefixes
+            (multi-prefix) and a full userstring (userhost-in-names). """
+
+        for name in names.split():
+            modes, name = Channel.parse_prefixes(name)
+            if not name:
+                continue
+            if '!' in name:
+                user = User.find_or_create(name)
+            else:
+                user = User.find_user(nick = name)
+                if user is None:
+                    # the WHO sent at the end of the names list fills in the rest.
+                    user = User(nick = name, lookup = False)
+            user.join(self.name, modes)
+
     def parse_who(self, data):
-    
+        """ updates a member from a WHOX reply to format_who(). """
+
+        line = data.message
+        if line[0] != Channel.WHOX_TOKEN:
+            return
+
+        self.__update_member(nick = line[4], ident = line[2], host = line[3], flags = line[5],
+            account = line[6], gecos = line.to_s().partition(' :')[2])
+
+    def parse_who_reply(self, data):
+        """ updates a member from a plain WHO reply, from servers without WHOX:
+            <channel> <ident> <host> <server> <nick> <flags> :<hops> <real name> """
+
         line = data.message
-        
-        user = User.find_user(nick = line[2])
-        if user is None:
-            user = User(nick = line[2], host = line[1])
-        user.update_account(account = line[3] if line[3] is not '0' else '*')
-        
-        user = {    'host'      : line[1],
-                    'account'   : line[3] if line[3] is not '0' else '*'}
 
-        if nick in self.users:
-            self.users[nick] = user
+        self.__update_member(nick = line[4], ident = line[1], host = line[2], flags = line[5],
+            gecos = line.to_s().partition(' :')[2].partition(' ')[2])
+
+    def __update_member(self, nick, ident, host, flags, account = None, gecos = ''):
+
+        user = User.find_user(nick = nick)
+        if user is None:
+            user = User(nick = nick, ident = ident, host = host)
         else:
-            self.users.update({ nick : user })
+            user.update_host(ident, host)
+        if account is not None:
+            user.update_account(account = account if account != '0' else '*')
+        user.update_gecos(gecos)
+
+        # flags are H or G (here or gone), an optional * for opers, then the prefixes.
+        modes, rest = Channel.parse_prefixes(flags[1:].lstrip('*'))
+        user.join(self.name, modes)
 
 class Message(Structure):
 
     def __init__(self, data):
 
         self.data = data
+
+    @lazy_property
+    def words(self):
+        """ the message split on whitespace, computed once. """
+
+        return self.data.split()
+
+    @lazy_property
+    def command(self):
+        """ the first word of the message, or None for an empty message. """
+
+        return self.words[0] if self.words else None
     
     def __call__(self):
 
-        return self.data.split()
+        return list(self.words)
     
     def __repr__(self):
 
@@ -194,11 +561,12 @@ class Message(Structure):
     
     def __eq__(self, (index, cmp)):
 
-        return self.data.split()[index] == cmp
+        try: return self.words[index] == cmp
+        except (IndexError): return False
     
     def __ne__(self, (index, cmp)):
 
-        return self.data.split()[index] != cmp
+        return not self.__eq__((index, cmp))
     
     def __len__(self):
 
@@ -206,7 +574,7 @@ class Message(Structure):
     
     def __getitem__(self, index):
 
-        return self.data.split()[index]
+        return self.words[index]
     
     def split(self, delim):
 
@@ -219,7 +587,7 @@ class Message(Structure):
     def has_index(self, index):
 
         try:
-            if self.data.split()[index]:
+            if self.words[index]:
                 return True
             else:
                 return False
@@ -257,59 +625,349 @@ class Type(Structure):
         try: return int(self.type)
         except (ValueError): return self.type
 
+class UserRegistry(object):
+    """ Holds every known User, indexed by casemapped nick, full userstring, account and host,
+        so that looking a user up for an inbound line is a dictionary access. The User methods
+        that change a nick, host or account keep the indexes up to date themselves.
+
+        The registry also decides how long a user is remembered. A user who shares a channel
+        with the bot is kept until they leave the last of those channels (or quit, or the bot
+        leaves). Users who share no channel, like people who only message the bot privately,
+        are kept in a least recently seen list of at most +limit+ users, besides the one that
+        was added last. """
+
+    __instance = None
+
+    @staticmethod
+    def get_instance():
+
+        if UserRegistry.__instance is None:
+            return UserRegistry()
+        else:
+            return UserRegistry.__instance
+
+    def __init__(self, limit = 500):
+
+        UserRegistry.__instance = self
+
+        self.__nicks = {}
+        self.__userstrings = {}
+        self.__accounts = {}
+        self.__hosts = {}
+        # users that share no channel with us, least recently seen first.
+        self.__unshared = collections.OrderedDict()
+
+        self.limit = limit
+        self.evicted = 0
+
+    def __repr__(self):
+
+        return "<UserRegistry(%d users, %d unshared)>" % (len(self.__nicks), len(self.__unshared))
+
+    def __len__(self):
+
+        return len(self.__nicks)
+
+    def __iter__(self):
+
+        return iter(self.__nicks.values())
+
+    def __contains__(self, user):
+
+        return self.__nicks.get(casemap(user.nick)) is user
+
+    def __is_self(self, user):
+
+        return casemap(user.nick) == casemap(getattr(Connection.Connection.get_instance(), 'nick', None))
+
+    def __index(self, index, key, user):
+
+        if key is None:
+            return
+        index.setdefault(key, set()).add(user)
+
+    def __unindex(self, index, key, user):
+
+        users = index.get(key)
+        if users is None:
+            return
+        users.discard(user)
+        if not users:
+            del index[key]
+
+    def __index_user(self, user):
+
+        self.__nicks[casemap(user.nick)] = user
+        self.__userstrings[user.userstring] = user
+        self.__index(self.__hosts, user.host, user)
+        if user.account != '*':
+            self.__index(self.__accounts, casemap(user.account), user)
+
+    def __unindex_user(self, user):
+
+        del self.__nicks[casemap(user.nick)]
+        if self.__userstrings.get(user.userstring) is user:
+            del self.__userstrings[user.userstring]
+        self.__unindex(self.__hosts, user.host, user)
+        self.__unindex(self.__accounts, casemap(user.account), user)
+
+    def __trim(self):
+
+        while len(self.__unshared) > self.limit:
+            user, none = self.__unshared.popitem(last = False)
+            self.remove(user)
+            self.evicted += 1
+
+    def set_limit(self, limit):
+        """ sets how many users that share no channel with us are remembered. """
+
+        self.limit = max(0, limit)
+        self.__trim()
+
+    def add(self, user):
+        """ adds +user+, replacing any user that already holds the same nick. """
+
+        if user.nick is None:
+            return
+
+        previous = self.__nicks.get(casemap(user.nick))
+        if previous is not None and previous is not user:
+            self.remove(previous)
+
+        self.__index_user(user)
+        if not user.channels and not self.__is_self(user):
+            # users are created before the line that joins them to a channel is handled, so
+            # the list is trimmed before the new user is counted: they are only held against
+            # the limit once the next user is added, if they have joined no channel by then.
+            self.__trim()
+            self.__unshared[user] = None
+
+    def remove(self, user):
+        """ forgets +user+ and their channel memberships. unknown users are ignored. """
+
+        if self.__nicks.get(casemap(user.nick)) is not user:
+            return
+
+        self.__unindex_user(user)
+        for channel in user.channels:
+            channel.remove_member(user.nick)
+        user.channels.clear()
+        self.__unshared.pop(user, None)
+
+    def touch(self, user):
+        """ marks +user+ as recently seen, so they are the last to be forgotten. """
+
+        if user in self.__unshared:
+            del self.__unshared[user]
+            self.__unshared[user] = None
+
+    def join(self, user, channel, modes = None):
+        """ records that +user+ is in +channel+, with the membership +modes+ if they are known.
+            joins to channels the bot is not in are ignored. """
+
+        if self.__is_self(user):
+            channel = Channel.track(channel)
+        else:
+            channel = Channel.get_channel(channel)
+            if channel is None:
+                return
+
+        # the membership is recorded first, so that add() indexes the user as sharing a channel
+        # instead of counting them against the limit of users that share none.
+        user.channels.add(channel)
+        self.__unshared.pop(user, None)
+        if user not in self:
+            self.add(user)
+
+        channel.add_member(user.nick, modes)
+
+    def part(self, user, channel):
+        """ records that +user+ left +channel+, forgetting them if it was the last channel we
+            shared. when +user+ is the bot itself, every member of +channel+ is treated as having
+            left it. """
+
+        channel = Channel.get_channel(channel)
+        if channel is None:
+            return
+
+        if self.__is_self(user):
+            for nick in list(channel.members):
+                member = self.__nicks.get(nick)
+                if member is not None and member is not user:
+                    self.__leave(member, channel)
+            user.channels.discard(channel)
+            Channel.untrack(channel.name)
+            return
+
+        self.__leave(user, channel)
+
+    def __leave(self, user, channel):
+
+        channel.remove_member(user.nick)
+        user.channels.discard(channel)
+        if not user.channels:
+            self.remove(user)
+
+    def rename(self, user, nick):
+        """ moves +user+ to +nick+ in the indexes. the nick and userstring are updated on +user+. """
+
+        known = user in self
+        if known:
+            self.__unindex_user(user)
+        for channel in user.channels:
+            channel.rename_member(user.nick, nick)
+        user.nick = nick
+        user.userstring = User.format_userstring(user.nick, user.ident, user.host)
+        if known:
+            previous = self.__nicks.get(casemap(user.nick))
+            if previous is not None and previous is not user:
+                self.remove(previous)
+            self.__index_user(user)
+
+    def rehost(self, user, ident, host):
+        """ moves +user+ to a new ident and host in the indexes. """
+
+        known = user in self
+        if known:
+            self.__unindex_user(user)
+        user.ident, user.host = ident, host
+        user.userstring = User.format_userstring(user.nick, user.ident, user.host)
+        if known:
+            self.__index_user(user)
+
+    def set_account(self, user, account):
+        """ moves +user+ to +account+ in the account index. '*' means logged out. """
+
+        if user in self:
+            self.__unindex(self.__accounts, casemap(user.account), user)
+            if account != '*':
+                self.__index(self.__accounts, casemap(account), user)
+        user.account = account
+
+    def get_nick(self, nick):
+
+        return self.__nicks.get(casemap(nick))
+
+    def get_userstring(self, userstring):
+
+        return self.__userstrings.get(userstring)
+
+    def get_account(self, account):
+
+        return list(self.__accounts.get(casemap(account), ()))
+
+    def get_host(self, host):
+
+        return list(self.__hosts.get(host, ()))
+
+    def get_stats(self):
+        """ returns counts of the users, channels and memberships being tracked. """
+
+        return {
+            'users'         : len(self.__nicks),
+            'channels'      : len(Channel.get_channels()),
+            'memberships'   : sum(len(channel) for channel in Channel.get_channels()),
+            'unshared'      : len(self.__unshared),
+            'limit'         : self.limit,
+            'evicted'       : self.evicted
+        }
+
+    def rebuild(self, previous):
+        """ rebuilds every index and member table, after the casemapping has changed from the
+            +previous+ translation table. """
+
+        users = self.__nicks.values()
+        self.__nicks.clear()
+        self.__userstrings.clear()
+        self.__accounts.clear()
+        self.__hosts.clear()
+
+        tables = dict((channel, channel.members) for channel in Channel.get_channels())
+        Channel.rekey()
+        for channel in tables:
+            channel.members = {}
+
+        for user in users:
+            self.__index_user(user)
+            for channel in user.channels:
+                modes = tables.get(channel, {}).get(user.nick.translate(previous), 0)
+                channel.members[Channel.member_key(user.nick)] = modes
+
+    def clear(self):
+
+        self.__nicks.clear()
+        self.__userstrings.clear()
+        self.__accounts.clear()
+        self.__hosts.clear()
+        self.__unshared.clear()
+
 class User(Structure):
-    
-    users = []
+
+    registry = UserRegistry.get_instance()
     
     @staticmethod
     def find_userstring(userstring):
     
-        for user in User.users:
-            user.update_userstring()
-            if user.userstring == userstring:
-                return user
-            continue
+        return User.registry.get_userstring(userstring)
     
     @staticmethod
-    def find_users(nick = None, ident = None, host = None):
-    
-        result = []
+    def find_users(nick = None, ident = None, host = None, account = None):
+        """ returns every user that matches all of the given fields exactly. nicks and accounts
+            are compared with the server's casemapping. """
     
-        for user in User.users:
-            if nick is not None and nick in user.nick:
-                result.append(user)
-            if ident is not None and ident in user.ident:
-                result.append(user)
-            if host is not None and host in user.host:
-                result.append(user)
+        if nick is not None:
+            user = User.registry.get_nick(nick)
+            result = [user] if user is not None else []
+        elif host is not None:
+            result = User.registry.get_host(host)
+        elif account is not None:
+            result = User.registry.get_account(account)
+        else:
+            result = list(User.registry)
+
+        if host is not None:
+            result = [user for user in result if user.host == host]
+        if account is not None:
+            result = [user for user in result if casemap(user.account) == casemap(account)]
+        if ident is not None:
+            result = [user for user in result if user.ident == ident]
         
         return result
     
     @staticmethod
-    def find_user(nick = None, ident = None, host = None):
-        """ This method uses User.find_users and performs a best-fit search on the result if more than one is returned. """
-        
-        result = User.find_users(nick, ident, host)
-        
-        if len(result) == 1: return result[0]
-        elif len(result) == 0: return None
-        
-        best_match = None
-        method = None
+    def find_user(nick = None, ident = None, host = None, account = None):
+        """ returns the user matching all of the given fields, or None. when several users
+            match (only possible without a nick), the first one found is returned. """
         
-        for user in User.users:
-            if nick is not None and nick is user.nick:
-                best_match = user
-                method = 'nickname'
-            if ident is not None and ident is user.ident:
-                best_match = user
-                method = 'ident'
-            if host is not None and host is user.host:
-                best_match = user if best_match is None or method is 'ident' and best_match is user else None
-                method = 'hostname'
-            if best_match is None: continue
-
-        return best_match
+        result = User.find_users(nick, ident, host, account)
+
+        return result[0] if result else None
+
+    @staticmethod
+    def find_or_create(userstring):
+        """ returns the user for a nick!ident@host, updating the ident and host of a user that was
+            only known by nick, or creating a new user. """
+
+        user = User.registry.get_userstring(userstring)
+        if user is not None:
+            User.registry.touch(user)
+            return user
+
+        nick, sep, rest = userstring.partition('!')
+        ident, sep, host = rest.partition('@')
+        user = User.registry.get_nick(nick)
+        if user is None:
+            return User(userstring = userstring)
+
+        user.update_host(ident, host)
+        User.registry.touch(user)
+
+        return user
+
+    @staticmethod
+    def format_userstring(nick, ident, host):
+
+        return "%s!%s@%s" % (nick, ident, host)
 
     @staticmethod
     def format_whois(user):
@@ -326,44 +984,38 @@ class User(Structure):
     
         return "PRIVMSG %s :%s" % (user, message)
 
-    def __init__(self, userstring = None, nick = None, ident = None, host = None):
+    def __init__(self, userstring = None, nick = None, ident = None, host = None, lookup = True):
 
         self.connection = Connection.Connection.get_instance()
 
+        self.account = '*'
+        self.gecos = ''
+        # the channels this user shares with us.
+        self.channels = set()
+
         if not userstring:
             self.nick = nick
             self.ident = ident
             self.host = host
-            self.account = '*'
             
-            if self.connection._registered and (ident is None or host is None):
-                self.connection.send(User.format_whois(self.nick))
-            else:
-                self.update_userstring()
+            if lookup and self.connection._registered and (ident is None or host is None):
+                self.request_whois()
         elif userstring:
-            self.pattern = re.compile(r"""([^!].+)!(.+)@(.*)""", re.VERBOSE)
-
-            self.userstring = userstring
-            try:
-                self.nick, self.ident, self.host = self.pattern.match(self.userstring).groups()
-            except:
+            nick, sep, rest = userstring.partition('!')
+            ident, sep, host = rest.partition('@')
+            if nick and ident and sep:
+                self.nick, self.ident, self.host = nick, ident, host
+            else:
                 self.nick = None
                 self.ident = None
                 self.host = None
-                
-        dupes = User.find_users(nick = self.nick)
-        if len(dupes) > 0:
-            for user in dupes:
-                User.users.remove(user)
 
-        self.gecos = ''
+        self.userstring = User.format_userstring(self.nick, self.ident, self.host)
 
-        User.users.append(self)
+        User.registry.add(self)
     
     def __repr__(self):
     
-        self.update_userstring()
-        
         return str(self.userstring)
     
     def is_self(self):
@@ -375,44 +1027,65 @@ class User(Structure):
     
     def update_userstring(self):
     
-        self.userstring = "%s!%s@%s" % (self.nick, self.ident, self.host)
+        User.registry.rehost(self, self.ident, self.host)
+
+    def request_whois(self):
+        """ looks the user up with a WHOIS, in the background lane. """
+
+        self.connection.send_query(User.format_whois(self.nick))
+
+    def update_host(self, ident, host):
+
+        if ident != self.ident or host != self.host:
+            User.registry.rehost(self, ident, host)
     
     def update_account(self, account = '*'):
     
-        self.account = account
+        if account != self.account:
+            User.registry.set_account(self, account)
     
     def update_gecos(self, gecos = ''):
 
         self.gecos = gecos
 
-    def message(self, *data):
+    def message(self, *data, **kwargs):
+        """ sends every argument as a message to the user, split to fit the line length.
+            pass pack = True to join short messages into fewer lines. """
 
-        for slice in data:
-            message = User.format_privmsg(self.nick, slice)
-            self.connection.send(message)
+        lines = format_lines(data, get_text_limit('PRIVMSG', self.nick), kwargs.get('pack', False))
+        
+        self.connection.send(*[User.format_privmsg(self.nick, line) for line in lines])
     
     privmsg = message
     
-    def notice(self, data):
+    def notice(self, *data, **kwargs):
 
-        message = User.format_notice(self.nick, data)
+        lines = format_lines(data, get_text_limit('NOTICE', self.nick), kwargs.get('pack', False))
         
-        self.connection.send(message)
+        self.connection.send(*[User.format_notice(self.nick, line) for line in lines])
     
     def nick_change(self, nick):
     
-        self.nick = nick
-        
-        self.update_userstring()
+        User.registry.rename(self, nick)
     
+    def join(self, channel, modes = None):
+
+        User.registry.join(self, channel, modes)
+
+    def part(self, channel):
+
+        User.registry.part(self, channel)
+
+    def is_on(self, channel):
+
+        return Channel.get_channel(channel) in self.channels
+
     def quit(self, message = "Quitting."):
     
-        users.remove(self)
+        User.registry.remove(self)
     
     remove = quit
     
     def to_s(self):
 
-        self.update_userstring()
-        
         return self.userstring
\ No newline at end of file
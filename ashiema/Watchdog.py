@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import sys, threading, logging, traceback
+from util import monotonic
+
+""" module:: Watchdog
+    :platform: Unix, Windows, Mac OS X
+    :synopsis: Contains the Watchdog class, which notices when the main loop is blocked. """
+
+class Watchdog(object):
+    """ py:class:: Watchdog([threshold = 1000])
+
+        Watches the main loop from a thread of its own. The loop calls beat() when it starts
+        working and idle() before it waits for I/O; if it has been working for more than
+        +threshold+ milliseconds, the main thread's stack is logged together with the line that
+        was being processed, so whatever blocks the loop (a plugin calling urlopen() without
+        @offload, ie.) shows up in the log. How long each stall lasted is counted in a
+        histogram once the loop is back. """
+
+    # upper bounds of the histogram buckets, in multiples of the threshold; a stall always
+    # lasts at least as long as the threshold.
+    BUCKETS = (1.5, 2, 5, 10, 30)
+
+    def __init__(self, threshold = 1000):
+
+        self.log = logging.getLogger('ashiema')
+
+        self.threshold = threshold
+        # the line being processed, set by the main loop.
+        self.line = None
+
+        self.__thread = None
+        self.__stopping = threading.Event()
+        # guards __busy_since and __stalled, which both threads change.
+        self.__lock = threading.Lock()
+        self.__ident = None
+        # time the loop started working at, or None while it waits for I/O.
+        self.__busy_since = None
+        # time the stall that is being reported started at.
+        self.__stalled = None
+
+        self.__counts = [0] * (len(Watchdog.BUCKETS) + 1)
+        self.stalls, self.longest = 0, 0.0
+
+    def __repr__(self):
+
+        return "<Watchdog(%dms, %d stalls)>" % (self.threshold, self.stalls)
+
+    def configure(self, threshold = 1000):
+        """ py:function:: configure(self[, threshold = 1000])
+
+            Changes how many milliseconds the loop may work for before it counts as stalled. 0
+            turns the watchdog off. The histogram is cleared if the threshold changes, since its
+            buckets depend on it. """
+
+        if threshold != self.threshold:
+            self.__counts = [0] * (len(Watchdog.BUCKETS) + 1)
+        self.threshold = threshold
+
+    def start(self):
+        """ py:function:: start(self)
+
+            Starts watching the thread this is called from. """
+
+        self.__ident = threading.current_thread().ident
+        if self.threshold <= 0 or self.__thread is not None:
+            return
+
+        self.__stopping.clear()
+        self.__thread = threading.Thread(target = self.__watch, name = "ashiema watchdog")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self):
+        """ py:function:: stop(self)
+
+            Stops the watchdog thread and waits for it to exit. """
+
+        self.__stopping.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def beat(self):
+        """ py:function:: beat(self)
+
+            Called by the main loop when it starts working. """
+
+        with self.__lock:
+            stalled, self.__stalled = self.__stalled, None
+            self.__busy_since = monotonic()
+        if stalled is not None:
+            self.__recover(stalled)
+
+    def idle(self):
+        """ py:function:: idle(self)
+
+            Called by the main loop before it waits for I/O. """
+
+        with self.__lock:
+            stalled, self.__stalled = self.__stalled, None
+            self.__busy_since = None
+        self.line = None
+        if stalled is not None:
+            self.__recover(stalled)
+
+    def __recover(self, stalled):
+
+        duration = monotonic() - stalled
+
+        index = 0
+        while index < len(Watchdog.BUCKETS) and duration * 1000 > Watchdog.BUCKETS[index] * self.threshold:
+            index += 1
+        self.__counts[index] += 1
+        self.stalls += 1
+        self.longest = max(self.longest, duration)
+
+        self.log.warning("[Watchdog] The main loop was stalled for %.3fs." % (duration))
+
+    def __watch(self):
+
+        now = monotonic
+
+        while not self.__stopping.is_set():
+            threshold = self.threshold / 1000.0
+            self.__stopping.wait(max(0.01, threshold / 4))
+            if threshold <= 0:
+                continue
+
+            # checked and set together, so that the loop can not go idle in between and have
+            # the wait that follows counted as part of the stall.
+            with self.__lock:
+                busy_since = self.__busy_since
+                if busy_since is None or self.__stalled is not None or now() - busy_since < threshold:
+                    continue
+                self.__stalled = busy_since
+            self.__report(now() - busy_since)
+
+    def __report(self, duration):
+
+        frame = sys._current_frames().get(self.__ident)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        line = self.line
+
+        self.log.warning("[Watchdog] The main loop has been busy for %.3fs; it may be blocked." % (duration))
+        if line is not None:
+            self.log.warning("[Watchdog] Processing: %s" % (line))
+        [self.log.warning("[Watchdog] %s" % (trace)) for entry in stack for trace in entry.rstrip('\n').split('\n')]
+
+    def get_histogram(self):
+        """ py:function:: get_histogram(self)
+
+            :returns: (upper bound in milliseconds, count) pairs for the stalls so far; the last
+                      bound is None, for everything longer than the others.
+            :rtype: list of tuple """
+
+        return zip([int(multiple * self.threshold) for multiple in Watchdog.BUCKETS] + [None], self.__counts)
+
+    def get_stats(self):
+        """ py:function:: get_stats(self)
+
+            :returns: Number of stalls and the longest one, and how long the loop has been stalled
+                      for if it is right now.
+            :rtype: dict """
+
+        stalled = self.__stalled
+
+        return {
+            'threshold' : self.threshold,
+            'stalls'    : self.stalls,
+            'longest'   : self.longest,
+            'current'   : monotonic() - stalled if stalled is not None else 0.0
+        }
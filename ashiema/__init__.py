@@ -7,8 +7,8 @@
 
 import hashlib, inspect
 
-__all__ = ['Connection', 'Database', 'EventHandler', 'Events', 'HelpFactory', 
-       'Logger', 'Plugin', 'PluginLoader', 'Scheduler', 'Structures']
+__all__ = ['CommandRouter', 'Connection', 'Database', 'EventHandler', 'EventLoop', 'Events', 'Executor', 'HelpFactory', 
+       'LagMeter', 'Logger', 'Metrics', 'Plugin', 'PluginLoader', 'Replay', 'Sampler', 'Scheduler', 'ServerSupport', 'Structures', 'Watchdog']
 
 version = "1.1-dev"
 
@@ -49,11 +49,16 @@ class ConfigurationSection(dict):
         try:
             if str(self.get(key)) == '!None': return None 
             return str(self.get(key)) or default
-        except: raise
+        except KeyError: return default
     
     def get_int(self, key, default = None):
     
-        try: return int(self.get(key)) or default
+        try: return int(self.get(key))
+        except: return default
+
+    def get_float(self, key, default = None):
+
+        try: return float(self.get(key))
         except: return default
     
     def get_bool(self, key, default = False):
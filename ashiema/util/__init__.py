@@ -3,12 +3,66 @@
 #
 # An extended version of the license is included with this software in `ashiema.py`.
 
-import os, re, logging, sys, signal, htmlentitydefs, ast, inspect
+import os, re, logging, sys, signal, htmlentitydefs, ast, inspect, time
 
 all = ['Configuration', 'Escapes', 'texttable', 'apscheduler']
 
 """ these are some various utilities needed for use in the startup process and other parts of runtime """
 
+def _load_monotonic():
+    """ finds a clock that never jumps backwards or forwards when the wall clock is adjusted.
+        python 2 has no time.monotonic, so clock_gettime is called through ctypes where possible. """
+
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+
+    clock_ids = { 'linux' : 1, 'freebsd' : 4, 'openbsd' : 3, 'netbsd' : 3, 'darwin' : 6 }
+    clock_id = [value for key, value in clock_ids.iteritems() if sys.platform.startswith(key)]
+    if not clock_id:
+        return time.time
+
+    try:
+        import ctypes, ctypes.util
+
+        class timespec(ctypes.Structure):
+            _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+        libc = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'), use_errno = True)
+        clock_gettime = libc.clock_gettime
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+        def monotonic():
+            ts = timespec()
+            if clock_gettime(clock_id[0], ctypes.byref(ts)) != 0:
+                return time.time()
+            return ts.tv_sec + ts.tv_nsec / 1000000000.0
+
+        monotonic()
+        return monotonic
+    except (ImportError, OSError, AttributeError, TypeError):
+        return time.time
+
+monotonic = _load_monotonic()
+
+class lazy_property(object):
+    """ decorator for a method that computes an attribute the first time it is read.
+        the result is stored on the instance, so the method runs at most once and
+        the attribute can still be assigned to like a normal one. """
+
+    def __init__(self, function):
+
+        self.function = function
+        self.__name__ = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self, instance, owner):
+
+        if instance is None:
+            return self
+
+        value = instance.__dict__[self.__name__] = self.function(instance)
+        return value
+
 def fork():
 
     try:
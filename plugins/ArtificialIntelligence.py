@@ -9,6 +9,7 @@ import os, logging, ashiema, sys, traceback, threading, random
 from ashiema import Plugin, Events, HelpFactory, util
 from ashiema.util import Escapes
 from ashiema.Plugin import Plugin
+from ashiema.Executor import offload
 from ashiema.HelpFactory import Contexts
 from ashiema.HelpFactory import CONTEXT, DESC, PARAMS, ALIASES
 from urllib import urlopen
@@ -30,6 +31,9 @@ class ArtificialIntelligence(Plugin):
         self.brain = megahal.MegaHAL(brainfile = self.get_path() + "/brain")
         
         self.get_event("MessageEvent").register(self.handler)
+        self.register_command("@learn", self.learn)
+        self.register_command("@chance", self.chance)
+        self.register_command("@ignore", self.ignore)
         self.get_event("PluginsLoadedEvent").register(self._load_identification)
         
         self.ignored = []
@@ -43,6 +47,9 @@ class ArtificialIntelligence(Plugin):
     def __deinit__(self):
     
         self.get_event("MessageEvent").deregister(self.handler)
+        self.deregister_command("@learn")
+        self.deregister_command("@chance")
+        self.deregister_command("@ignore")
         self.get_event("PluginsLoadedEvent").deregister(self._load_identification)
     
         self.scheduler.remove_job(self.__sync_job)
@@ -57,47 +64,14 @@ class ArtificialIntelligence(Plugin):
     
     def handler(self, data):
     
+        if data.message.command in ('@learn', '@chance', '@ignore'):
+            return
+
         # set up the chance for a channel if the chance is not already set to prevent errors
         if data.target.to_s() not in self.response_chances:
             self.response_chances[data.target.to_s()] = self.default_chance
 
-        if data.message == (0, '@learn'):
-            assert self.identification.require_level(data, 1)
-            try:
-                url = data.message[1]
-            except IndexError:
-                data.target.message("%s[AI]%s: %sPlease provide a URL to learn from." % (Escapes.RED, Escapes.BLACK, (Escapes.BOLD + Escapes.AQUA)))
-                return
-            content = urlopen(url).read().split('\n')
-            for line in content:
-                if line is '':
-                    continue
-                else:
-                    self.brain.learn(line)
-            data.target.message("%s[AI]%s: %sLearned from %s%s%s lines." % (Escapes.RED, Escapes.BLACK, (Escapes.BOLD + Escapes.AQUA), Escapes.LIGHT_BLUE, len(content), (Escapes.BOLD + Escapes.AQUA)))
-            self.sync()
-        elif data.message == (0, '@chance'):
-            assert self.identification.require_level(data, 1)
-            try:
-                new_chance = int(data.message[1])
-            except IndexError:
-                data.target.message("%s[AI]%s: Chance is currently set to: %s%s." %
-                    (Escapes.RED, Escapes.BLACK, (Escapes.BOLD + Escapes.AQUA), self.response_chances[data.target.to_s()]))
-                return
-            except Exception, e:
-                data.target.message("%s[AI]%s: Error setting chance: %s%s" % (Escapes.RED, Escapes.BLACK, (Escapes.BOLD + Escapes.AQUA), e.message))
-                return
-            self.response_chances[data.target.to_s()] = new_chance
-            data.target.message("%s[AI]%s: Set chance to %s%s." % (Escapes.RED, Escapes.BLACK, (Escapes.BOLD + Escapes.AQUA), new_chance))
-        elif data.message == (0, '@ignore'):
-            assert self.identification.require_level(data, 1)
-            if data.target.to_s() in self.ignored:
-                self.ignored.remove(data.target.to_s())
-                data.target.message("%s[AI]%s: No longer ignoring %s." % (Escapes.RED, Escapes.BLACK, data.target.to_s()))
-            elif data.target.to_s() not in self.ignored:
-                self.ignored.append(data.target.to_s())
-                data.target.message("%s[AI]%s: Ignoring %s." % (Escapes.RED, Escapes.BLACK, data.target.to_s()))
-        elif data.message == (0, self.connection.nick + ",") or data.message == (0, self.connection.nick + ":") or data.message == (0, self.connection.nick):
+        if data.message == (0, self.connection.nick + ",") or data.message == (0, self.connection.nick + ":") or data.message == (0, self.connection.nick):
             if data.target.to_s() in self.ignored:
                 return
             data.target.message(self.brain.get_reply(data.origin.nick + ", " + ' '.join(data.message[1:])))
@@ -109,6 +83,49 @@ class ArtificialIntelligence(Plugin):
             if resp < self.response_chances[data.target.to_s()]:
                 data.target.message(self.brain.get_reply(data.message.to_s()))
 
+    @offload
+    def learn(self, data):
+
+        assert self.identification.require_level(data, 1)
+        try:
+            url = data.message[1]
+        except IndexError:
+            data.target.message("%s[AI]%s: %sPlease provide a URL to learn from." % (Escapes.RED, Escapes.BLACK, (Escapes.BOLD + Escapes.AQUA)))
+            return
+        content = urlopen(url).read().split('\n')
+        for line in content:
+            if line is '':
+                continue
+            else:
+                self.brain.learn(line)
+        data.target.message("%s[AI]%s: %sLearned from %s%s%s lines." % (Escapes.RED, Escapes.BLACK, (Escapes.BOLD + Escapes.AQUA), Escapes.LIGHT_BLUE, len(content), (Escapes.BOLD + Escapes.AQUA)))
+        self.sync()
+
+    def chance(self, data):
+
+        assert self.identification.require_level(data, 1)
+        try:
+            new_chance = int(data.message[1])
+        except IndexError:
+            data.target.message("%s[AI]%s: Chance is currently set to: %s%s." %
+                (Escapes.RED, Escapes.BLACK, (Escapes.BOLD + Escapes.AQUA), self.response_chances.get(data.target.to_s(), self.default_chance)))
+            return
+        except Exception, e:
+            data.target.message("%s[AI]%s: Error setting chance: %s%s" % (Escapes.RED, Escapes.BLACK, (Escapes.BOLD + Escapes.AQUA), e.message))
+            return
+        self.response_chances[data.target.to_s()] = new_chance
+        data.target.message("%s[AI]%s: Set chance to %s%s." % (Escapes.RED, Escapes.BLACK, (Escapes.BOLD + Escapes.AQUA), new_chance))
+
+    def ignore(self, data):
+
+        assert self.identification.require_level(data, 1)
+        if data.target.to_s() in self.ignored:
+            self.ignored.remove(data.target.to_s())
+            data.target.message("%s[AI]%s: No longer ignoring %s." % (Escapes.RED, Escapes.BLACK, data.target.to_s()))
+        elif data.target.to_s() not in self.ignored:
+            self.ignored.append(data.target.to_s())
+            data.target.message("%s[AI]%s: Ignoring %s." % (Escapes.RED, Escapes.BLACK, data.target.to_s()))
+
 __data__ = {
     'name'    : 'ArtificialIntelligence',
     'version' : '1.0',
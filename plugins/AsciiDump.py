@@ -20,12 +20,12 @@ class AsciiDump(Plugin):
 
         Plugin.__init__(self, needs_dir, needs_comm_pipe)
         
-        self.get_event("MessageEvent").register(self.handler)
+        self.register_command("@ascii-dump", self.dump)
         self.get_event("PluginsLoadedEvent").register(self.__on_plugins_loaded)
     
     def __deinit__(self):
     
-        self.get_event("MessageEvent").deregister(self.handler)
+        self.deregister_command("@ascii-dump")
         self.get_event("PluginsLoadedEvent").deregister(self.__on_plugins_loaded)
 
     def __on_plugins_loaded(self):
@@ -39,28 +39,27 @@ class AsciiDump(Plugin):
         else:
             return False
     
-    def handler(self, data):
+    def dump(self, data):
     
-        if data.message == (0, "@ascii-dump"):
-            assert self.identification.require_level(data, 1)
-            try:
-                artfile = data.message[1]
-            except IndexError:
-                data.target.message("%s[AsciiDump]: %sPlease provide the name of an art file to dump." % (Escapes.BOLD, Escapes.GREEN))
+        assert self.identification.require_level(data, 1)
+        try:
+            artfile = data.message[1]
+        except IndexError:
+            data.target.message("%s[AsciiDump]: %sPlease provide the name of an art file to dump." % (Escapes.BOLD, Escapes.GREEN))
+            return
+        try:
+            file_path = self.get_path() + "%s.txt" % (artfile)
+            if not self.__is_contained(self.get_path(), file_path):
+                data.target.message("%s[AsciiDump]: %sInvalid art file path!" % (Escapes.BOLD, Escapes.GREEN))
                 return
-            try:
-                file_path = self.get_path() + "%s.txt" % (artfile)
-                if not self.__is_contained(self.get_path(), file_path):
-                    data.target.message("%s[AsciiDump]: %sInvalid art file path!" % (Escapes.BOLD, Escapes.GREEN))
-                    return
-                with closing(open(file_path, 'r')) as art:
-                    for line in art.readlines():
-                        data.target.message(line)
-            except IOError:
-                data.target.message("%s[AsciiDump]: %sCould not open the art file." % (Escapes.BOLD, Escapes.GREEN))
-            except:
-                data.target.message("%s[AsciiDump]: %sAn error occurred while dumping the art file." % (Escapes.BOLD, Escapes.GREEN))
-                [self.log_error(line) for line in traceback.format_exc(4).split('\n')]
+            with closing(open(file_path, 'r')) as art:
+                for line in art.readlines():
+                    data.target.message(line)
+        except IOError:
+            data.target.message("%s[AsciiDump]: %sCould not open the art file." % (Escapes.BOLD, Escapes.GREEN))
+        except:
+            data.target.message("%s[AsciiDump]: %sAn error occurred while dumping the art file." % (Escapes.BOLD, Escapes.GREEN))
+            [self.log_error(line) for line in traceback.format_exc(4).split('\n')]
 
 __data__ = {
     'name'      : 'AsciiDump',
@@ -9,6 +9,7 @@ import os, logging, ashiema, sys, traceback, re, json
 from ashiema import Plugin, Events, util
 from ashiema.util import Escapes, unescape, fix_unicode
 from ashiema.Plugin import Plugin
+from ashiema.Executor import offload
 from ashiema.HelpFactory import Contexts, CONTEXT, PARAMS, DESC, ALIASES
 from urllib import urlopen, urlencode
 from datetime import timedelta
@@ -21,8 +22,7 @@ class GoogleSearch(Plugin):
         
         self.cache = {}
         
-        self.get_event("MessageEvent").register(self.handler)
-        self.get_event("PMEvent").register(self.handler)
+        self.register_command("@google", self.search)
         
         self.__cache_clean_job = self.scheduler.create_job(
             "GoogleSearch__scheduled_cache_clean", self.clean_cache, timedelta(days = 1), recurring = True)
@@ -32,8 +32,7 @@ class GoogleSearch(Plugin):
         
     def __deinit__(self):
     
-        self.get_event("MessageEvent").deregister(self.handler)
-        self.get_event("PMEvent").deregister(self.handler)
+        self.deregister_command("@google")
         
         self.scheduler.remove_job(self.__cache_clean_job)
     
@@ -41,51 +40,51 @@ class GoogleSearch(Plugin):
     
         self.cache.clear()
     
-    def handler(self, data):
-    
-        if data.message == (0, '@google'):
-            try: query = " ".join(data.message[1:])
-            except (IndexError):
-                data.respond_to_user("[" + self.prefix + "Search]: You must provide a term to search!")
-                return
-            if query in self.cache:
-                if self.cache[query] == (None, None):
-                    data.respond_to_user("[" + self.prefix + "Search]: No results could be found. Please refine your search terms.")
-                    return
-                title, url = self.cache[query]
-                # display result
-                try:
-                    data.respond_to_user("[" + self.prefix + "Search]: %s%s%s, %s" % (Escapes.BOLD, title, Escapes.BOLD, url))
-                    return
-                except (UnicodeEncodeError):
-                    data.respond_to_user("[" + self.prefix + "Search]: %sIncomplete Search%s, %s" % (Escapes.BOLD, Escapes.BOLD, url))
-                    return
-            data.respond_to_user("[" + self.prefix + "Search]: Searching...")
-            target_url = self.url + "%s" % (
-                urlencode(
-                    {
-                        "v" : "1.0",
-                        "q" : query
-                    }
-                )
-            )
-            response = urlopen(target_url)
-            response = json.loads(response.read())
-            if response['responseStatus'] != 200:
-                code = response['responseStatus']
-                error = response['responseDetails']
-                data.respond_to_user("[" + self.prefix + "Search]: An error occurred while searching!")
-                data.respond_to_user("[" + self.prefix + "Search]: Failed with code [" + str(code) + "]: " + error)
+    @offload
+    def search(self, data):
+
+        try: query = " ".join(data.message[1:])
+        except (IndexError):
+            data.respond_to_user("[" + self.prefix + "Search]: You must provide a term to search!")
+            return
+        if query in self.cache:
+            if self.cache[query] == (None, None):
+                data.respond_to_user("[" + self.prefix + "Search]: No results could be found. Please refine your search terms.")
                 return
+            title, url = self.cache[query]
+            # display result
             try:
-                title = unescape(response['responseData']['results'][0]['titleNoFormatting'])
-                url = response['responseData']['results'][0]['url']
-            except (Exception):
-                self.cache[query] = (None, None)
-                return self.handler(data)
-            self.cache[query] = (title, url)
-            # re-call myself, so that there's not as much duplicate code.
-            return self.handler(data)
+                data.respond_to_user("[" + self.prefix + "Search]: %s%s%s, %s" % (Escapes.BOLD, title, Escapes.BOLD, url))
+                return
+            except (UnicodeEncodeError):
+                data.respond_to_user("[" + self.prefix + "Search]: %sIncomplete Search%s, %s" % (Escapes.BOLD, Escapes.BOLD, url))
+                return
+        data.respond_to_user("[" + self.prefix + "Search]: Searching...")
+        target_url = self.url + "%s" % (
+            urlencode(
+                {
+                    "v" : "1.0",
+                    "q" : query
+                }
+            )
+        )
+        response = urlopen(target_url)
+        response = json.loads(response.read())
+        if response['responseStatus'] != 200:
+            code = response['responseStatus']
+            error = response['responseDetails']
+            data.respond_to_user("[" + self.prefix + "Search]: An error occurred while searching!")
+            data.respond_to_user("[" + self.prefix + "Search]: Failed with code [" + str(code) + "]: " + error)
+            return
+        try:
+            title = unescape(response['responseData']['results'][0]['titleNoFormatting'])
+            url = response['responseData']['results'][0]['url']
+        except (Exception):
+            self.cache[query] = (None, None)
+            return self.search(data)
+        self.cache[query] = (title, url)
+        # re-call myself, so that there's not as much duplicate code.
+        return self.search(data)
 
 __data__ = {
     'name'      : 'GoogleSearch',
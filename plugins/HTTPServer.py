@@ -84,7 +84,9 @@ class HTTPServer(Plugin):
 
         self.__ready_event = self.get_event("HTTPServerHandlerRegistrationReady")
         
-        self.get_event("MessageEvent").register(self.handler)
+        self.register_command("@httpd-start", self.start_command)
+        self.register_command("@httpd-stop", self.stop_command)
+        self.register_command("@httpd-status", self.status_command)
         self.get_event("PluginsLoadedEvent").register(self.__on_plugins_loaded)
 
     def __deinit__(self):
@@ -95,7 +97,9 @@ class HTTPServer(Plugin):
         if HTTPServer.running:
             self.__stop()
         
-        self.get_event("MessageEvent").deregister(self.handler)
+        self.deregister_command("@httpd-start")
+        self.deregister_command("@httpd-stop")
+        self.deregister_command("@httpd-status")
         self.get_event("PluginsLoadedEvent").deregister(self.__on_plugins_loaded)
 
     def __on_plugins_loaded(self):
@@ -268,35 +272,38 @@ class HTTPServer(Plugin):
         resource_handler = HTTPResourceHandler(self, path = resource_path, route = resource_route)
         resource_handler.register()
 
-    def handler(self, data):
+    def start_command(self, data):
     
-        if data.message == (0, '@httpd-start'):
-            assert self.identification.require_level(data, 2)
-            if HTTPServer.running:
-                data.respond_to_user("The HTTP server is already running.")
-            elif not HTTPServer.running:
-                try:
-                    self.__start()
-                    data.respond_to_user("The HTTP server is starting...")
-                except:
-                    data.respond_to_user("The HTTP server could not be started.")
-        elif data.message == (0, '@httpd-stop'):
-            assert self.identification.require_level(data, 2)
-            if not HTTPServer.running:
-                data.respond_to_user("The HTTP server is not running.")
-            elif HTTPServer.running:
-                try:
-                    self.__stop()
-                    data.respond_to_user("The HTTP server is stopping...")
-                except:
-                    data.respond_to_user("Could not stop the HTTP server.")
-        elif data.message == (0, '@httpd-status'):
-            assert self.identification.require_level(data, 1)
-            if HTTPServer.running:
-                data.respond_to_user("The HTTP server is currently active.")
-                data.respond_to_user("Content is being served at %s:%s." % (self.config['bind_host'], self.config['bind_port']))
-            elif not HTTPServer.running:
-                data.respond_to_user("The HTTP server is currently inactive.")
+        assert self.identification.require_level(data, 2)
+        if HTTPServer.running:
+            data.respond_to_user("The HTTP server is already running.")
+        elif not HTTPServer.running:
+            try:
+                self.__start()
+                data.respond_to_user("The HTTP server is starting...")
+            except:
+                data.respond_to_user("The HTTP server could not be started.")
+
+    def stop_command(self, data):
+
+        assert self.identification.require_level(data, 2)
+        if not HTTPServer.running:
+            data.respond_to_user("The HTTP server is not running.")
+        elif HTTPServer.running:
+            try:
+                self.__stop()
+                data.respond_to_user("The HTTP server is stopping...")
+            except:
+                data.respond_to_user("Could not stop the HTTP server.")
+
+    def status_command(self, data):
+
+        assert self.identification.require_level(data, 1)
+        if HTTPServer.running:
+            data.respond_to_user("The HTTP server is currently active.")
+            data.respond_to_user("Content is being served at %s:%s." % (self.config['bind_host'], self.config['bind_port']))
+        elif not HTTPServer.running:
+            data.respond_to_user("The HTTP server is currently inactive.")
         
     def register_handler(self, handler):
     
@@ -333,6 +340,7 @@ class HTTPServerHandlerRegistrationReady(Event):
     def __init__(self):
         Event.__init__(self, "HTTPServerHandlerRegistrationReady")
         self.__register__()
+        self.commands = []
     
     def match(self, data):
         pass
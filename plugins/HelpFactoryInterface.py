@@ -20,32 +20,29 @@ class HelpFactoryInterface(Plugin):
         
         self.helpfactory = HelpFactory.get_instance()
         
-        self.get_event("MessageEvent").register(self.handler)
-        self.get_event("PMEvent").register(self.handler)
+        self.register_command("help", self.help)
+        self.register_command("@help", self.help)
     
     def __deinit__(self):
     
-        self.get_event("MessageEvent").deregister(self.handler)
-        self.get_event("PMEvent").deregister(self.handler)
+        self.deregister_command("help")
+        self.deregister_command("@help")
     
-    def handler(self, data):
+    def help(self, data):
 
-        if ((data.message == (0, 'help') or data.message == (0, '@help')) and data.target.is_self()) or (data.message == (0, '@help') and not data.target.is_self()):
-            if data.message.has_index(1): # there is an argument.
-                data.origin.notice("Help for %s%s%s." % (Escapes.BOLD, data.message[1], Escapes.BOLD))
-                for entry in self.helpfactory.getHelpForPlugin(data.message[1]):
-                    if entry is None:
-                        data.origin.notice("There is no help for %s%s%s." % (Escapes.BOLD, data.message[1], Escapes.BOLD))
-                    data.origin.notice("%s%s%s: %s" % (Escapes.BOLD, entry[NAME], Escapes.BOLD, entry[DESC]))
-                    data.origin.notice(" - Context: %s" % (entry[CONTEXT]))
-                    data.origin.notice(" - Aliases: %s" % (entry[ALIASES] if entry.__contains__(ALIASES) else []))
-                    data.origin.notice(" - Parameters: %s" % (entry[PARAMS] if entry[PARAMS] is not '' else 'None!'))
-            elif not data.message.has_index(1): # no arguments
-                data.origin.notice("Help topics:")
-                for entry in self.helpfactory._help.keys():
-                    data.origin.notice(" - %s%s%s" % (Escapes.BOLD, entry, Escapes.BOLD))
-                data.origin.notice("End of topic list.")
-                    
+        if data.message.has_index(1): # there is an argument.
+            data.origin.notice("Help for %s%s%s." % (Escapes.BOLD, data.message[1], Escapes.BOLD))
+            for entry in self.helpfactory.getHelpForPlugin(data.message[1]):
+                if entry is None:
+                    data.origin.notice("There is no help for %s%s%s." % (Escapes.BOLD, data.message[1], Escapes.BOLD))
+                data.origin.notice("%s%s%s: %s" % (Escapes.BOLD, entry[NAME], Escapes.BOLD, entry[DESC]))
+                data.origin.notice(" - Context: %s" % (entry[CONTEXT]))
+                data.origin.notice(" - Aliases: %s" % (entry[ALIASES] if entry.__contains__(ALIASES) else []))
+                data.origin.notice(" - Parameters: %s" % (entry[PARAMS] if entry[PARAMS] is not '' else 'None!'))
+        elif not data.message.has_index(1): # no arguments
+            data.origin.notice("Help topics:")
+            data.origin.notice(*["%s%s%s" % (Escapes.BOLD, entry, Escapes.BOLD) for entry in self.helpfactory._help.keys()], pack = True)
+            data.origin.notice("End of topic list.")
 
 __data__ = {
     'name'      : 'HelpFactoryInterface',
@@ -17,7 +17,10 @@ class IdentificationPlugin(Plugin):
 
         Plugin.__init__(self, needs_dir = True)
         
-        self.get_event("PMEvent").register(self.handler)
+        self.register_command("login", self.login)
+        self.register_command("logout", self.logout)
+        self.register_command("register", self.register_account)
+        self.register_command("setlevel", self.set_level)
         
         self.logins = {}
         self.accounts = {}
@@ -29,7 +32,10 @@ class IdentificationPlugin(Plugin):
         
     def __deinit__(self):
 
-        self.get_event("PMEvent").deregister(self.handler)
+        self.deregister_command("login")
+        self.deregister_command("logout")
+        self.deregister_command("register")
+        self.deregister_command("setlevel")
         
         self.__persist_logins__()
         
@@ -123,97 +129,102 @@ class IdentificationPlugin(Plugin):
         elif level_r >= level:
             return True
     
-    def handler(self, data):
-
-        if data.message == (0, 'login'):
-            try: 
-                if len(data.message[1:]) == 2:
-                    username = data.message[1]
-                    password = data.message[2]
-                elif len(data.message[1:]) == 1:
-                    username = data.origin.nick
-                    password = data.message[1]
-                else:
-                    raise IndexError('Invalid number of arguments specified')
-            except (IndexError):
-                data.origin.notice('Invalid parameters.')
-                return
-            if not self.__check_user__(username):
-                data.origin.notice('Invalid username.')
-                return
-            if self.__check_login__(data.origin.to_s()):
-                data.origin.notice('You are already logged in.')
-                return
-            elif self.__check_user__(username) and md5(password) == self.accounts[username]['password']:
-                self.logins.update(
-                    {
-                        data.origin.to_s(): username
-                    }
-                )
-                data.origin.notice('Logged in as %s%s%s.' % (Escapes.BOLD, username, Escapes.BOLD))
-                return
-            elif md5(password) != self.accounts[username]['password']:
-                data.origin.notice('Invalid password.')
-                return
-        elif data.message == (0, 'logout'):
-            if not self.__check_login__(data.origin.to_s()):
-                data.origin.notice('You are not logged in.')
-                return
-            del self.logins[data.origin.to_s()]
-            data.origin.notice('You have been logged out.')
-            return
-        elif data.message == (0, 'register'):
-            try:
+    def login(self, data):
+
+        try: 
+            if len(data.message[1:]) == 2:
                 username = data.message[1]
                 password = data.message[2]
-            except (IndexError):
-                data.origin.notice('Invalid parameters.')
-                return
-            if len(password) >= 8:
-                self.accounts.update(
+            elif len(data.message[1:]) == 1:
+                username = data.origin.nick
+                password = data.message[1]
+            else:
+                raise IndexError('Invalid number of arguments specified')
+        except (IndexError):
+            data.origin.notice('Invalid parameters.')
+            return
+        if not self.__check_user__(username):
+            data.origin.notice('Invalid username.')
+            return
+        if self.__check_login__(data.origin.to_s()):
+            data.origin.notice('You are already logged in.')
+            return
+        elif self.__check_user__(username) and md5(password) == self.accounts[username]['password']:
+            self.logins.update(
+                {
+                    data.origin.to_s(): username
+                }
+            )
+            data.origin.notice('Logged in as %s%s%s.' % (Escapes.BOLD, username, Escapes.BOLD))
+            return
+        elif md5(password) != self.accounts[username]['password']:
+            data.origin.notice('Invalid password.')
+            return
+
+    def logout(self, data):
+
+        if not self.__check_login__(data.origin.to_s()):
+            data.origin.notice('You are not logged in.')
+            return
+        del self.logins[data.origin.to_s()]
+        data.origin.notice('You have been logged out.')
+        return
+
+    def register_account(self, data):
+
+        try:
+            username = data.message[1]
+            password = data.message[2]
+        except (IndexError):
+            data.origin.notice('Invalid parameters.')
+            return
+        if len(password) >= 8:
+            self.accounts.update(
+                {
+                    username: {
+                            'password' : md5(password),
+                            'level'    : 0
+                    }
+                }
+            )
+            data.origin.notice('Registered as %s.' % (username))
+            self.accounts.sync()
+            return
+        else:
+            data.origin.notice('Password %smust%s be greater than or equal to eight characters.' % (Escapes.BOLD, Escapes.BOLD))
+            return
+
+    def set_level(self, data):
+
+        try:
+            username = data.message[1]
+            level = data.message[2]
+            level = int(level)
+        except (IndexError):
+            data.origin.notice('Invalid parameters.')
+            return
+        if self.__check_user__(data.origin.to_s()):
+            if self.accounts[data.origin.to_s()]['level'] == 2:
+                if username not in self.shelve:
+                    data.origin.notice('Invalid username.')
+                    return
+                elif level not in xrange(0, 3):
+                    data.origin.notice('Invalid permissions level.')
+                    return
+                self.shelve[username].update(
                     {
-                        username: {
-                                'password' : md5(password),
-                                'level'    : 0
-                        }
+                        'level': level
                     }
                 )
-                data.origin.notice('Registered as %s.' % (username))
+                data.origin.notice('Set permission level for %s%s%s to %s%d%s.' % (Escapes.BOLD, username, Escapes.BOLD, Escapes.BOLD, levelEscapes.BOLD))
                 self.accounts.sync()
                 return
             else:
-                data.origin.notice('Password %smust%s be greater than or equal to eight characters.' % (Escapes.BOLD, Escapes.BOLD))
-                return
-        elif data.message == (0, 'setlevel'):
-            try:
-                username = data.message[1]
-                level = data.message[2]
-                level = int(level)
-            except (IndexError):
-                data.origin.notice('Invalid parameters.')
-                return
-            if self.__check_user__(data.origin.to_s()):
-                if self.accounts[data.origin.to_s()]['level'] == 2:
-                    if username not in self.shelve:
-                        data.origin.notice('Invalid username.')
-                        return
-                    elif level not in xrange(0, 3):
-                        data.origin.notice('Invalid permissions level.')
-                        return
-                    self.shelve[username].update(
-                        {
-                            'level': level
-                        }
-                    )
-                    data.origin.notice('Set permission level for %s%s%s to %s%d%s.' % (Escapes.BOLD, username, Escapes.BOLD, Escapes.BOLD, levelEscapes.BOLD))
-                    self.accounts.sync()
-                    return
-                else:
-                    data.origin.notice('You do not have access to permission levels.')
-                    return
-            elif not self.__check_user__(data.origin.to_s()):
-                data.origin.notice('You are not a registered user.')
+                data.origin.notice('You do not have access to permission levels.')
                 return
+        elif not self.__check_user__(data.origin.to_s()):
+            data.origin.notice('You are not a registered user.')
+            return
 
 __data__ = {
     'name'     : 'IdentificationPlugin',
@@ -38,14 +38,16 @@ class LogReader(Plugin):
         self.channel = self.config['channel']
         self.files = self.config['files'].split(',')
         
-        self.get_event("MessageEvent").register(self.handler)
+        self.register_command("@log-filter", self.log_filter)
+        self.register_command("@clear-log-filter", self.clear_log_filter)
         self.get_event("PluginsLoadedEvent").register(self.__on_plugins_loaded)
         
         self.__load_filters__()
     
     def __deinit__(self):
     
-        self.get_event("MessageEvent").deregister(self.handler)
+        self.deregister_command("@log-filter")
+        self.deregister_command("@clear-log-filter")
         self.get_event("PluginsLoadedEvent").deregister(self.__on_plugins_loaded)
         
         self.__stop()
@@ -249,53 +251,54 @@ class LogReader(Plugin):
         
         self.__start()
     
-    def handler(self, data):
+    def log_filter(self, data):
         
-        if data.message == (0, "@log-filter"):
-            assert self.identification.require_level(data, 2)
-            term, instruction = None, None
-            try:
-                if len(data.message[1:]) >= 2:
-                    instruction = data.message[1]
-                    term = ' '.join(data.message[2:])
-                    self.filters.update({term : instruction})
-                    data.respond_to_user("Log filtering has been enabled for term: '%s'" % (term))
-                    data.respond_to_user("Action taken when term is matched: %s" % (self.filters[term].upper()))
-                    self.__restart()
-                elif len(data.message[1:]) == 1:
-                    term = data.message[1]
-                    if term in self.filters:
-                        data.respond_to_user("Log filtering is enabled for term: %s" % (term))
-                        data.respond_to_user("Action taken when term is matched: %s" % (self.filters[term].upper()))
-                        return
-                    else:
-                        data.respond_to_user("Log filtering is %sNOT%s enabled for term: %s" % (Escapes.RED, Escapes.BLACK, term))
-                        return
-                elif len(data.message()) == 1:
-                    if len(self.filters) > 0:
-                        data.respond_to_user("Enabled log filters:")
-                        for term, instruction in self.filters.iteritems():
-                            data.respond_to_user("  '%s%s%s' => %s" % (Escapes.BOLD, term, Escapes.BLACK, instruction))
-                    else:
-                        data.respond_to_user("There are no log filters set.")
-            except Exception as e:
-                [self.log_info(line) for line in traceback.format_exc(4).split("\n")]
-        elif data.message == (0, "@clear-log-filter"):
-            assert self.identification.require_level(data, 2)
-            term = None
-            try:
-                term = ' '.join(data.message[1:])
+        assert self.identification.require_level(data, 2)
+        term, instruction = None, None
+        try:
+            if len(data.message[1:]) >= 2:
+                instruction = data.message[1]
+                term = ' '.join(data.message[2:])
+                self.filters.update({term : instruction})
+                data.respond_to_user("Log filtering has been enabled for term: '%s'" % (term))
+                data.respond_to_user("Action taken when term is matched: %s" % (self.filters[term].upper()))
+                self.__restart()
+            elif len(data.message[1:]) == 1:
+                term = data.message[1]
                 if term in self.filters:
-                    del self.filters[term]
-                    data.respond_to_user("Cleared filter for term '%s'." % (term))
-                    self.__restart()
+                    data.respond_to_user("Log filtering is enabled for term: %s" % (term))
+                    data.respond_to_user("Action taken when term is matched: %s" % (self.filters[term].upper()))
+                    return
                 else:
-                    data.respond_to_user("There is no filter set for '%s'." % (term))
-            except IndexError as e:
-                data.respond_to_user("You must provide a term to clear.")
-                return
-            except Exception as e:
-                [self.log_info(line) for line in traceback.format_exc(4).split("\n")]
+                    data.respond_to_user("Log filtering is %sNOT%s enabled for term: %s" % (Escapes.RED, Escapes.BLACK, term))
+                    return
+            elif len(data.message()) == 1:
+                if len(self.filters) > 0:
+                    data.respond_to_user("Enabled log filters:")
+                    for term, instruction in self.filters.iteritems():
+                        data.respond_to_user("  '%s%s%s' => %s" % (Escapes.BOLD, term, Escapes.BLACK, instruction))
+                else:
+                    data.respond_to_user("There are no log filters set.")
+        except Exception as e:
+            [self.log_info(line) for line in traceback.format_exc(4).split("\n")]
+
+    def clear_log_filter(self, data):
+
+        assert self.identification.require_level(data, 2)
+        term = None
+        try:
+            term = ' '.join(data.message[1:])
+            if term in self.filters:
+                del self.filters[term]
+                data.respond_to_user("Cleared filter for term '%s'." % (term))
+                self.__restart()
+            else:
+                data.respond_to_user("There is no filter set for '%s'." % (term))
+        except IndexError as e:
+            data.respond_to_user("You must provide a term to clear.")
+            return
+        except Exception as e:
+            [self.log_info(line) for line in traceback.format_exc(4).split("\n")]
             
 __data__ = {
     'name'      : 'LogReader',
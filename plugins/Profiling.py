@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+import json, textwrap, traceback
+from contextlib import closing
+from datetime import timedelta
+from ashiema.Metrics import format_labels, format_value
+from ashiema.Plugin import Plugin
+from ashiema.HelpFactory import Contexts, CONTEXT, DESC, PARAMS, ALIASES
+
+def format_stats(entry):
+
+    return "%s for %s: %d calls, %.3fs total, %.2fms avg, %.2fms max, %d errors" % (
+        entry['callback'], entry['source'], entry['calls'], entry['total'],
+        entry['total'] * 1000 / entry['calls'] if entry['calls'] else 0.0, entry['max'] * 1000, entry['errors'])
+
+class Profiling(Plugin):
+    """ shows how much time plugin callbacks take, from the counts EventHandler keeps for every
+        (event or command, callback) pair, and the metrics the core and plugins record.
+
+        the `callbacks` command replies with the busiest callbacks, and `metrics` with the
+        current metric values. if the HTTPServer plugin is loaded, the same are served at
+        /callbacks and /metrics (in the Prometheus text format); the web server runs in its own
+        process, so it serves snapshots that are written to the plugin directory every
+        SNAPSHOT_INTERVAL seconds. """
+
+    SNAPSHOT_INTERVAL = 15
+    # values `metrics` replies with at most, so that a reply stays well below max-backlog.
+    METRICS_LINES = 15
+
+    def __init__(self):
+
+        Plugin.__init__(self, needs_dir = True)
+
+        self.register_command("callbacks", self.callbacks)
+        self.register_command("metrics", self.show_metrics)
+        self.get_event("PluginsLoadedEvent").register(self.__load_identification)
+
+        self.__http_ready = self.get_event("HTTPServerHandlerRegistrationReady")
+        self.__snapshot_job = None
+        if self.__http_ready is not None:
+            self.__http_ready.register(self.__http_server_ready)
+            self.__snapshot_job = self.scheduler.create_job(
+                "Profiling__snapshot", self.__write_snapshot, timedelta(seconds = Profiling.SNAPSHOT_INTERVAL), recurring = True)
+
+    def __deinit__(self):
+
+        self.deregister_command("callbacks")
+        self.deregister_command("metrics")
+        self.get_event("PluginsLoadedEvent").deregister(self.__load_identification)
+
+        if self.__http_ready is not None:
+            self.__http_ready.deregister(self.__http_server_ready)
+            self.scheduler.remove_job(self.__snapshot_job)
+
+    def __load_identification(self):
+
+        self.identification = self.get_plugin('IdentificationPlugin')
+
+    def __write_snapshot(self):
+
+        try:
+            with closing(open(self.get_path() + "callbacks.json", 'w')) as snapshot:
+                json.dump(self.eventhandler.get_callback_stats(), snapshot)
+            with closing(open(self.get_path() + "metrics.txt", 'w')) as snapshot:
+                snapshot.write(self.metrics.format())
+        except (IOError, OSError) as e:
+            [self.log_error(trace) for trace in traceback.format_exc(4).split('\n')]
+
+    def __http_server_ready(self, data = None):
+
+        HTTPRequestHandler = self.get_plugin('HTTPServer').get_handler_class()
+
+        class HTTPCallbackStatsHandler(HTTPRequestHandler):
+
+            def __init__(self, plugin, route = None):
+
+                HTTPRequestHandler.__init__(self, plugin)
+
+                self.route = route
+
+            def __call__(self, environment, start_response):
+
+                try:
+                    with closing(open(self.plugin.get_path() + "callbacks.json", 'r')) as snapshot:
+                        stats = json.load(snapshot)
+                except (IOError, ValueError) as e:
+                    stats = []
+                start_response(self.response_codes['OK'], [('Content-Type', 'text/plain')])
+                yield "callback times, busiest first (updated every %d seconds):\n" % (Profiling.SNAPSHOT_INTERVAL)
+                for entry in stats:
+                    yield format_stats(entry) + "\n"
+
+        class HTTPMetricsHandler(HTTPRequestHandler):
+
+            def __init__(self, plugin, route = None):
+
+                HTTPRequestHandler.__init__(self, plugin)
+
+                self.route = route
+
+            def __call__(self, environment, start_response):
+
+                try:
+                    with closing(open(self.plugin.get_path() + "metrics.txt", 'r')) as snapshot:
+                        metrics = snapshot.read()
+                except IOError as e:
+                    metrics = ''
+                start_response(self.response_codes['OK'], [('Content-Type', 'text/plain; version=0.0.4')])
+                yield metrics
+
+        self.__write_snapshot()
+        handler = HTTPCallbackStatsHandler(self, route = r"""callbacks/?$""")
+        handler.register()
+        handler = HTTPMetricsHandler(self, route = r"""metrics/?$""")
+        handler.register()
+
+    def callbacks(self, data):
+
+        assert self.identification.require_level(data, 2)
+        if len(data.message[1:]) > 0 and data.message[1] == 'reset':
+            self.eventhandler.reset_callback_stats()
+            data.origin.message("Callback times have been reset.")
+            return
+        try: count = int(data.message[1]) if len(data.message[1:]) > 0 else 10
+        except ValueError:
+            data.origin.message("Usage: callbacks [count|reset]")
+            return
+        stats = [entry for entry in self.eventhandler.get_callback_stats() if entry['calls'] > 0]
+        if not stats:
+            data.origin.message("No callbacks have been called yet.")
+            return
+        for entry in stats[:count]:
+            data.origin.message(format_stats(entry))
+
+    def show_metrics(self, data):
+
+        assert self.identification.require_level(data, 2)
+        if not len(data.message[1:]) > 0:
+            # every value would flood the send queue; name the metrics instead.
+            names = [metric.name for metric in self.metrics.get_metrics()]
+            for line in textwrap.wrap("%d metrics: %s." % (len(names), ', '.join(names)), 400):
+                data.origin.message(line)
+            data.origin.message("Give a prefix to see their values, ie. `metrics ashiema_lag`; all of them are at /metrics if the HTTPServer plugin is loaded.")
+            return
+        prefix = data.message[1]
+        # histogram buckets would take too many lines; their sums and counts are shown.
+        samples = [(name, labels, value) for name, labels, value in self.metrics.collect(prefix) if not name.endswith('_bucket')]
+        if not samples:
+            data.origin.message("No metrics start with '%s'." % (prefix))
+            return
+        for name, labels, value in samples[:Profiling.METRICS_LINES]:
+            data.origin.message("%s%s %s" % (name, format_labels(labels), format_value(value)))
+        if len(samples) > Profiling.METRICS_LINES:
+            data.origin.message("... and %d more; give a longer prefix, or see /metrics." % (len(samples) - Profiling.METRICS_LINES))
+
+__data__ = {
+    'name'    : 'Profiling',
+    'version' : '1.0',
+    'require' : ['IdentificationPlugin'],
+    'main'    : Profiling,
+    'events'  : []
+}
+
+__help__ = {
+    'callbacks' : {
+        CONTEXT : Contexts.PRIVATE,
+        DESC    : 'Shows the plugin callbacks that took the most time, or starts counting again.',
+        PARAMS  : '[count|reset]',
+        ALIASES : []
+    },
+    'metrics'   : {
+        CONTEXT : Contexts.PRIVATE,
+        DESC    : 'Lists the metrics, or shows the current values of those that start with a prefix.',
+        PARAMS  : '[prefix]',
+        ALIASES : []
+    }
+}
@@ -44,7 +44,7 @@ class QRGenerator(Plugin):
 
         self.codes = shelve.Shelf({})
 
-        self.get_event("MessageEvent").register(self.handler)
+        self.register_command("@qr-encode", self.qr_encode)
         self.get_event("PluginsLoadedEvent").register(self.__load_identification)
         self.get_event("HTTPServerHandlerRegistrationReady").register(self.__http_server_ready)
         
@@ -52,7 +52,7 @@ class QRGenerator(Plugin):
 
     def __deinit__(self):
 
-        self.get_event("MessageEvent").deregister(self.handler)
+        self.deregister_command("@qr-encode")
         self.get_event("PluginsLoadedEvent").deregister(self.__load_identification)
         self.get_event("HTTPServerHandlerRegistrationReady").deregister(self.__http_server_ready)
         
@@ -154,21 +154,20 @@ class QRGenerator(Plugin):
         
         return id
 
-    def handler(self, data):
-
-        if data.message == (0, '@qr-encode'):
-            assert self.identification.require_level(data, 1)
-            try:
-                if len(data.message[1:]) > 1:
-                    input = " ".join(data.message[1:])
-                else:
-                    input = data.message[1]
-            except (IndexError) as e:
-                data.origin.notice("%s[QRGenerator]: %sPlease provide a string to encode." % (Escapes.LIGHT_BLUE, Escapes.GREEN))
-                return
-            data.origin.notice("%s[QRGenerator]: %sEncoding..." % (Escapes.LIGHT_BLUE, Escapes.GREEN))
-            qrid = self.__encode(input)
-            data.origin.notice("%s[QRGenerator]: %s/qr/%s" % (Escapes.LIGHT_BLUE, self.get_plugin('HTTPServer').get_base_url(), qrid))
+    def qr_encode(self, data):
+
+        assert self.identification.require_level(data, 1)
+        try:
+            if len(data.message[1:]) > 1:
+                input = " ".join(data.message[1:])
+            else:
+                input = data.message[1]
+        except (IndexError) as e:
+            data.origin.notice("%s[QRGenerator]: %sPlease provide a string to encode." % (Escapes.LIGHT_BLUE, Escapes.GREEN))
+            return
+        data.origin.notice("%s[QRGenerator]: %sEncoding..." % (Escapes.LIGHT_BLUE, Escapes.GREEN))
+        qrid = self.__encode(input)
+        data.origin.notice("%s[QRGenerator]: %s/qr/%s" % (Escapes.LIGHT_BLUE, self.get_plugin('HTTPServer').get_base_url(), qrid))
             
 
 __data__ = {
@@ -21,6 +21,8 @@ class StatsTracker(Plugin):
         self._db.update({ 'channels'  : {} })
 
         self.get_event('MessageEvent').register(self.handler)
+        self.register_command('@stats', self.user_stats)
+        self.register_command('@chanstats', self.channel_stats)
         
         self.__weekly_clean_job = self.scheduler.create_job(
             "StatsTracker__reset_weekly", self.__weekly_clean, timedelta(days = 7), recurring = True)
@@ -28,6 +30,8 @@ class StatsTracker(Plugin):
     def __deinit__(self):
     
         self.get_event('MessageEvent').deregister(self.handler)
+        self.deregister_command('@stats')
+        self.deregister_command('@chanstats')
         
         self.scheduler.remove_job(self.__weekly_clean_job)
 
@@ -40,44 +44,49 @@ class StatsTracker(Plugin):
         self.log_info('Stats have been cleared!')
 
     def handler(self, data):
+
+        if data.message.command in ('@stats', '@chanstats'):
+            return
+        channel, user = data.target.to_s(), data.origin.to_s()
+        if channel not in self._db['channels']:
+            self._db['channels'].update({ channel : {} })
+        if user not in self._db['channels'][channel]:
+            self._db['channels'][channel].update({ user : (0, 0, 0) })
+        wc, cc = len(data.message.split(' ')), len(data.message)
+        stat = (self._db['channels'][channel][user][0] + wc, self._db['channels'][channel][user][1] + cc, self._db['channels'][channel][user][2] + 1)
+        self._db['channels'][channel][user] = stat
+
+    def user_stats(self, data):
     
-        if data.message == (0, '@stats'):
-            channel, user = data.target.to_s(), data.origin.to_s()
-            if channel not in self._db['channels']:
-                self._db['channels'].update({ channel : {} })
-            if user not in self._db['channels'][channel]:
-                self._db['channels'][channel].update({ user : (0, 0, 0) })
-            stats = []
-            for channel, users in self._db['channels'].iteritems():
-                if user in users:
-                    stat = users[user]
-                    stats.append(stat)
-                    data.origin.notice("%s[StatsTracker]: Stats for %s%s%s: word count => %s, character count => %s, line count => %s" % (Escapes.AQUA, Escapes.BOLD, channel, Escapes.BOLD, stat[0], stat[1], stat[2]))
-            stats = [sum(set) for set in zip(*stats)]
-            data.origin.notice("%s[StatsTracker]: Total stats: word count => %s, character count => %s, line count => %s" % (Escapes.AQUA, stats[0], stats[1], stats[2]))
-        elif data.message == (0, '@chanstats'):
-            channel, user = data.target.to_s(), data.origin.to_s()
-            if channel not in self._db['channels']:
-                self._db['channels'].update({ channel : {} })
-                data.target.privmsg("%s[StatsTracker]: There are no channel stats available." % (Escapes.AQUA))
-                return
-            try: stat_set = self._db['channels'][channel].values()
-            except: 
-                data.target.privmsg("%s[StatsTracker]: An error occurred while gathering statistics." % (Escapes.AQUA))
-            stats = [sum(set) for set in zip(*stat_set)]
-            data.target.message("%s[StatsTracker]: Stats for %s%s%s:" % (Escapes.AQUA, Escapes.BOLD, channel, Escapes.BOLD),
-                                "   Word count: %s" % (stats[0]),
-                                "   Character count: %s" % (stats[1]),
-                                "   Line count: %s" % (stats[2]))
-        else:
-            channel, user = data.target.to_s(), data.origin.to_s()
-            if channel not in self._db['channels']:
-                self._db['channels'].update({ channel : {} })
-            if user not in self._db['channels'][channel]:
-                self._db['channels'][channel].update({ user : (0, 0, 0) })
-            wc, cc = len(data.message.split(' ')), len(data.message)
-            stat = (self._db['channels'][channel][user][0] + wc, self._db['channels'][channel][user][1] + cc, self._db['channels'][channel][user][2] + 1)
-            self._db['channels'][channel][user] = stat
+        channel, user = data.target.to_s(), data.origin.to_s()
+        if channel not in self._db['channels']:
+            self._db['channels'].update({ channel : {} })
+        if user not in self._db['channels'][channel]:
+            self._db['channels'][channel].update({ user : (0, 0, 0) })
+        stats = []
+        for channel, users in self._db['channels'].iteritems():
+            if user in users:
+                stat = users[user]
+                stats.append(stat)
+                data.origin.notice("%s[StatsTracker]: Stats for %s%s%s: word count => %s, character count => %s, line count => %s" % (Escapes.AQUA, Escapes.BOLD, channel, Escapes.BOLD, stat[0], stat[1], stat[2]))
+        stats = [sum(set) for set in zip(*stats)]
+        data.origin.notice("%s[StatsTracker]: Total stats: word count => %s, character count => %s, line count => %s" % (Escapes.AQUA, stats[0], stats[1], stats[2]))
+
+    def channel_stats(self, data):
+
+        channel, user = data.target.to_s(), data.origin.to_s()
+        if channel not in self._db['channels']:
+            self._db['channels'].update({ channel : {} })
+            data.target.privmsg("%s[StatsTracker]: There are no channel stats available." % (Escapes.AQUA))
+            return
+        try: stat_set = self._db['channels'][channel].values()
+        except: 
+            data.target.privmsg("%s[StatsTracker]: An error occurred while gathering statistics." % (Escapes.AQUA))
+        stats = [sum(set) for set in zip(*stat_set)]
+        data.target.message("%s[StatsTracker]: Stats for %s%s%s:" % (Escapes.AQUA, Escapes.BOLD, channel, Escapes.BOLD),
+                            "   Word count: %s" % (stats[0]),
+                            "   Character count: %s" % (stats[1]),
+                            "   Line count: %s" % (stats[2]))
 
 __data__ = {
     'name'      : 'StatsTracker',
@@ -5,12 +5,14 @@
 #
 # An extended version of the license is included with this software in `ashiema.py`.
 
-import os, ashiema, sys, logging, traceback
+import os, ashiema, sys, logging, time, traceback
 from ashiema import Connection, Plugin, Events, HelpFactory
-from ashiema.Connection import Connection
+from ashiema.Connection import Connection, RestartException
 from ashiema.Events import Event
 from ashiema.Plugin import Plugin
 from ashiema.PluginLoader import PluginLoader
+from ashiema.Sampler import Sampler
+from ashiema.Structures import UserRegistry
 from ashiema.HelpFactory import Contexts
 from ashiema.HelpFactory import CONTEXT, DESC, PARAMS, NAME, ALIASES
 from ashiema.util import Configuration
@@ -22,6 +24,7 @@ class SystemEvent(Event):
 
         Event.__init__(self, "SystemEvent")
         self.__register__()
+        self.commands = []
     
     def match(self, data):
 
@@ -33,56 +36,173 @@ class SystemEvent(Event):
         # 0 -> reload
         # 1 -> shutdown
         # 2 -> rehash
+        # 3 -> restart
         logging.getLogger('ashiema').info('Waiting for plugins to finish up...')
         for callback in self.callbacks.values():
             callback(data)
 
 class System(Plugin):
 
+    # longest a profile may run for, in seconds.
+    MAX_PROFILE = 300
+
     def __init__(self):
 
-        Plugin.__init__(self, needs_dir = False)
+        Plugin.__init__(self, needs_dir = True)
         
-        self.get_event("PMEvent").register(self.handler)
+        self.register_command("shutdown", self.shutdown)
+        self.register_command("reload", self.reload)
+        self.register_command("rehash", self.rehash)
+        self.register_command("restart", self.restart)
+        self.register_command("tracked", self.tracked)
+        self.register_command("lag", self.lag)
+        self.register_command("profile", self.profile)
         self.get_event("PluginsLoadedEvent").register(self.load_identification)
         
         self.system_event = self.get_event("SystemEvent")
+        self.sampler = None
         
     def __deinit__(self):
 
-        self.get_event("PMEvent").deregister(self.handler)
+        self.deregister_command("shutdown")
+        self.deregister_command("reload")
+        self.deregister_command("rehash")
+        self.deregister_command("restart")
+        self.deregister_command("tracked")
+        self.deregister_command("lag")
+        self.deregister_command("profile")
+        if self.sampler is not None:
+            self.sampler.stop()
         self.get_event("PluginsLoadedEvent").deregister(self.load_identification)
     
     def load_identification(self):
 
         self.identification = PluginLoader.get_instance().get_plugin('IdentificationPlugin')
 
-    def handler(self, data):
-
-        if data.message == (0, 'shutdown'):
-            assert self.identification.require_level(data, 2)
-            data.origin.message('Preparing for shutdown...')
-            # System event code 1 -> shutdown
-            self.eventhandler.fire_once(self.system_event, (1,))
-            data.origin.message('Shutting down..')
-            Connection.get_instance().shutdown()
-        elif data.message == (0, 'reload'):
-            assert self.identification.require_level(data, 2)
-            # System event code 0 -> reload
-            self.eventhandler.fire_once(self.system_event, (0,))
-            try:
-                PluginLoader.get_instance().reload()
-            except Exception, e:
-                data.origin.message("Exception %s while reloading plugins." % (e))
-                [self.log_error("%s" % (tb)) for tb in traceback.format_exc(4).split('\n')]
-                return
-            data.origin.message('Plugins reloaded!')
-        elif data.message == (0, 'rehash'):
-            assert self.identification.require_level(data, 2)
-            # System event code 2 -> rehash
-            self.eventhandler.fire_once(self.system_event, (2,))
-            Configuration.get_instance().reload()
-            data.origin.message('Rehash completed!')
+    def shutdown(self, data):
+
+        assert self.identification.require_level(data, 2)
+        data.origin.message('Preparing for shutdown...')
+        # System event code 1 -> shutdown
+        self.eventhandler.fire_once(self.system_event, (1,))
+        data.origin.message('Shutting down..')
+        Connection.get_instance().shutdown()
+
+    def reload(self, data):
+
+        assert self.identification.require_level(data, 2)
+        # System event code 0 -> reload
+        self.eventhandler.fire_once(self.system_event, (0,))
+        try:
+            PluginLoader.get_instance().reload()
+        except Exception, e:
+            data.origin.message("Exception %s while reloading plugins." % (e))
+            [self.log_error("%s" % (tb)) for tb in traceback.format_exc(4).split('\n')]
+            return
+        data.origin.message('Plugins reloaded!')
+
+    def rehash(self, data):
+
+        assert self.identification.require_level(data, 2)
+        # System event code 2 -> rehash
+        self.eventhandler.fire_once(self.system_event, (2,))
+        Configuration.get_instance().reload()
+        UserRegistry.get_instance().set_limit(Configuration.get_instance().get_section('main').get_int('max-pm-users', 500))
+        data.origin.message('Rehash completed!')
+
+    def restart(self, data):
+
+        assert self.identification.require_level(data, 2)
+        try:
+            Connection.get_instance().restart()
+        except RestartException as e:
+            data.origin.message("Can not restart: %s" % (e.value))
+            return
+        # System event code 3 -> restart
+        self.eventhandler.fire_once(self.system_event, (3,))
+        data.origin.message('Restarting..')
+
+    def tracked(self, data):
+
+        assert self.identification.require_level(data, 2)
+        stats = UserRegistry.get_instance().get_stats()
+        data.origin.message("Tracking %d users in %d channels (%d memberships)." % (
+            stats['users'], stats['channels'], stats['memberships']))
+        data.origin.message("%d/%d users share no channel with me; %d have been forgotten." % (
+            stats['unshared'], stats['limit'], stats['evicted']))
+
+    def lag(self, data):
+
+        assert self.identification.require_level(data, 2)
+        connection = Connection.get_instance()
+        stats = connection.get_lag_meter().get_stats()
+        if stats['lag'] is None:
+            data.origin.message("Lag has not been measured yet.")
+        else:
+            data.origin.message("Lag: %.3fs" % (stats['lag']))
+        if stats['samples'] > 0:
+            data.origin.message("Last %d PINGs: min %.3fs, avg %.3fs, median %.3fs, 90%% %.3fs, max %.3fs; %d lost." % (
+                stats['samples'], stats['min'], stats['avg'], stats['p50'], stats['p90'], stats['max'], stats['lost']))
+            data.origin.message("Histogram: %s" % (', '.join(
+                "%s: %d" % ("<= %dms" % (bound) if bound is not None else "slower", count)
+                for bound, count in connection.get_lag_meter().get_histogram() if count > 0)))
+        # time spent waiting on our own side, for comparison.
+        queue = connection.get_send_queue().get_stats()
+        data.origin.message("Send queue: %d line(s) waiting; lines waited %.3fs on average, %.3fs at most." % (
+            queue['depth'], queue['avg_wait'], queue['max_wait']))
+        watchdog = connection.get_watchdog()
+        stalls = watchdog.get_stats()
+        if stalls['stalls'] > 0:
+            data.origin.message("Main loop: %d stall(s) over %dms, longest %.3fs; %s." % (
+                stalls['stalls'], stalls['threshold'], stalls['longest'], ', '.join(
+                "%s: %d" % ("<= %dms" % (bound) if bound is not None else "longer", count)
+                for bound, count in watchdog.get_histogram() if count > 0)))
+
+    def profile(self, data):
+
+        assert self.identification.require_level(data, 2)
+        if self.sampler is not None:
+            data.origin.message("A profile is already being taken.")
+            return
+        try:
+            seconds = int(data.message[1]) if len(data.message[1:]) > 0 else 10
+            assert 0 < seconds <= System.MAX_PROFILE
+        except (ValueError, AssertionError):
+            data.origin.message("Usage: profile <seconds>, at most %d." % (System.MAX_PROFILE))
+            return
+        rate = Configuration.get_instance().get_section('main').get_int('profile-rate', 100)
+        data.origin.message("Sampling every thread %d times a second for %d seconds..." % (rate, seconds))
+        self.sampler = Sampler(rate).start(seconds, lambda sampler: self.__write_profile(data, sampler))
+
+    def __write_profile(self, data, sampler):
+
+        # runs on the sampling thread; the files are written here, so the main loop does not
+        # wait for them.
+        name = self.get_path() + time.strftime("profile-%Y%m%d-%H%M%S")
+        try:
+            sampler.write_collapsed(name + ".collapsed")
+            sampler.write_pstats(name + ".pstats")
+            sampler.write_summary(name + ".txt", name + ".pstats")
+        except (IOError, OSError) as e:
+            [self.log_error(trace) for trace in traceback.format_exc(4).split('\n')]
+            name = None
+        Connection.get_instance().call_from_thread(self.__profile_done, data, sampler, name)
+
+    def __profile_done(self, data, sampler, name):
+
+        self.sampler = None
+        if name is None:
+            data.origin.message("Took %d samples, but the profile could not be written; see the log." % (sampler.samples))
+            return
+        data.origin.message("Took %d samples of %d thread(s) over %.1fs; threads were running in %d of %d stacks. Wrote %s.{collapsed,pstats,txt}" % (
+            sampler.samples, sampler.get_threads(), sampler.seconds, sampler.stacks, sampler.stacks + sampler.idle, name))
+        if not sampler.stacks:
+            data.origin.message("No thread was running while the samples were taken.")
+            return
+        # shares of the stacks of running threads; waiting threads are left out.
+        for function, own, total in sampler.get_top(10):
+            data.origin.message("%5.1f%% own, %5.1f%% total: %s" % (
+                own * 100.0 / sampler.stacks, total * 100.0 / sampler.stacks, Sampler.label(function)))
 
 __data__ = {
     'name'    : 'SystemPlugin',
@@ -110,5 +230,29 @@ __help__ = {
         DESC    : 'Reloads the configuration.',
         PARAMS  : '',
         ALIASES : []
+    },
+    'restart'  : {
+        CONTEXT : Contexts.PRIVATE,
+        DESC    : 'Restarts the bot (ie. after an upgrade) without disconnecting from the server.',
+        PARAMS  : '',
+        ALIASES : []
+    },
+    'lag'      : {
+        CONTEXT : Contexts.PRIVATE,
+        DESC    : 'Shows how long the server takes to answer, and how long lines wait to be sent.',
+        PARAMS  : '',
+        ALIASES : []
+    },
+    'profile'  : {
+        CONTEXT : Contexts.PRIVATE,
+        DESC    : 'Samples what every thread is doing for a while and shows the busiest functions.',
+        PARAMS  : '<seconds>',
+        ALIASES : []
+    },
+    'tracked'  : {
+        CONTEXT : Contexts.PRIVATE,
+        DESC    : 'Shows how many users and channels are being tracked.',
+        PARAMS  : '',
+        ALIASES : []
     }
 }
\ No newline at end of file
@@ -9,11 +9,16 @@ import os, re, logging, ashiema, urllib2, json, contextlib, traceback
 from ashiema import Plugin, Events, util
 from ashiema.util import Escapes, unescape
 from ashiema.Plugin import Plugin
+from ashiema.EventHandler import EventHandler
+from ashiema.Executor import Executor
 from contextlib import closing
 from urllib2 import urlopen, HTTPError
 
 class URLScraper(Plugin):
 
+    # seconds a page may take to answer.
+    FETCH_TIMEOUT = 10
+
     def __init__(self):
     
         Plugin.__init__(self, needs_dir = False)
@@ -39,27 +44,36 @@ class URLScraper(Plugin):
         return str(int(duration)) + "s"
         
     def handler(self, data):
-     
-        if len(self.pattern.findall(data.message.to_s())) >= 1:
-            for link in self.pattern.findall(data.message.to_s()):
-                link = link[0]
-                try:
-                    with closing(urlopen(link)) as req:
-                        if req.info().getmaintype() != 'text':
-                            return
-                        content = req.read()
-                        if len(self.title_pattern.findall(content)) >= 1:
-                            title = self.title_pattern.findall(content)[0]
-                        else:
-                            title = '"' + content[:self.alt_title_len] + '..."'
-                        try:
-                            data.target.message(self.format.replace("^t^", unescape(title)).replace("^l^", req.geturl()))
-                        except (UnicodeDecodeError) as e:
-                            data.target.message("[%sURLScraper%s] %sCould not decode title information!%s" % (Escapes.GREEN, Escapes.BLACK, Escapes.AQUA, Escapes.BLACK))
-                except (HTTPError) as e:
-                    data.target.message("[%sURLScraper%s] %sCould not fetch title information!%s [%s%s%s - %s%s%s]" % (Escapes.GREEN, Escapes.BLACK, Escapes.AQUA, Escapes.BLACK, Escapes.RED, e.code, Escapes.BLACK, Escapes.GREY, str(e.reason), Escapes.BLACK))
-                except (IOError) as e:
-                    data.target.message("[%sURLScraper%s] %sCould not fetch title information!%s" % (Escapes.GREEN, Escapes.BLACK, Escapes.AQUA, Escapes.BLACK))
+
+        # only fetching the titles is handed to the worker pool, and only if there are links.
+        links = [match[0] for match in self.pattern.findall(data.message.to_s())]
+        if not links:
+            return
+        # build the target here; the user and channel lists belong to the main loop.
+        data.target
+        Executor.get_instance().submit(self.fetch, (data, links), key = "URLScraper:" + EventHandler.get_reply_key(data),
+            timeout = URLScraper.FETCH_TIMEOUT * len(links) + 5)
+
+    def fetch(self, data, links):
+
+        for link in links:
+            try:
+                with closing(urlopen(link, timeout = URLScraper.FETCH_TIMEOUT)) as req:
+                    if req.info().getmaintype() != 'text':
+                        return
+                    content = req.read()
+                    if len(self.title_pattern.findall(content)) >= 1:
+                        title = self.title_pattern.findall(content)[0]
+                    else:
+                        title = '"' + content[:self.alt_title_len] + '..."'
+                    try:
+                        data.target.message(self.format.replace("^t^", unescape(title)).replace("^l^", req.geturl()))
+                    except (UnicodeDecodeError) as e:
+                        data.target.message("[%sURLScraper%s] %sCould not decode title information!%s" % (Escapes.GREEN, Escapes.BLACK, Escapes.AQUA, Escapes.BLACK))
+            except (HTTPError) as e:
+                data.target.message("[%sURLScraper%s] %sCould not fetch title information!%s [%s%s%s - %s%s%s]" % (Escapes.GREEN, Escapes.BLACK, Escapes.AQUA, Escapes.BLACK, Escapes.RED, e.code, Escapes.BLACK, Escapes.GREY, str(e.reason), Escapes.BLACK))
+            except (IOError) as e:
+                data.target.message("[%sURLScraper%s] %sCould not fetch title information!%s" % (Escapes.GREEN, Escapes.BLACK, Escapes.AQUA, Escapes.BLACK))
 
 __data__ = {
     'name'     : "URLScraper",
@@ -11,6 +11,7 @@ from ashiema.util import Escapes
 from ashiema.util import unescape
 from ashiema.util.texttable import TextTable
 from ashiema.Plugin import Plugin
+from ashiema.Executor import offload
 from ashiema.PluginLoader import PluginLoader
 from ashiema.HelpFactory import Contexts
 from ashiema.HelpFactory import CONTEXT, PARAMS, DESC, ALIASES
@@ -25,7 +26,9 @@ class UrbanDictionary(Plugin):
         
         self.cache = {}
         
-        self.get_event("MessageEvent").register(self.handler)
+        self.register_command("@ud", self.query)
+        self.register_command("@ud-cache", self.cache_info)
+        self.register_command("@ud-cache-clear", self.cache_clear)
         self.get_event("PluginsLoadedEvent").register(self._load_identification)
         
         self.__clean_cache_job = self.scheduler.create_job(
@@ -35,7 +38,9 @@ class UrbanDictionary(Plugin):
     
     def __deinit__(self):
     
-        self.get_event("MessageEvent").deregister(self.handler)
+        self.deregister_command("@ud")
+        self.deregister_command("@ud-cache")
+        self.deregister_command("@ud-cache-clear")
         self.get_event("PluginsLoadedEvent").deregister(self._load_identification)
 
         self.scheduler.remove_job(self.__clean_cache_job)
@@ -48,24 +53,26 @@ class UrbanDictionary(Plugin):
     
         self.cache.clear()
     
-    def handler(self, data):
+    @offload
+    def query(self, data):
     
-        if data.message == (0, "@ud") or data.message == (0, "urbandictionary"):
-            try:
-                term = " ".join(data.message[1:])
-            except (IndexError):
-                data.target.message("%s[UrbanDictionary]: %sPlease provide a term to search for." % (Escapes.AQUA, Escapes.BOLD))
-                return
-            self.beginQuery(data, term)
-        elif data.message == (0, "@ud-cache") or data.message == (0, "urbandictionary-cache"):
-            assert self.identification.require_level(data, 1)
-            data.target.message("%s[UrbanDictionary]: %s objects cached." % (Escapes.AQUA, len(self.cache)))
-            return
-        elif data.message == (0, "@ud-cache-clear") or data.message == (0, "urbandictionary-cacheclear"):
-            assert self.identification.require_level(data, 1)
-            self.clean_cache()
-            data.target.message("%s[UrbanDictionary]: Cache forcibly cleared." % (Escapes.LIGHT_BLUE))
+        try:
+            term = " ".join(data.message[1:])
+        except (IndexError):
+            data.target.message("%s[UrbanDictionary]: %sPlease provide a term to search for." % (Escapes.AQUA, Escapes.BOLD))
             return
+        self.beginQuery(data, term)
+
+    def cache_info(self, data):
+
+        assert self.identification.require_level(data, 1)
+        data.target.message("%s[UrbanDictionary]: %s objects cached." % (Escapes.AQUA, len(self.cache)))
+
+    def cache_clear(self, data):
+
+        assert self.identification.require_level(data, 1)
+        self.clean_cache()
+        data.target.message("%s[UrbanDictionary]: Cache forcibly cleared." % (Escapes.LIGHT_BLUE))
     
     def searchUD(self, term):
         
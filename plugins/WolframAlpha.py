@@ -11,6 +11,7 @@ import xml.etree.cElementTree as xtree
 from ashiema import Plugin, Events, util
 from ashiema.util import Escapes
 from ashiema.Plugin import Plugin
+from ashiema.Executor import offload
 from ashiema.PluginLoader import PluginLoader
 from ashiema.HelpFactory import Contexts
 from ashiema.HelpFactory import CONTEXT, DESC, PARAMS, ALIASES
@@ -27,7 +28,9 @@ class WolframAlpha(Plugin):
     
         self.cache = {}
     
-        self.get_event("MessageEvent").register(self.handler)
+        self.register_command("@wa", self.query)
+        self.register_command("@wa-cache", self.cache_info)
+        self.register_command("@wa-cache-clear", self.cache_clear)
         self.get_event("PluginsLoadedEvent").register(self._load_identification)
     
         self.__clean_cache_job = self.scheduler.create_job(
@@ -37,7 +40,9 @@ class WolframAlpha(Plugin):
     
     def __deinit__(self):
         
-        self.get_event("MessageEvent").deregister(self.handler)
+        self.deregister_command("@wa")
+        self.deregister_command("@wa-cache")
+        self.deregister_command("@wa-cache-clear")
         self.get_event("PluginsLoadedEvent").deregister(self._load_identification)
 
         self.scheduler.remove_job(self.__clean_cache_job)
@@ -60,28 +65,30 @@ class WolframAlpha(Plugin):
        
         self.cache.clear()
    
-    def handler(self, data):
+    @offload
+    def query(self, data):
        
-        if data.message == (0, "@wa") or data.message == (0, "wolfram"):
-            try:
-                if len(data.message[1:]) > 1:
-                    query = " ".join(data.message[1:])
-                else:
-                    query = data.message[1]
-            except (IndexError) as e:
-                data.target.privmsg("%s[Wolfram|Alpha]: %sPlease provide a query to search." % (Escapes.LIGHT_BLUE, Escapes.BOLD))
-                return
-            data.target.privmsg("%s[Wolfram|Alpha]%s: %sSearching..." % (Escapes.BOLD, Escapes.BOLD, Escapes.LIGHT_BLUE))
-            self.beginWolframQuery(data, query)
-        elif data.message == (0, "@wa-cache") or data.message == (0, "wolfram-cache"):
-            assert self.identification.require_level(data, 1)
-            data.target.privmsg("%s[Wolfram|Cache]: %s objects cached." % (Escapes.LIGHT_BLUE, len(self.cache)))
-            return
-        elif data.message == (0, "@wa-cache-clear") or data.message == (0, "wolfram-cacheclear"):
-            assert self.identification.require_level(data, 2)
-            self.clean_cache()
-            data.target.privmsg("%s[Wolfram|Cache]: Cache forcibly cleared." % (Escapes.LIGHT_BLUE))
+        try:
+            if len(data.message[1:]) > 1:
+                query = " ".join(data.message[1:])
+            else:
+                query = data.message[1]
+        except (IndexError) as e:
+            data.target.privmsg("%s[Wolfram|Alpha]: %sPlease provide a query to search." % (Escapes.LIGHT_BLUE, Escapes.BOLD))
             return
+        data.target.privmsg("%s[Wolfram|Alpha]%s: %sSearching..." % (Escapes.BOLD, Escapes.BOLD, Escapes.LIGHT_BLUE))
+        self.beginWolframQuery(data, query)
+
+    def cache_info(self, data):
+
+        assert self.identification.require_level(data, 1)
+        data.target.privmsg("%s[Wolfram|Cache]: %s objects cached." % (Escapes.LIGHT_BLUE, len(self.cache)))
+
+    def cache_clear(self, data):
+
+        assert self.identification.require_level(data, 2)
+        self.clean_cache()
+        data.target.privmsg("%s[Wolfram|Cache]: Cache forcibly cleared." % (Escapes.LIGHT_BLUE))
    
     def search(self, query, format = ('plaintext',)):
        
@@ -9,11 +9,16 @@ import os, re, logging, ashiema, urllib2, json, contextlib
 from ashiema import Plugin, Events, util
 from ashiema.util import Escapes
 from ashiema.Plugin import Plugin
+from ashiema.EventHandler import EventHandler
+from ashiema.Executor import Executor
 from contextlib import closing
 from urllib2 import urlopen, HTTPError
 
 class YoutubeScraper(Plugin):
 
+    # seconds the API may take to answer.
+    FETCH_TIMEOUT = 10
+
     def __init__(self):
     
         Plugin.__init__(self, needs_dir = False)
@@ -77,17 +82,29 @@ class YoutubeScraper(Plugin):
         return timestr
         
     def handler(self, data):
-     
-        if len(self.pattern.findall(data.message.to_s())) >= 1:
-            for vid in self.pattern.findall(data.message.to_s())[0]:
-                if vid == '' or vid is None: continue
-                try:
-                    with closing(urlopen(self.apiurl % (vid))) as req:
-                        info = json.loads(req.read(), encoding = 'utf-8')
-                        timestr = self.get_strtime(int(info['data']['duration']))
-                        data.target.message(self.format.replace("&t", info['data']['title']).replace("&a", info['data']['uploader']).replace("&d", timestr))
-                except (HTTPError, IOError) as e:
-                    data.target.message("[%sYou%sTube%s] Invalid video link!" % (Escapes.YELLOW, Escapes.RED, Escapes.BLACK))
+
+        # only the API lookups are handed to the worker pool, and only if there are links.
+        matches = self.pattern.findall(data.message.to_s())
+        if not matches:
+            return
+        videos = [vid for vid in matches[0] if vid]
+        if not videos:
+            return
+        # build the target here; the user and channel lists belong to the main loop.
+        data.target
+        Executor.get_instance().submit(self.fetch, (data, videos), key = "YoutubeScraper:" + EventHandler.get_reply_key(data),
+            timeout = YoutubeScraper.FETCH_TIMEOUT * len(videos) + 5)
+
+    def fetch(self, data, videos):
+
+        for vid in videos:
+            try:
+                with closing(urlopen(self.apiurl % (vid), timeout = YoutubeScraper.FETCH_TIMEOUT)) as req:
+                    info = json.loads(req.read(), encoding = 'utf-8')
+                    timestr = self.get_strtime(int(info['data']['duration']))
+                    data.target.message(self.format.replace("&t", info['data']['title']).replace("&a", info['data']['uploader']).replace("&d", timestr))
+            except (HTTPError, IOError) as e:
+                data.target.message("[%sYou%sTube%s] Invalid video link!" % (Escapes.YELLOW, Escapes.RED, Escapes.BLACK))
 
 
 __data__ = {
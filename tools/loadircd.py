@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+""" a stand-in IRC server for load testing the bot without a live network.
+
+    usage: python ./loadircd.py [options]
+
+    point the bot at it (address = 127.0.0.1, port = 6667, ssl = False) and start it. the
+    server handles registration, CAP, PING, JOIN, NAMES, WHO and WHOIS, puts the bot in
+    --channels channels shared with --users simulated users, and has those users talk at
+    --rate lines per second. every --probe-interval seconds a user sends --command and the
+    time until the bot answers (any PRIVMSG or NOTICE to that user or channel) is recorded.
+    after --duration seconds the server closes the link and prints a report of the answer
+    latency percentiles and of how the bot paced what it sent. """
+
+import sys, socket, threading, time, random, argparse
+
+SERVER = 'load.ircd'
+CAPABILITIES = ['account-notify', 'multi-prefix', 'userhost-in-names']
+WORDS = ('the quick brown fox jumps over lazy dog lorem ipsum dolor sit amet irc bot load test '
+         'hello world what is going on here today again later maybe never').split()
+
+def percentile(values, fraction):
+
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+class Client(object):
+    """ the connection to the bot under test. """
+
+    def __init__(self, sock, options):
+
+        self.sock = sock
+        self.options = options
+        self.lock = threading.Lock()
+        self.rand = random.Random(options.seed)
+
+        self.nick = None
+        self.registered = threading.Event()
+        self.closed = False
+
+        self.users = ["user%04d" % (i) for i in xrange(options.users)]
+        # channel -> members, not counting the bot.
+        self.channels = {}
+        for i in xrange(options.channels):
+            name = "#load%d" % (i)
+            self.channels[name] = [user for n, user in enumerate(self.users) if n % options.channels == i] + ['prober']
+        self.joined = set()
+
+        self.received = []      # (time, line) for every line the bot sent.
+        self.sent = 0
+        self.probe = None       # (time sent, channel) of the probe waiting for an answer.
+        self.latencies = []
+        self.probes, self.timeouts = 0, 0
+
+    def send(self, *lines):
+
+        data = ''.join(line + '\r\n' for line in lines)
+        with self.lock:
+            if self.closed:
+                return
+            try: self.sock.sendall(data)
+            except socket.error:
+                self.closed = True
+                return
+            self.sent += len(lines)
+
+    def numeric(self, numeric, text):
+
+        self.send(":%s %03d %s %s" % (SERVER, numeric, self.nick or '*', text))
+
+    def mask(self, nick):
+
+        return "%s!%s@%s.users.load" % (nick, nick[:10], nick)
+
+    def read(self):
+
+        buf = ''
+        while not self.closed:
+            try: data = self.sock.recv(4096)
+            except socket.error:
+                break
+            if not data:
+                break
+            buf += data
+            while '\n' in buf:
+                line, buf = buf.split('\n', 1)
+                line = line.rstrip('\r')
+                if line:
+                    self.handle(time.time(), line)
+        self.closed = True
+
+    def handle(self, now, line):
+
+        self.received.append((now, line))
+
+        if line.startswith(':'):
+            line = line.split(' ', 1)[1] if ' ' in line else ''
+        head, sep, trailing = line.partition(' :')
+        params = head.split()
+        if sep:
+            params.append(trailing)
+        if not params:
+            return
+        command, params = params[0].upper(), params[1:]
+
+        handler = getattr(self, 'on_' + command, None)
+        if handler is not None:
+            handler(params)
+        if command in ('PRIVMSG', 'NOTICE'):
+            self.check_probe(now, params)
+
+    def on_NICK(self, params):
+
+        old, self.nick = self.nick, params[0]
+        if old is not None and self.registered.is_set():
+            self.send(":%s NICK :%s" % (self.mask(old), self.nick))
+
+    def on_USER(self, params):
+
+        self.numeric(1, ":Welcome to the load test network %s" % (self.nick))
+        self.numeric(2, ":Your host is %s" % (SERVER))
+        self.numeric(3, ":This server was created just now")
+        self.numeric(4, "%s loadircd-1.0 iow bIklmnopstv" % (SERVER))
+        self.numeric(5, "CHANTYPES=# PREFIX=(ov)@+ CHANMODES=b,k,l,imnpst CASEMAPPING=rfc1459 "
+                        "NETWORK=Load TARGMAX=PRIVMSG:4,NOTICE:4 WHOX :are supported by this server")
+        self.numeric(375, ":- %s Message of the day -" % (SERVER))
+        self.numeric(372, ":- this server is not real.")
+        self.numeric(376, ":End of /MOTD command.")
+        self.registered.set()
+        # put the bot in every simulated channel, the way services would.
+        for channel in sorted(self.channels):
+            self.join(channel)
+
+    def on_CAP(self, params):
+
+        subcommand = params[0].upper() if params else ''
+        if subcommand == 'LS':
+            self.send(":%s CAP * LS :%s" % (SERVER, ' '.join(CAPABILITIES)))
+        elif subcommand == 'REQ':
+            requested = params[1].split()
+            if all(capability in CAPABILITIES for capability in requested):
+                self.send(":%s CAP * ACK :%s" % (SERVER, ' '.join(requested)))
+            else:
+                self.send(":%s CAP * NAK :%s" % (SERVER, ' '.join(requested)))
+
+    def on_PING(self, params):
+
+        self.send(":%s PONG %s :%s" % (SERVER, SERVER, params[-1] if params else ''))
+
+    def on_JOIN(self, params):
+
+        for channel in params[0].split(','):
+            self.join(channel)
+
+    def join(self, channel):
+
+        if channel.lower() in self.joined:
+            return
+        self.channels.setdefault(channel.lower(), ['prober'])
+        self.joined.add(channel.lower())
+        self.send(":%s JOIN %s" % (self.mask(self.nick), channel))
+        self.names(channel)
+
+    def on_PART(self, params):
+
+        for channel in params[0].split(','):
+            self.joined.discard(channel.lower())
+            self.send(":%s PART %s" % (self.mask(self.nick), channel))
+
+    def names(self, channel):
+
+        members = ['@' + self.nick] + ['+prober'] + [user for user in self.channels[channel.lower()] if user != 'prober']
+        for start in xrange(0, len(members), 40):
+            self.numeric(353, "= %s :%s" % (channel, ' '.join(members[start:start + 40])))
+        self.numeric(366, "%s :End of /NAMES list." % (channel))
+
+    def on_NAMES(self, params):
+
+        for channel in params[0].split(','):
+            if channel.lower() in self.channels:
+                self.names(channel)
+
+    def on_WHO(self, params):
+
+        channel = params[0]
+        members = [self.nick] + self.channels.get(channel.lower(), [])
+        whox = params[1] if len(params) > 1 and params[1].startswith('%') else None
+        token = whox.split(',')[1] if whox and ',' in whox else '0'
+        for member in members:
+            ident, host = member[:10], "%s.users.load" % (member)
+            if whox:
+                self.numeric(354, "%s %s %s %s %s H 0 :%s" % (token, channel, ident, host, member, member))
+            else:
+                self.numeric(352, "%s %s %s %s %s H :0 %s" % (channel, ident, host, SERVER, member, member))
+        self.numeric(315, "%s :End of /WHO list." % (channel))
+
+    def on_WHOIS(self, params):
+
+        nick = params[-1]
+        self.numeric(311, "%s %s %s.users.load * :%s" % (nick, nick[:10], nick, nick))
+        self.numeric(318, "%s :End of /WHOIS list." % (nick))
+
+    def on_QUIT(self, params):
+
+        self.closed = True
+
+    def check_probe(self, now, params):
+
+        probe = self.probe
+        if probe is None or not params:
+            return
+        if params[0].lower() in (probe[1].lower(), 'prober'):
+            self.latencies.append(now - probe[0])
+            self.probe = None
+
+    def chat(self, count):
+
+        channels = [channel for channel in self.channels if channel in self.joined]
+        if not channels:
+            return
+        lines = []
+        for n in xrange(count):
+            channel = self.rand.choice(channels)
+            user = self.rand.choice(self.channels[channel])
+            if user == 'prober':
+                continue
+            text = ' '.join(self.rand.choice(WORDS) for w in xrange(self.rand.randint(2, 15)))
+            lines.append(":%s PRIVMSG %s :%s" % (self.mask(user), channel, text))
+        if lines:
+            self.send(*lines)
+
+    def send_probe(self, now):
+
+        if self.probe is not None:
+            if now - self.probe[0] < self.options.probe_timeout:
+                return
+            self.timeouts += 1
+        channels = [channel for channel in self.channels if channel in self.joined]
+        if not channels:
+            return
+        channel = self.rand.choice(channels)
+        self.probe = (time.time(), channel)
+        self.probes += 1
+        self.send(":%s PRIVMSG %s :%s" % (self.mask('prober'), channel, self.options.command))
+
+    def run(self):
+
+        reader = threading.Thread(target = self.read)
+        reader.daemon = True
+        reader.start()
+
+        self.send(":%s NOTICE * :*** Looking up your hostname..." % (SERVER))
+        if not self.registered.wait(30):
+            print >> sys.stderr, "the bot did not register within 30 seconds."
+            self.closed = True
+            try: self.sock.close()
+            except socket.error: pass
+            return False
+
+        # give the bot time to join and sync before the clock starts.
+        time.sleep(self.options.warmup)
+        self.started = start = time.time()
+        next_probe = start
+        owed = 0.0
+        last = start
+        while not self.closed:
+            now = time.time()
+            if now - start >= self.options.duration:
+                break
+            owed += (now - last) * self.options.rate
+            last = now
+            if owed >= 1:
+                self.chat(int(owed))
+                owed -= int(owed)
+            if now >= next_probe:
+                self.send_probe(now)
+                next_probe = now + self.options.probe_interval
+            time.sleep(0.01)
+        self.finished = time.time()
+
+        if self.probe is not None:
+            time.sleep(min(self.options.probe_timeout, 5))
+            if self.probe is not None:
+                self.timeouts += 1
+        self.send("ERROR :Closing link (load test finished)")
+        time.sleep(0.2)
+        self.closed = True
+        try: self.sock.close()
+        except socket.error: pass
+
+        return True
+
+    def report(self):
+
+        print "ran for %.1fs: %d users in %d channels, %d lines sent to the bot." % (
+            self.finished - self.started, len(self.users), len(self.joined), self.sent)
+
+        latencies = [latency * 1000 for latency in self.latencies]
+        print "command %r: %d sent, %d answered, %d unanswered after %.1fs." % (
+            self.options.command, self.probes, len(latencies), self.timeouts, self.options.probe_timeout)
+        if latencies:
+            print "answer latency (ms): min %.1f, p50 %.1f, p90 %.1f, p99 %.1f, max %.1f" % (
+                min(latencies), percentile(latencies, 0.5), percentile(latencies, 0.9), percentile(latencies, 0.99), max(latencies))
+
+        # pacing: only what the bot sent while the load was running.
+        stamps = [stamp for stamp, line in self.received if self.started <= stamp <= self.finished]
+        if len(stamps) < 2:
+            print "the bot sent %d line(s) under load." % (len(stamps))
+            return
+        gaps = [(later - earlier) * 1000 for earlier, later in zip(stamps, stamps[1:])]
+        busiest, first = 0, 0
+        for last in xrange(len(stamps)):
+            while stamps[last] - stamps[first] >= 1.0:
+                first += 1
+            busiest = max(busiest, last - first + 1)
+        print "the bot sent %d lines under load: %.2f lines/sec on average, at most %d in any second." % (
+            len(stamps), len(stamps) / (self.finished - self.started), busiest)
+        print "gap between lines (ms): p10 %.1f, p50 %.1f, p90 %.1f, max %.1f" % (
+            percentile(gaps, 0.1), percentile(gaps, 0.5), percentile(gaps, 0.9), max(gaps))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = "stand-in IRC server and load generator for ashiema.")
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 6667)
+    parser.add_argument('--users', type = int, default = 200, help = "number of simulated users")
+    parser.add_argument('--channels', type = int, default = 5, help = "number of simulated channels")
+    parser.add_argument('--rate', type = float, default = 20.0, help = "channel lines per second, in total")
+    parser.add_argument('--command', default = '@stats', help = "command whose answer is timed")
+    parser.add_argument('--probe-interval', type = float, default = 2.0, help = "seconds between two commands")
+    parser.add_argument('--probe-timeout', type = float, default = 30.0, help = "seconds to wait for an answer")
+    parser.add_argument('--duration', type = float, default = 60.0, help = "seconds to run the load for")
+    parser.add_argument('--warmup', type = float, default = 3.0, help = "seconds to wait after registration")
+    parser.add_argument('--seed', type = int, default = 1337)
+    options = parser.parse_args()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((options.host, options.port))
+    server.listen(1)
+    print "listening on %s:%d; waiting for the bot to connect." % (options.host, options.port)
+
+    sock, address = server.accept()
+    server.close()
+
+    client = Client(sock, options)
+    if not client.run():
+        sys.exit(1)
+    client.report()
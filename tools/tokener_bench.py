@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+# ashiema: a lightweight, modular IRC bot written in python.
+# Copyright (C) 2013 Shaun Johnson <pirogoeth@maio.me>
+#
+# An extended version of the license is included with this software in `ashiema.py`.
+
+""" measures how many lines per second the Tokener can process.
+
+    usage: python ./tokener_bench.py [traffic file|-] [passes]
+
+    the traffic file holds one raw IRC line per line. if no file (or -) is given, a
+    synthetic sample of busy channel traffic is generated. each pass is timed twice: once only
+    tokenizing (what every line costs), and once also reading origin, target and message
+    (what a line that some event inspects costs). """
+
+import os, sys, time, random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from ashiema.Connection import Connection, Tokener
+
+def synthetic_sample(count = 20000, users = 2000, seed = 1337):
+
+    rand = random.Random(seed)
+    nicks = ["user%04d" % (i) for i in xrange(users)]
+    channels = ["#chan%d" % (i) for i in xrange(20)]
+    lines = []
+
+    for i in xrange(count):
+        nick = rand.choice(nicks)
+        mask = "%s!~%s@host-%d.example.net" % (nick, nick, nicks.index(nick) % 500)
+        roll = rand.random()
+        if roll < 0.70:
+            lines.append(":%s PRIVMSG %s :%s" % (mask, rand.choice(channels), " ".join(rand.choice(nicks) for n in xrange(rand.randint(1, 12)))))
+        elif roll < 0.78:
+            lines.append(":%s JOIN %s" % (mask, rand.choice(channels)))
+        elif roll < 0.84:
+            lines.append(":%s PART %s :bye" % (mask, rand.choice(channels)))
+        elif roll < 0.88:
+            lines.append(":%s QUIT :Quit: leaving" % (mask))
+        elif roll < 0.94:
+            lines.append(":irc.example.net 353 bench = %s :%s" % (rand.choice(channels), " ".join(rand.choice(nicks) for n in xrange(30))))
+        elif roll < 0.97:
+            lines.append("PING :irc.example.net")
+        else:
+            lines.append(":%s NOTICE bench :hello" % (mask))
+
+    return lines
+
+def run_pass(lines, inspect):
+
+    start = time.time()
+    for line in lines:
+        data = Tokener(line)
+        if inspect:
+            data.origin, data.target, data.message
+    return len(lines) / (time.time() - start)
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1] != '-':
+        with open(sys.argv[1], 'r') as traffic:
+            lines = [line.rstrip('\r\n') for line in traffic if line.strip()]
+    else:
+        lines = synthetic_sample()
+
+    passes = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    Connection().setup_info(nick = 'bench', ident = 'bench', real = 'bench')
+
+    for mode, inspect in (('tokenize', False), ('tokenize + inspect', True)):
+        results = [run_pass(lines, inspect) for n in xrange(passes)]
+        print "%-20s %10.0f lines/sec (best of %d passes over %d lines)" % (mode, max(results), passes, len(lines))